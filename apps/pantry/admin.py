@@ -1,4 +1,5 @@
 from django.contrib import admin
+from .contents import bump_pantry_version_on_commit
 from .models import UserPantry
 
 @admin.register(UserPantry)
@@ -7,3 +8,18 @@ class UserPantryAdmin(admin.ModelAdmin):
     list_filter = ('user', 'ingredient')
     search_fields = ('user__username', 'ingredient__name')
     ordering = ('-added_at',)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Related ingredients are saved by now
+        bump_pantry_version_on_commit(form.instance.user_id)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        bump_pantry_version_on_commit(obj.user_id)
+
+    def delete_queryset(self, request, queryset):
+        user_ids = set(queryset.values_list('user_id', flat=True))
+        super().delete_queryset(request, queryset)
+        for user_id in user_ids:
+            bump_pantry_version_on_commit(user_id)
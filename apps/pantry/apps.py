@@ -5,3 +5,6 @@ class PantryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.pantry'
     verbose_name = 'Pantry Management'
+
+    def ready(self):
+        from . import checks  # noqa: F401
@@ -0,0 +1,27 @@
+"""
+Deployment checks of the pantry cache.
+
+Pantry versions are bumped by the process handling the edit and read by
+every other one, so they only work with a cache shared by the processes.
+"""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Backends whose entries never leave the process that wrote them
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in PROCESS_LOCAL_CACHES:
+        return [Warning(
+            f'The default cache ({backend}) is not shared between processes.',
+            hint='Pantry, search and carousel invalidations would only reach the process making them; '
+                 'set REDIS_URL or use the database cache.',
+            id='pantry.W001',
+        )]
+    return []
@@ -0,0 +1,70 @@
+"""
+What a user has at hand.
+
+The expanded pantry (pantry items and their related ingredients) is read
+by the recipe pages on every view, so it is cached per user. Each user has
+a version stamp that the views changing the pantry bump; cached sets are
+keyed by it, so a bump makes the old set unreachable and it expires on its
+own. Stamps must be seen by every worker process, so this relies on the
+shared cache configured in the settings (``check --deploy`` warns about a
+per-process one).
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import UserPantry
+
+PANTRY_VERSION_KEY = 'pantry:{user_id}:version'
+PANTRY_IDS_KEY = 'pantry:{user_id}:ids:{version}'
+PANTRY_CACHE_TIMEOUT = 3600
+
+
+def pantry_version(user_id):
+    """Return the version stamp of a user's pantry."""
+    key = PANTRY_VERSION_KEY.format(user_id=user_id)
+    version = cache.get(key)
+    if version is None:
+        # Restart from the clock so an evicted stamp never comes back to an
+        # older, still cached version
+        cache.add(key, int(time.time()), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_pantry_version(user_id):
+    """Invalidate the cached pantry of a user."""
+    key = PANTRY_VERSION_KEY.format(user_id=user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, int(time.time()), timeout=None)
+
+
+def bump_pantry_version_on_commit(user_id):
+    """Bump the version once the current transaction commits (immediately outside one)."""
+    transaction.on_commit(lambda: bump_pantry_version(user_id))
+
+
+def pantry_ingredient_ids(user):
+    """
+    Return the ids of the ingredients ``user`` has, including the related
+    ingredients of their pantry items (one query when not cached).
+
+    Returns:
+        frozenset
+    """
+    key = PANTRY_IDS_KEY.format(user_id=user.pk, version=pantry_version(user.pk))
+    ids = cache.get(key)
+    if ids is None:
+        ids = set()
+        for ingredient_id, related_id in UserPantry.objects.filter(user=user).values_list(
+            'ingredient_id', 'related_ingredients'
+        ):
+            ids.add(ingredient_id)
+            if related_id is not None:
+                ids.add(related_id)
+        ids = frozenset(ids)
+        cache.set(key, ids, PANTRY_CACHE_TIMEOUT)
+    return ids
@@ -1,3 +1,25 @@
-from django.test import TestCase
+from django.core.cache import caches
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from .checks import check_shared_cache
+from .contents import bump_pantry_version, pantry_version
+
+LOCAL_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+DATABASE_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'savory_cache'}}
+
+
+class SharedCacheTests(TestCase):
+    @override_settings(CACHES=DATABASE_CACHES)
+    def test_pantry_versions_are_shared_between_processes(self):
+        version = pantry_version(1)
+        # Another process has its own cache connection to the same table
+        other = caches.create_connection('default')
+        other.incr('pantry:1:version')
+        self.assertEqual(pantry_version(1), version + 1)
+        bump_pantry_version(1)
+        self.assertEqual(other.get('pantry:1:version'), version + 2)
+        self.assertEqual(check_shared_cache(None), [])
+
+    @override_settings(CACHES=LOCAL_CACHES)
+    def test_process_local_cache_is_reported(self):
+        self.assertEqual([warning.id for warning in check_shared_cache(None)], ['pantry.W001'])
@@ -4,8 +4,10 @@ from django.contrib import messages
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
+from .contents import bump_pantry_version_on_commit
 from .models import Ingredient, UserPantry
 from .forms import IngredientForm
+from apps.recipes.search.suggest import suggest_ingredients
 import urllib.parse
 from django.db import transaction
 from django.db.utils import OperationalError
@@ -30,13 +32,11 @@ def search_ingredients(request):
     # Decode the query to handle special characters
     query = urllib.parse.unquote(query)
     
-    ingredients = Ingredient.objects.filter(name__icontains=query)
-    if exclude_id:
-        ingredients = ingredients.exclude(id=exclude_id)
-    ingredients = ingredients[:10]
+    exclude_ids = [int(exclude_id)] if exclude_id and exclude_id.isdigit() else []
+    ingredients = suggest_ingredients(query, exclude_ids=exclude_ids)
     
     return JsonResponse({
-        'ingredients': [{'id': i.id, 'name': i.name} for i in ingredients]
+        'ingredients': [{'id': ingredient_id, 'name': name} for ingredient_id, name in ingredients]
     })
 
 @login_required
@@ -75,6 +75,7 @@ def save_related_ingredients(request, ingredient_id):
                     # Convert string IDs to integers
                     related_ingredient_ids = [int(id) for id in related_ingredient_ids]
                     pantry_item.related_ingredients.set(related_ingredient_ids)
+                    bump_pantry_version_on_commit(request.user.pk)
                 return JsonResponse({'status': 'success'})
             except OperationalError as e:
                 if 'database is locked' in str(e) and attempt < max_retries - 1:
@@ -92,14 +93,18 @@ def save_related_ingredients(request, ingredient_id):
 @login_required
 def add_to_pantry(request, ingredient_id):
     ingredient = get_object_or_404(Ingredient, id=ingredient_id)
-    UserPantry.objects.get_or_create(user=request.user, ingredient=ingredient)
+    _, created = UserPantry.objects.get_or_create(user=request.user, ingredient=ingredient)
+    if created:
+        bump_pantry_version_on_commit(request.user.pk)
     messages.success(request, f'Added {ingredient.name} to your pantry')
     return redirect('pantry:pantry_list')
 
 @login_required
 def remove_from_pantry(request, ingredient_id):
     ingredient = get_object_or_404(Ingredient, id=ingredient_id)
-    UserPantry.objects.filter(user=request.user, ingredient=ingredient).delete()
+    deleted, _ = UserPantry.objects.filter(user=request.user, ingredient=ingredient).delete()
+    if deleted:
+        bump_pantry_version_on_commit(request.user.pk)
     messages.success(request, f'Removed {ingredient.name} from your pantry')
     return redirect('pantry:pantry_list')
 
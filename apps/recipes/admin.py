@@ -4,13 +4,18 @@ from django.urls import path, reverse
 from django.shortcuts import render
 from django.db import models
 from django.db.models import Q
+from django.db import transaction
+from .carousel import bump_carousel_version_on_commit
+from .coverage import record_recipe_changes_on_commit
 from .models import Recipe, RecipeStep, Ingredient, RecipeIngredient, Tag, RecipeTag, RecipeImage, CarouselItem
+from .search.index import index_recipes
+from .search.result_cache import bump_catalog_generation_on_commit
 
 class RecipeImageInline(admin.TabularInline):
     model = RecipeImage
     extra = 1
-    fields = ('url', 'order', 'preview')
-    readonly_fields = ('preview',)
+    fields = ('url', 'order', 'status', 'last_checked', 'preview')
+    readonly_fields = ('status', 'last_checked', 'preview')
     
     def preview(self, obj):
         if obj.url:
@@ -93,6 +98,24 @@ class RecipeAdmin(admin.ModelAdmin):
         }),
     )
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Inlines are saved by now, so the recipe can be indexed with its ingredients and tags
+        recipe_pk = form.instance.pk
+        transaction.on_commit(lambda: index_recipes([recipe_pk]))
+
+    def delete_model(self, request, obj):
+        recipe_pk = obj.pk
+        super().delete_model(request, obj)
+        bump_catalog_generation_on_commit()
+        record_recipe_changes_on_commit([recipe_pk])
+
+    def delete_queryset(self, request, queryset):
+        recipe_pks = list(queryset.values_list('pk', flat=True))
+        super().delete_queryset(request, queryset)
+        bump_catalog_generation_on_commit()
+        record_recipe_changes_on_commit(recipe_pks)
+
 @admin.register(RecipeImage)
 class RecipeImageAdmin(admin.ModelAdmin):
     list_display = ('recipe', 'url', 'order', 'preview', 'created_at')
@@ -114,6 +137,19 @@ class RecipeImageAdmin(admin.ModelAdmin):
         return "No image"
     preview.short_description = 'Preview'
 
+    # Carousel cards hold the featured image URLs
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        bump_carousel_version_on_commit()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        bump_carousel_version_on_commit()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        bump_carousel_version_on_commit()
+
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('name', 'recipe_count', 'view_recipes_link')
@@ -218,6 +254,22 @@ class RecipeIngredientAdmin(admin.ModelAdmin):
     search_fields = ('recipe__name', 'ingredient__name', 'raw_string')
     ordering = ('recipe', 'ingredient')
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Re-index the recipe, and the one the line was moved away from
+        recipe_pks = list({obj.recipe_id, form.initial.get('recipe')} - {None})
+        transaction.on_commit(lambda: index_recipes(recipe_pks))
+
+    def delete_model(self, request, obj):
+        recipe_pk = obj.recipe_id
+        super().delete_model(request, obj)
+        transaction.on_commit(lambda: index_recipes([recipe_pk]))
+
+    def delete_queryset(self, request, queryset):
+        recipe_pks = list(queryset.values_list('recipe_id', flat=True).distinct())
+        super().delete_queryset(request, queryset)
+        transaction.on_commit(lambda: index_recipes(recipe_pks))
+
 @admin.register(RecipeTag)
 class RecipeTagAdmin(admin.ModelAdmin):
     list_display = ('recipe', 'tag')
@@ -270,6 +322,18 @@ class CarouselItemAdmin(admin.ModelAdmin):
         return "No image"
     image_preview.short_description = 'Preview'
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        bump_carousel_version_on_commit()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        bump_carousel_version_on_commit()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        bump_carousel_version_on_commit()
+
     class Media:
         js = (
             'admin/js/jquery.init.js',
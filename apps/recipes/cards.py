@@ -0,0 +1,58 @@
+"""
+Per-visitor state of recipe cards.
+
+Listings render a card per recipe with its first usable image, a heart
+when the visitor saved the recipe and, for signed-in users, how many
+ingredients are missing from their pantry. ``card_decorations`` loads all
+of it for a page of recipes with one query, whatever the page size.
+"""
+from collections import namedtuple
+
+from django.db.models import Exists, IntegerField, OuterRef, Subquery, Value
+
+from apps.pantry.contents import pantry_ingredient_ids
+
+from .models import Recipe, RecipeImage, UserRecipeCollection
+from .search.execution import missing_count
+
+# What a card shows besides the recipe itself.
+#   image_url:     URL of the first image not known to be broken, or None
+#   in_collection: whether the visitor saved the recipe
+#   missing_count: distinct ingredients missing from the visitor's pantry,
+#                  None for anonymous visitors
+CardDecoration = namedtuple('CardDecoration', ['image_url', 'in_collection', 'missing_count'])
+
+
+def card_decorations(recipe_ids, user=None):
+    """
+    Load the decorations of a page of recipe cards (one query, plus the
+    pantry of ``user`` when it is not cached).
+
+    Args:
+        recipe_ids: Recipe pks of the page.
+        user: Authenticated user, or None for an anonymous visitor.
+
+    Returns:
+        dict: {recipe pk: CardDecoration}
+    """
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return {}
+    first_image = (
+        RecipeImage.objects.filter(recipe=OuterRef('pk'))
+        .exclude(status=RecipeImage.STATUS_INACCESSIBLE)
+        .order_by('order', 'id')
+        .values('url')[:1]
+    )
+    if user is None:
+        in_collection, missing = Value(False), Value(None, output_field=IntegerField())
+    else:
+        in_collection = Exists(UserRecipeCollection.objects.filter(user=user, recipe=OuterRef('pk')))
+        missing = missing_count(user, pantry_ingredient_ids(user))
+    rows = (
+        Recipe.objects.filter(pk__in=recipe_ids)
+        .annotate(image_url=Subquery(first_image), in_collection=in_collection, missing_count=missing)
+        .order_by()
+        .values_list('pk', 'image_url', 'in_collection', 'missing_count')
+    )
+    return {pk: CardDecoration(*decoration) for pk, *decoration in rows}
@@ -0,0 +1,89 @@
+"""
+Home page carousel.
+
+The featured recipes are the same for every visitor, so the cards are built
+once (one query) and stored in the cache as plain values; rendering the
+carousel for an anonymous visitor touches no table.
+
+Cached cards are keyed by the catalog generation, bumped whenever indexed
+recipe data changes, and by a carousel version that is bumped when carousel
+items or their images change. A bump makes the old cards unreachable and
+they expire on their own.
+"""
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import CarouselItem, RecipeImage
+from .search.result_cache import catalog_generation
+
+CAROUSEL_VERSION_KEY = 'recipes:carousel:version'
+CAROUSEL_KEY = 'recipes:carousel:{generation}:{version}'
+CAROUSEL_CACHE_TIMEOUT = 3600
+
+# One slide of the carousel.
+#   id:           recipe pk
+#   recipe_id:    recipe_id used in URLs
+#   image_url:    URL of the featured image
+#   total_time:   timedelta, prep and cook time when the total is unknown
+CarouselCard = namedtuple(
+    'CarouselCard',
+    ['id', 'recipe_id', 'name', 'image_url', 'total_time', 'servings', 'aggregated_rating', 'review_count'],
+)
+
+
+def carousel_version():
+    """Return the version stamp of the carousel."""
+    version = cache.get(CAROUSEL_VERSION_KEY)
+    if version is None:
+        # Restart from the clock so an evicted stamp never comes back to an
+        # older, still cached version
+        cache.add(CAROUSEL_VERSION_KEY, int(time.time()), timeout=None)
+        version = cache.get(CAROUSEL_VERSION_KEY)
+    return version
+
+
+def bump_carousel_version():
+    """Invalidate the cached carousel."""
+    try:
+        cache.incr(CAROUSEL_VERSION_KEY)
+    except ValueError:
+        cache.add(CAROUSEL_VERSION_KEY, int(time.time()), timeout=None)
+
+
+def bump_carousel_version_on_commit():
+    """Bump the version once the current transaction commits (immediately outside one)."""
+    transaction.on_commit(bump_carousel_version)
+
+
+def build_carousel():
+    """Return the ``CarouselCard`` of every active item with a usable image, in order (one query)."""
+    rows = (
+        CarouselItem.objects.filter(active=True)
+        .exclude(image__status=RecipeImage.STATUS_INACCESSIBLE)
+        .order_by('order', 'id')
+        .values_list(
+            'recipe_id', 'recipe__recipe_id', 'recipe__name', 'image__url', 'recipe__total_time',
+            'recipe__prep_time', 'recipe__cook_time', 'recipe__servings', 'recipe__aggregated_rating',
+            'recipe__review_count',
+        )
+    )
+    cards = []
+    for pk, recipe_id, name, image_url, total_time, prep_time, cook_time, servings, rating, review_count in rows:
+        if total_time is None:
+            total_time = (prep_time or timedelta()) + (cook_time or timedelta())
+        cards.append(CarouselCard(pk, recipe_id, name, image_url, total_time, servings, rating, review_count))
+    return cards
+
+
+def carousel_cards():
+    """Return the cached carousel, building it when missing."""
+    key = CAROUSEL_KEY.format(generation=catalog_generation(), version=carousel_version())
+    cards = cache.get(key)
+    if cards is None:
+        cards = build_carousel()
+        cache.set(key, cards, CAROUSEL_CACHE_TIMEOUT)
+    return cards
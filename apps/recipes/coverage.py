@@ -0,0 +1,491 @@
+"""
+Pantry coverage of the whole catalog.
+
+How many of a recipe's distinct ingredients a user lacks cannot be indexed
+by the database: it depends on the user's pantry. Every worker therefore
+holds the catalog's recipe → ingredients relation in memory as bitmaps,
+together with the columns the search page sorts and facets on.
+
+Each ingredient is given a bit position, the most used ingredients first.
+A recipe's ingredient set is split like a roaring bitmap:
+
+* the first ``head_words`` × 64 bits (the common ingredients, which make
+  up most ingredient lines) are packed into a dense ``uint64`` row,
+* the remaining bits are kept as a sorted array of positions per recipe.
+
+Given the user's pantry as a bitmap, the missing count of every recipe is
+``popcount(head & ~pantry)`` plus its tail bits absent from the pantry, a
+few vectorized passes over the catalog. Filtering on "missing ≤ k",
+faceting and sorting then never touch the database.
+
+``build_coverage_index`` publishes the index to a file that workers load
+at startup (they build it from the database when there is none). Recipes
+whose ingredients change afterwards are recorded in the ``CoverageChange``
+table, which every worker reads, and workers patch just those recipes into
+their copy. The index remembers the id of the last change it includes (its
+sequence); rows up to the sequence of a published file are pruned when the
+next file is built.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from datetime import timedelta
+from itertools import chain
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .db import LOOKUP_CHUNK_SIZE
+from .models import CoverageChange, Recipe, RecipeIngredient
+from .search.memory import current_index_path, publish_index
+
+logger = logging.getLogger(__name__)
+
+# Dense words per recipe: the 256 most used ingredients
+HEAD_WORDS = 4
+# Rows fetched per round trip while loading
+LOAD_CHUNK_SIZE = 10000
+
+# Beyond this many change rows, rebuilding beats patching
+MAX_PATCHED_RECIPES = 20000
+# Changes this recent are read again on every refresh: an insert that took
+# a lower id may commit after one with a higher id has been seen
+CHANGE_SETTLE_SECONDS = 10
+
+GENERATION_RE = re.compile(r'coverage-(\d+)\.npz')
+
+if hasattr(np, 'bitwise_count'):
+    def _popcount_rows(words):
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int64)
+else:
+    _M1, _M2, _M4, _H01 = (np.uint64(mask) for mask in (
+        0x5555555555555555, 0x3333333333333333, 0x0F0F0F0F0F0F0F0F, 0x0101010101010101
+    ))
+
+    def _popcount_rows(words):
+        # Bit-parallel popcount of every word (SWAR), in place on a copy
+        x = words.copy()
+        t = x >> np.uint64(1)
+        t &= _M1
+        x -= t
+        t = x >> np.uint64(2)
+        t &= _M2
+        x &= _M2
+        x += t
+        t = x >> np.uint64(4)
+        x += t
+        x &= _M4
+        x *= _H01
+        x >>= np.uint64(56)
+        x = x.view(np.int64)
+        counts = x[:, 0].copy()
+        for word in range(1, x.shape[1]):
+            counts += x[:, word]
+        return counts
+
+
+def _set_bits(words, rows, bits):
+    """Set ``bits`` (< 64 × words per row) in the given ``rows`` of ``words``."""
+    np.bitwise_or.at(words, (rows, bits >> 6), np.left_shift(np.uint64(1), (bits & 63).astype(np.uint64)))
+
+
+class CoverageIndex:
+    """
+    In-memory recipe → ingredients bitmaps.
+
+    Recipes are held by ascending id; position ``i`` of every per-recipe
+    array describes recipe ``pks[i]``.
+
+    Attributes:
+        pks: int64 recipe ids.
+        categories: int32 codes into ``category_names``.
+        total_time: float64 seconds, NaN when unknown.
+        rating: float64 ``aggregated_rating``.
+        created_at: float64 POSIX timestamps.
+        bit_ingredients: int64 ingredient id of every bit position.
+        head: uint64[recipes, head_words] bitmaps of the first bits.
+        tail_indptr: int64 offsets; the other bits of recipe ``i`` are
+            ``tail_bits[tail_indptr[i]:tail_indptr[i + 1]]``.
+        tail_bits: int32 bit positions, ascending per recipe.
+        sequence: Change log sequence the index is up to date with.
+    """
+
+    COLUMNS = ('pks', 'categories', 'total_time', 'rating', 'created_at')
+
+    def __init__(self, pks, categories, category_names, total_time, rating, created_at,
+                 bit_ingredients, head, tail_indptr, tail_bits, sequence=None):
+        self.pks = pks
+        self.categories = categories
+        self.category_names = list(category_names)
+        self.total_time = total_time
+        self.rating = rating
+        self.created_at = created_at
+        self.bit_ingredients = bit_ingredients
+        self.head = head
+        self.tail_indptr = tail_indptr
+        self.tail_bits = tail_bits
+        self.sequence = sequence
+
+        self.tail_sizes = np.diff(tail_indptr)
+        self.tail_owners = np.repeat(np.arange(len(pks), dtype=np.int32), self.tail_sizes)
+        self.sizes = _popcount_rows(head) + self.tail_sizes
+        self.bits_of = np.full(int(bit_ingredients.max(initial=-1)) + 1, -1, dtype=np.int64)
+        self.bits_of[bit_ingredients] = np.arange(len(bit_ingredients))
+
+    def __len__(self):
+        return len(self.pks)
+
+    @property
+    def head_bits(self):
+        return self.head.shape[1] * 64
+
+    @classmethod
+    def build(cls, head_words=HEAD_WORDS):
+        """Load the catalog (two queries)."""
+        sequence = change_sequence()
+        columns, category_names = _load_recipes(Recipe.objects.all())
+        pairs = _load_pairs(RecipeIngredient.objects.all())
+        owners, ingredient_ids = _owned_pairs(columns['pks'], pairs)
+
+        # Most used ingredients first, so they land in the dense head
+        used, uses = np.unique(ingredient_ids, return_counts=True)
+        bit_ingredients = used[np.lexsort((used, -uses))]
+        return cls._assemble(columns, category_names, bit_ingredients, owners, ingredient_ids, head_words, sequence)
+
+    @classmethod
+    def _assemble(cls, columns, category_names, bit_ingredients, owners, ingredient_ids, head_words, sequence,
+                  head=None):
+        """
+        Encode ``(recipe position, ingredient id)`` pairs as bitmaps, on top
+        of ``head`` when given.
+        """
+        n = len(columns['pks'])
+        bits_of = np.full(int(bit_ingredients.max(initial=-1)) + 1, -1, dtype=np.int64)
+        bits_of[bit_ingredients] = np.arange(len(bit_ingredients))
+        bits = bits_of[ingredient_ids]
+
+        if head is None:
+            head = np.zeros((n, head_words), dtype=np.uint64)
+        in_head = bits < head_words * 64
+        _set_bits(head, owners[in_head], bits[in_head])
+
+        # Grouping (position, bit) keys orders each recipe's tail
+        keys = np.unique((owners[~in_head] << 32) | bits[~in_head])
+        tail_indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys >> 32, minlength=n), out=tail_indptr[1:])
+        return cls(
+            columns['pks'], columns['categories'], category_names, columns['total_time'], columns['rating'],
+            columns['created_at'], bit_ingredients, head, tail_indptr, (keys & 0xFFFFFFFF).astype(np.int32),
+            sequence,
+        )
+
+    def patched(self, recipe_pks, sequence):
+        """
+        Return a copy with ``recipe_pks`` reloaded from the database (two
+        queries per ``LOOKUP_CHUNK_SIZE`` recipes); recipes that no longer
+        exist are dropped.
+        """
+        recipe_pks = np.unique(np.asarray(list(recipe_pks), dtype=np.int64))
+        kept = np.ones(len(self), dtype=bool)
+        kept[self.positions(recipe_pks)[0]] = False
+        kept_positions = np.flatnonzero(kept)
+
+        loaded, pairs, category_names = [], [], list(self.category_names)
+        for start in range(0, len(recipe_pks), LOOKUP_CHUNK_SIZE):
+            chunk = recipe_pks[start:start + LOOKUP_CHUNK_SIZE].tolist()
+            columns, names = _load_recipes(Recipe.objects.filter(id__in=chunk))
+            # Category codes are local to the chunk
+            codes = np.array([_code(category_names, name) for name in names], dtype=np.int32)
+            columns['categories'] = codes[columns['categories']]
+            loaded.append(columns)
+            pairs.append(_load_pairs(RecipeIngredient.objects.filter(recipe_id__in=chunk)))
+
+        columns = {
+            name: np.concatenate([getattr(self, name)[kept_positions]] + [part[name] for part in loaded])
+            for name in self.COLUMNS
+        }
+        order = np.argsort(columns['pks'], kind='stable')
+        columns = {name: values[order] for name, values in columns.items()}
+        new_positions = np.empty(len(order), dtype=np.int64)
+        new_positions[order] = np.arange(len(order))
+
+        # Bit positions never move, so unchanged recipes keep their head row
+        # and tail bits as they are
+        head = np.zeros((len(order), self.head.shape[1]), dtype=np.uint64)
+        head[new_positions[:len(kept_positions)]] = self.head[kept_positions]
+        kept_tail = kept[self.tail_owners]
+        kept_owners = np.full(len(self), -1, dtype=np.int64)
+        kept_owners[kept_positions] = new_positions[:len(kept_positions)]
+
+        owners, ingredient_ids = _owned_pairs(columns['pks'], np.concatenate(pairs or [np.empty((0, 2), dtype=np.int64)]))
+        # Ingredients new to the index get the next free bits
+        bit_ingredients = np.concatenate([self.bit_ingredients, np.setdiff1d(ingredient_ids, self.bit_ingredients)])
+        return self._assemble(
+            columns, category_names, bit_ingredients,
+            np.concatenate([kept_owners[self.tail_owners[kept_tail]], owners]),
+            np.concatenate([self.bit_ingredients[self.tail_bits[kept_tail]], ingredient_ids]),
+            self.head.shape[1], sequence, head,
+        )
+
+    def positions(self, recipe_ids):
+        """
+        Map recipe ids to positions, keeping their order.
+
+        Ids unknown to the index are dropped.
+
+        Returns:
+            tuple: (int64 positions, bool mask of the ids that were kept)
+        """
+        recipe_ids = np.asarray(recipe_ids, dtype=np.int64)
+        positions = np.searchsorted(self.pks, recipe_ids)
+        kept = positions < len(self.pks)
+        kept[kept] = self.pks[positions[kept]] == recipe_ids[kept]
+        return positions[kept], kept
+
+    def missing_counts(self, pantry_ids):
+        """
+        Count the ingredients of every recipe that are not in ``pantry_ids``.
+
+        Returns:
+            int64 array aligned with ``pks``
+        """
+        pantry_ids = np.fromiter(pantry_ids, dtype=np.int64, count=len(pantry_ids))
+        pantry_ids = pantry_ids[pantry_ids < len(self.bits_of)]
+        bits = self.bits_of[pantry_ids]
+        bits = bits[bits >= 0]
+        if not len(bits):
+            return self.sizes.copy()
+
+        head_mask = np.zeros((1, self.head.shape[1]), dtype=np.uint64)
+        head_bits = bits[bits < self.head_bits]
+        _set_bits(head_mask, np.zeros(len(head_bits), dtype=np.int64), head_bits)
+        missing = _popcount_rows(self.head & ~head_mask)
+
+        in_pantry = np.zeros(len(self.bit_ingredients), dtype=bool)
+        in_pantry[bits] = True
+        covered_tail = np.bincount(self.tail_owners[in_pantry[self.tail_bits]], minlength=len(self))
+        return missing + self.tail_sizes - covered_tail
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            np.savez(
+                f,
+                pks=self.pks, categories=self.categories, category_names=np.array(self.category_names, dtype=str),
+                total_time=self.total_time, rating=self.rating, created_at=self.created_at,
+                bit_ingredients=self.bit_ingredients, head=self.head, tail_indptr=self.tail_indptr,
+                tail_bits=self.tail_bits, sequence=np.array(-1 if self.sequence is None else self.sequence),
+            )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            sequence = int(data['sequence'])
+            return cls(
+                data['pks'], data['categories'], data['category_names'].tolist(), data['total_time'],
+                data['rating'], data['created_at'], data['bit_ingredients'], data['head'], data['tail_indptr'],
+                data['tail_bits'], None if sequence < 0 else sequence,
+            )
+
+
+def _code(names, name):
+    if name not in names:
+        names.append(name)
+    return names.index(name)
+
+
+def _load_recipes(queryset):
+    """Read the per-recipe columns of ``queryset`` by ascending id (one query)."""
+    rows = queryset.order_by('id').values_list(
+        'id', 'recipe_category', 'total_time', 'aggregated_rating', 'created_at'
+    )
+    pks, category_codes, total_time, rating, created_at = [], [], [], [], []
+    category_names = {}
+    for pk, category, duration, stars, created in rows.iterator(chunk_size=LOAD_CHUNK_SIZE):
+        pks.append(pk)
+        category_codes.append(category_names.setdefault(category, len(category_names)))
+        total_time.append(duration.total_seconds() if duration is not None else np.nan)
+        rating.append(float(stars) if stars is not None else np.nan)
+        created_at.append(created.timestamp())
+    columns = {
+        'pks': np.array(pks, dtype=np.int64),
+        'categories': np.array(category_codes, dtype=np.int32),
+        'total_time': np.array(total_time, dtype=np.float64),
+        'rating': np.array(rating, dtype=np.float64),
+        'created_at': np.array(created_at, dtype=np.float64),
+    }
+    return columns, list(category_names)
+
+
+def _load_pairs(queryset):
+    """Read the ``(recipe id, ingredient id)`` pairs of a ``RecipeIngredient`` queryset (one query)."""
+    rows = queryset.order_by().values_list('recipe_id', 'ingredient_id')
+    return np.fromiter(
+        chain.from_iterable(rows.iterator(chunk_size=LOAD_CHUNK_SIZE)), dtype=np.int64
+    ).reshape(-1, 2)
+
+
+def _owned_pairs(pks, pairs):
+    """
+    Map the recipe ids of ``pairs`` to positions in ``pks``, dropping
+    unknown recipes and duplicate ingredients.
+
+    Returns:
+        tuple: (int64 positions, int64 ingredient ids)
+    """
+    positions = np.searchsorted(pks, pairs[:, 0])
+    known = positions < len(pks)
+    known[known] = pks[positions[known]] == pairs[known, 0]
+    keys = np.unique((positions[known] << 32) | pairs[known, 1])
+    return keys >> 32, keys & 0xFFFFFFFF
+
+
+# Change log
+
+def change_sequence():
+    """Return the id of the latest recorded change, 0 when there is none."""
+    return CoverageChange.objects.aggregate(sequence=Max('id'))['sequence'] or 0
+
+
+def record_recipe_changes(recipe_pks):
+    """Record that the ingredients of ``recipe_pks`` (or the recipes themselves) changed."""
+    CoverageChange.objects.bulk_create(
+        [CoverageChange(recipe_id=recipe_pk) for recipe_pk in sorted(set(recipe_pks))],
+        batch_size=LOOKUP_CHUNK_SIZE // 2,
+    )
+
+
+def record_recipe_changes_on_commit(recipe_pks):
+    """``record_recipe_changes`` once the current transaction commits."""
+    recipe_pks = list(recipe_pks)
+    transaction.on_commit(lambda: record_recipe_changes(recipe_pks))
+
+
+def reset_coverage():
+    """Make every worker rebuild its index, e.g. after bulk deletes."""
+    CoverageChange.objects.create(recipe_id=None)
+
+
+def changes_since(sequence):
+    """
+    Read the changes recorded after ``sequence``, and those of the last
+    ``CHANGE_SETTLE_SECONDS`` (one query).
+
+    Returns:
+        tuple: (set of changed recipe ids, or None when the index must be
+        rebuilt; latest sequence, or None when unknown)
+    """
+    settled = timezone.now() - timedelta(seconds=CHANGE_SETTLE_SECONDS)
+    rows = list(
+        CoverageChange.objects.filter(Q(id__gt=sequence) | Q(created_at__gte=settled))
+        .order_by('id')
+        .values_list('id', 'recipe_id')[:MAX_PATCHED_RECIPES + 1]
+    )
+    if len(rows) > MAX_PATCHED_RECIPES:
+        return None, None
+    latest = max([sequence] + [change_id for change_id, _ in rows])
+    if any(recipe_pk is None and change_id > sequence for change_id, recipe_pk in rows):
+        return None, latest
+    return {recipe_pk for _, recipe_pk in rows if recipe_pk is not None}, latest
+
+
+# Index files
+
+def build_coverage_index(directory, keep=2):
+    """
+    Write a new generation of the coverage index and publish it.
+
+    Args:
+        directory: Index directory; created if needed.
+        keep (int): Number of generations to keep, including the new one.
+
+    Returns:
+        tuple: (path of the new file, ``CoverageIndex``)
+    """
+    os.makedirs(directory, exist_ok=True)
+    previous_sequence = None
+    previous = current_index_path(directory)
+    if previous:
+        try:
+            previous_sequence = CoverageIndex.load(previous).sequence
+        except (OSError, ValueError, KeyError):
+            pass
+    index = CoverageIndex.build()
+
+    previous = current_index_path(directory)
+    match = GENERATION_RE.search(os.path.basename(previous)) if previous else None
+    file_name = f'coverage-{int(match.group(1)) + 1 if match else 1:06d}.npz'
+    path = os.path.join(directory, file_name)
+    index.save(path)
+    publish_index(directory, file_name)
+
+    generations = sorted(name for name in os.listdir(directory) if GENERATION_RE.fullmatch(name))
+    for name in generations[:-keep]:
+        os.remove(os.path.join(directory, name))
+    # Workers follow the log from the file they load, which is at least the
+    # previous one: older changes are no longer needed
+    if previous_sequence is not None:
+        CoverageChange.objects.filter(id__lte=previous_sequence).delete()
+    return path, index
+
+
+class CoverageEngine:
+    """
+    Process-wide ``CoverageIndex``.
+
+    At most every ``refresh_interval`` seconds, a newly published index file
+    is loaded, and recipes recorded in the change log since are patched in.
+    Without an index file, or when the log cannot be followed, the index is
+    rebuilt from the database.
+    """
+
+    def __init__(self, index_dir=None, refresh_interval=30):
+        self.index_dir = os.fspath(index_dir) if index_dir else None
+        self.refresh_interval = refresh_interval
+        self._index = None
+        self._path = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def index(self):
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.refresh_interval:
+            with self._lock:
+                if self._checked_at is None or now - self._checked_at >= self.refresh_interval:
+                    self._refresh()
+                    self._checked_at = now
+        return self._index
+
+    def _refresh(self):
+        path = current_index_path(self.index_dir) if self.index_dir else None
+        if path and path != self._path:
+            self._path = path
+            try:
+                self._index = CoverageIndex.load(path)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f'Could not load coverage index {path}: {e}')
+                # The log may be pruned up to that file: rebuild instead
+                self._index = None
+        if self._index is None:
+            self._index = CoverageIndex.build()
+
+        changed, sequence = None, None
+        if self._index.sequence is not None:
+            changed, sequence = changes_since(self._index.sequence)
+        if changed is None:
+            self._index = CoverageIndex.build()
+        elif changed:
+            self._index = self._index.patched(changed, sequence)
+
+
+_engine = CoverageEngine(getattr(settings, 'RECIPE_COVERAGE_INDEX_DIR', None))
+
+
+def coverage_index():
+    """Return the process-wide ``CoverageIndex``."""
+    return _engine.index
@@ -0,0 +1,9 @@
+"""
+Database limits shared by the recipes app.
+
+Production runs on SQL Server, which caps a statement at 2100 parameters;
+every ``pk__in`` lookup over an unbounded list of ids is split into chunks
+of ``LOOKUP_CHUNK_SIZE``.
+"""
+
+LOOKUP_CHUNK_SIZE = 2000
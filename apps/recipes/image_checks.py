@@ -0,0 +1,152 @@
+"""
+Concurrent verification of recipe image URLs.
+
+Image URLs are checked with ``HEAD`` requests on a single ``aiohttp``
+session so connections are reused. ``concurrency`` bounds the number of
+requests in flight overall, and a ``HostLimiter`` bounds both the number of
+parallel requests and the request rate for each host. Hosts that reject
+``HEAD`` are retried with a one-byte ranged ``GET``.
+
+Only definitive answers mark an image as broken. Timeouts, connection errors,
+rate limiting and server errors say nothing about the image itself, so those
+checks come back without a verdict and the image is checked again later.
+"""
+import asyncio
+import contextlib
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+import aiohttp
+
+USER_AGENT = 'SavoryImageCheck/1.0'
+
+# Status codes returned by servers that do not implement HEAD properly
+HEAD_REJECTED = {403, 405, 501}
+
+# Client errors that only mean "try again later"
+TRANSIENT_STATUSES = {408, 425, 429}
+
+# Result of one check.
+#   ok:     True if the image is accessible, False if it is definitively
+#           broken (invalid URL, 404, 410 and other client errors), None when
+#           the check was inconclusive (timeout, network error, 429, 5xx)
+#   status: final HTTP status, or None if no response was received
+#   error:  description of the failure when no response was received
+ImageCheck = namedtuple('ImageCheck', 'url ok status error')
+
+
+def is_accessible(status):
+    """Return True, False or None (inconclusive) for an HTTP status."""
+    if status < 400:
+        return True
+    if status >= 500 or status in TRANSIENT_STATUSES:
+        return None
+    return False
+
+
+class HostLimiter:
+    """Bound the parallel requests and the request rate for each host."""
+
+    def __init__(self, per_host=4, rate=None):
+        """
+        Args:
+            per_host: Maximum number of requests in flight per host.
+            rate: Maximum number of requests started per second per host,
+                or None for no rate limit.
+        """
+        self.per_host = per_host
+        self.interval = 1.0 / rate if rate else 0.0
+        self._slots = {}
+        self._next_start = {}
+
+    @contextlib.asynccontextmanager
+    async def limit(self, host):
+        slot = self._slots.get(host)
+        if slot is None:
+            slot = self._slots[host] = asyncio.Semaphore(self.per_host)
+        async with slot:
+            if self.interval:
+                # Reserve the next start time before sleeping so concurrent
+                # callers for the same host are spaced out one after another
+                now = asyncio.get_running_loop().time()
+                start = max(now, self._next_start.get(host, now))
+                self._next_start[host] = start + self.interval
+                if start > now:
+                    await asyncio.sleep(start - now)
+            yield
+
+
+class ImageVerifier:
+    """
+    Check image URLs over a shared session.
+
+    Use as an async context manager::
+
+        async with ImageVerifier(concurrency=32) as verifier:
+            results = await verifier.check(urls)
+    """
+
+    def __init__(self, concurrency=32, per_host=4, rate=None, timeout=10):
+        self.concurrency = concurrency
+        self.limiter = HostLimiter(per_host, rate)
+        self.timeout = timeout
+        self._session = None
+        self._slots = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency,
+            limit_per_host=self.limiter.per_host,
+            ttl_dns_cache=300,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={'User-Agent': USER_AGENT},
+        )
+        self._slots = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def check(self, urls):
+        """
+        Check every URL in ``urls``.
+
+        Args:
+            urls: Iterable of URLs; duplicates are checked once.
+
+        Returns:
+            dict: URL -> ``ImageCheck``
+        """
+        urls = list(dict.fromkeys(urls))
+        results = await asyncio.gather(*(self._check_one(url) for url in urls))
+        return dict(zip(urls, results))
+
+    async def _check_one(self, url):
+        host = urlsplit(url).hostname
+        if not host:
+            return ImageCheck(url, False, None, 'invalid url')
+
+        # Wait for the host first so a busy host does not hold global slots
+        async with self.limiter.limit(host), self._slots:
+            try:
+                status = await self._request('HEAD', url)
+                if status in HEAD_REJECTED:
+                    status = await self._request('GET', url, headers={'Range': 'bytes=0-0'})
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                return ImageCheck(url, None, None, str(e) or e.__class__.__name__)
+        return ImageCheck(url, is_accessible(status), status, None)
+
+    async def _request(self, method, url, headers=None):
+        async with self._session.request(method, url, headers=headers, allow_redirects=True) as response:
+            return response.status
+
+
+async def check_image_urls(urls, **options):
+    """Check ``urls`` with a one-off ``ImageVerifier``; see its arguments."""
+    async with ImageVerifier(**options) as verifier:
+        return await verifier.check(urls)
@@ -0,0 +1 @@
+"""Helpers used by the ``import_recipes`` management command."""
@@ -0,0 +1,163 @@
+"""
+Batch-level replacement of recipe child rows.
+
+Instead of deleting and recreating steps, ingredients, tags and images one
+recipe at a time, a whole import batch is synced with one delete and one
+``bulk_create`` per child table. In diff mode the current child rows are read
+first and only recipes whose payload changed are touched.
+"""
+from collections import defaultdict, namedtuple
+from decimal import Decimal, InvalidOperation
+
+from ..models import CarouselItem, RecipeStep, RecipeIngredient, RecipeTag, RecipeImage
+
+# Child payload of a single recipe. Every member is a tuple so payloads can be
+# compared directly against what is stored in the database.
+#   steps:       (description, ...)
+#   ingredients: ((ingredient_id, raw_string, amount, unit, notes), ...)
+#   tags:        (tag_id, ...)
+#   images:      (url, ...)
+RecipeChildren = namedtuple('RecipeChildren', ['steps', 'ingredients', 'tags', 'images'])
+
+
+def normalize_amount(value):
+    """Round an amount the way ``RecipeIngredient.amount`` stores it."""
+    if value is None:
+        return None
+    try:
+        return Decimal(str(value)).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def build_children(steps, ingredients, tags, images):
+    """Build a ``RecipeChildren`` payload, dropping duplicate tags."""
+    unique_tags = tuple(dict.fromkeys(tags))
+    return RecipeChildren(
+        steps=tuple(steps),
+        ingredients=tuple(
+            (ingredient_id, raw_string, normalize_amount(amount), unit, notes)
+            for ingredient_id, raw_string, amount, unit, notes in ingredients
+        ),
+        tags=unique_tags,
+        images=tuple(images),
+    )
+
+
+def load_children(recipe_pks):
+    """Read the stored child payloads for ``recipe_pks`` (four queries)."""
+    steps = defaultdict(list)
+    ingredients = defaultdict(list)
+    tags = defaultdict(list)
+    images = defaultdict(list)
+
+    for recipe_pk, description in (
+        RecipeStep.objects.filter(recipe_id__in=recipe_pks)
+        .order_by('recipe_id', 'order')
+        .values_list('recipe_id', 'description')
+    ):
+        steps[recipe_pk].append(description)
+
+    for recipe_pk, *row in (
+        RecipeIngredient.objects.filter(recipe_id__in=recipe_pks)
+        .order_by('recipe_id', 'id')
+        .values_list('recipe_id', 'ingredient_id', 'raw_string', 'amount', 'unit', 'notes')
+    ):
+        ingredients[recipe_pk].append(tuple(row))
+
+    for recipe_pk, tag_id in (
+        RecipeTag.objects.filter(recipe_id__in=recipe_pks)
+        .order_by('recipe_id', 'id')
+        .values_list('recipe_id', 'tag_id')
+    ):
+        tags[recipe_pk].append(tag_id)
+
+    for recipe_pk, url in (
+        RecipeImage.objects.filter(recipe_id__in=recipe_pks)
+        .order_by('recipe_id', 'order')
+        .values_list('recipe_id', 'url')
+    ):
+        images[recipe_pk].append(url)
+
+    return {
+        recipe_pk: build_children(steps[recipe_pk], ingredients[recipe_pk], tags[recipe_pk], images[recipe_pk])
+        for recipe_pk in recipe_pks
+    }
+
+
+def _delete_rows(queryset):
+    """
+    Delete the rows of ``queryset`` with a single statement and return how many.
+
+    Unlike ``QuerySet.delete()`` this never loads the rows, whatever signal
+    receivers are connected, so a batch costs one query per table. Nothing
+    cascades: rows referencing the deleted ones must be removed first.
+    """
+    return queryset._raw_delete(queryset.db)
+
+
+def sync_children(payloads, diff=False):
+    """
+    Replace the child rows of every recipe in ``payloads``.
+
+    Args:
+        payloads (dict): Recipe primary key -> ``RecipeChildren``.
+        diff (bool): Only rewrite recipes whose stored children differ.
+
+    Returns:
+        dict: Number of recipes rewritten, rows created per table and
+            carousel items deleted with the replaced images.
+
+    Callers are expected to wrap this in a transaction.
+    """
+    recipe_pks = list(payloads)
+    if diff and recipe_pks:
+        stored = load_children(recipe_pks)
+        recipe_pks = [pk for pk in recipe_pks if stored[pk] != payloads[pk]]
+
+    stats = {'recipes': len(recipe_pks), 'steps': 0, 'ingredients': 0, 'tags': 0, 'images': 0, 'carousel_items': 0}
+    if not recipe_pks:
+        return stats
+
+    steps_to_create = []
+    ingredients_to_create = []
+    tags_to_create = []
+    images_to_create = []
+
+    for recipe_pk in recipe_pks:
+        children = payloads[recipe_pk]
+        steps_to_create.extend(
+            RecipeStep(recipe_id=recipe_pk, step_number=i, description=description, order=i)
+            for i, description in enumerate(children.steps, 1)
+        )
+        ingredients_to_create.extend(
+            RecipeIngredient(
+                recipe_id=recipe_pk,
+                ingredient_id=ingredient_id,
+                raw_string=raw_string,
+                amount=amount,
+                unit=unit,
+                notes=notes,
+            )
+            for ingredient_id, raw_string, amount, unit, notes in children.ingredients
+        )
+        tags_to_create.extend(RecipeTag(recipe_id=recipe_pk, tag_id=tag_id) for tag_id in children.tags)
+        images_to_create.extend(
+            RecipeImage(recipe_id=recipe_pk, url=url, order=i)
+            for i, url in enumerate(children.images)
+        )
+
+    # One delete statement per child table for the whole batch. Carousel items
+    # featuring a replaced image go with it, as the cascade would remove them
+    stats['carousel_items'] = _delete_rows(CarouselItem.objects.filter(image__recipe_id__in=recipe_pks))
+    _delete_rows(RecipeStep.objects.filter(recipe_id__in=recipe_pks))
+    _delete_rows(RecipeIngredient.objects.filter(recipe_id__in=recipe_pks))
+    _delete_rows(RecipeTag.objects.filter(recipe_id__in=recipe_pks))
+    _delete_rows(RecipeImage.objects.filter(recipe_id__in=recipe_pks))
+
+    # One bulk insert per child table
+    stats['steps'] = len(RecipeStep.objects.bulk_create(steps_to_create))
+    stats['ingredients'] = len(RecipeIngredient.objects.bulk_create(ingredients_to_create))
+    stats['tags'] = len(RecipeTag.objects.bulk_create(tags_to_create))
+    stats['images'] = len(RecipeImage.objects.bulk_create(images_to_create))
+    return stats
@@ -0,0 +1,124 @@
+"""
+Column-level converters for import batches.
+
+Each converter takes a whole ``pandas.Series`` and returns clean, typed
+values in one vectorized pass, replacing the per-cell ``parse_duration``,
+``safe_decimal`` and ``safe_int`` calls. Results are object arrays holding
+plain Python values (``timedelta``, ``Decimal``, ``int``, aware
+``datetime``) or ``None`` so rows can be materialized straight into model
+fields.
+"""
+import warnings
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+
+DECIMAL_LIMIT = 999999.9
+
+ISO_DURATION_PATTERN = r'^\s*PT(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?\s*$'
+
+
+def _to_object_array(values, mask):
+    """Return ``values`` as an object array with ``None`` where ``mask`` is set."""
+    result = np.asarray(values, dtype=object)
+    result[np.asarray(mask)] = None
+    return result
+
+
+def convert_durations(series):
+    """
+    Convert ISO 8601 ``PT#H#M#S`` and ``HH:MM:SS`` strings to ``timedelta``.
+
+    Anything else (including datetimes Excel made out of durations) becomes None.
+    """
+    text = series.astype('string')
+    parts = text.str.extract(ISO_DURATION_PATTERN).astype('float')
+    is_iso = parts.notna().any(axis=1)
+    seconds = (parts[0].fillna(0) * 3600 + parts[1].fillna(0) * 60 + parts[2].fillna(0)).where(is_iso)
+
+    # Fall back to HH:MM:SS for everything that is not ISO 8601
+    clock = pd.to_timedelta(text.where(~is_iso & text.str.contains(':', na=False)), errors='coerce')
+    durations = pd.to_timedelta(seconds, unit='s').fillna(clock)
+
+    return _to_object_array(durations.dt.to_pytimedelta(), durations.isna())
+
+
+def convert_decimals(series, default=Decimal('0.0')):
+    """
+    Convert a column to 1-dp ``Decimal`` values.
+
+    Strings are cleaned of anything but digits, dots and minus signs, values are
+    clamped to +/-999999.9 and rounded half-up. Missing, infinite and
+    unparseable cells become ``default``.
+    """
+    numbers = pd.to_numeric(series, errors='coerce')
+    if series.dtype == object:
+        cleaned = series.astype('string').str.replace(r'[^\d.-]', '', regex=True)
+        numbers = numbers.fillna(pd.to_numeric(cleaned, errors='coerce'))
+
+    values = numbers.to_numpy(dtype='float64', na_value=np.nan)
+    invalid = ~np.isfinite(values)
+    values = np.clip(np.where(invalid, 0.0, values), -DECIMAL_LIMIT, DECIMAL_LIMIT)
+
+    # Round half away from zero like Decimal's ROUND_HALF_UP; the epsilon
+    # absorbs binary representation error (1.45 * 10 == 14.499999...)
+    tenths = np.sign(values) * np.floor(np.abs(values) * 10 + 0.5 + 1e-9)
+    result = np.array([Decimal(int(t)).scaleb(-1) for t in tenths], dtype=object)
+    result[invalid] = default
+    return result
+
+
+def convert_ints(series, default=0):
+    """Convert a column to rounded ``int`` values, using ``default`` for bad cells."""
+    numbers = pd.to_numeric(series, errors='coerce')
+    values = numbers.to_numpy(dtype='float64', na_value=np.nan)
+    invalid = ~np.isfinite(values)
+    rounded = np.round(np.where(invalid, 0.0, values)).astype('int64')
+    result = rounded.astype(object)
+    result[invalid] = default
+    return result
+
+
+def _parse_datetimes(series, **options):
+    with warnings.catch_warnings():
+        # Mixed offsets and formats are handled by the caller; don't warn about them here
+        warnings.simplefilter('ignore', FutureWarning)
+        warnings.simplefilter('ignore', UserWarning)
+        return pd.to_datetime(series, errors='coerce', **options)
+
+
+def _localize(value, tz):
+    if pd.isna(value):
+        return pd.NaT
+    value = pd.Timestamp(value)
+    return value.tz_localize(tz, ambiguous='NaT', nonexistent='NaT') if value.tzinfo is None else value
+
+
+def convert_datetimes(series, tz_name='UTC'):
+    """
+    Convert a column to aware ``datetime`` values in ``tz_name``.
+
+    Naive values are taken to be in ``tz_name``; unparseable cells become None.
+    """
+    tz = dt_timezone.utc if tz_name == 'UTC' else ZoneInfo(tz_name)
+    parsed = _parse_datetimes(series)
+    if (parsed.isna() & series.notna()).any():
+        # pandas infers one format from the first cell; cells written in
+        # another format are parsed one by one instead of being dropped
+        parsed = _parse_datetimes(series, format='mixed')
+    if not pd.api.types.is_datetime64_any_dtype(parsed):
+        # Mixed offsets end up as objects; make each cell aware on its own,
+        # then normalise them through UTC
+        aware = [_localize(value, tz) for value in _parse_datetimes(series, format='mixed')]
+        parsed = pd.to_datetime(pd.Series(aware, index=series.index, dtype=object), utc=True)
+
+    if parsed.dt.tz is None:
+        parsed = parsed.dt.tz_localize(tz, ambiguous='NaT', nonexistent='NaT')
+    else:
+        parsed = parsed.dt.tz_convert(tz)
+
+    # Timestamps are datetime subclasses, so the ORM takes them as they are
+    return _to_object_array(parsed.astype(object).to_numpy(), parsed.isna())
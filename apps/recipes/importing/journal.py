@@ -0,0 +1,77 @@
+"""
+Checkpoint journal for resumable imports.
+
+The journal is a small SQLite file next to the import file. Every committed
+batch is recorded under the SHA-256 of the input and the row offset the batch
+starts at, together with its throughput numbers. ``import_recipes --resume``
+skips the offsets that are already in the journal for the same file.
+"""
+import hashlib
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    file_hash TEXT NOT NULL,
+    batch_size INTEGER NOT NULL,
+    row_offset INTEGER NOT NULL,
+    row_count INTEGER NOT NULL,
+    recipes INTEGER NOT NULL,
+    failures INTEGER NOT NULL,
+    queries INTEGER NOT NULL,
+    seconds REAL NOT NULL,
+    committed_at REAL NOT NULL,
+    PRIMARY KEY (file_hash, batch_size, row_offset)
+)
+"""
+
+
+def file_digest(file_path, block_size=1024 * 1024):
+    """Return the SHA-256 hex digest of ``file_path``."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def default_journal_path(file_path):
+    return f'{file_path}.journal.sqlite3'
+
+
+class ImportJournal:
+    """Per-batch progress records for one input file and batch size."""
+
+    def __init__(self, journal_path, file_hash, batch_size):
+        self.file_hash = file_hash
+        self.batch_size = batch_size
+        self.connection = sqlite3.connect(journal_path)
+        self.connection.execute(SCHEMA)
+        self.connection.commit()
+
+    def committed_offsets(self):
+        """Return the row offsets already committed for this file and batch size."""
+        rows = self.connection.execute(
+            'SELECT row_offset FROM batches WHERE file_hash = ? AND batch_size = ?',
+            (self.file_hash, self.batch_size),
+        )
+        return {row_offset for (row_offset,) in rows}
+
+    def other_batch_sizes(self):
+        """Return batch sizes of earlier runs over the same file."""
+        rows = self.connection.execute(
+            'SELECT DISTINCT batch_size FROM batches WHERE file_hash = ? AND batch_size != ?',
+            (self.file_hash, self.batch_size),
+        )
+        return sorted(batch_size for (batch_size,) in rows)
+
+    def record(self, row_offset, row_count, recipes, failures, queries, seconds):
+        """Mark the batch starting at ``row_offset`` as committed."""
+        self.connection.execute(
+            'INSERT OR REPLACE INTO batches VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (self.file_hash, self.batch_size, row_offset, row_count, recipes, failures, queries, seconds, time.time()),
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,118 @@
+"""
+Safe parser for the list literals found in recipe dumps.
+
+Handles JSON arrays (``["a", "b"]``), R character vectors (``c("a", "b")``,
+``character(0)``) and Python list literals (``['a', "b"]``) in a single
+regex-driven pass per cell, without ``eval`` or ``ast``. Only flat lists of
+strings, numbers, booleans and null-like values are supported, which is all
+the dataset contains.
+"""
+import re
+
+
+class LiteralSyntaxError(ValueError):
+    """Raised when a cell is not a list literal this module understands."""
+
+
+# One list item followed by a comma or the end of the input. Quoted strings
+# may contain commas and escaped quotes; bare items run up to the next comma.
+ITEM_PATTERN = re.compile(
+    r'''\s*(?:"((?:[^"\\]|\\.)*)"|'((?:[^'\\]|\\.)*)'|([^,"'\s][^,]*?))\s*(?:,|$)''',
+    re.DOTALL,
+)
+ESCAPE_PATTERN = re.compile(r'\\(u[0-9a-fA-F]{4}|U[0-9a-fA-F]{8}|x[0-9a-fA-F]{2}|.)', re.DOTALL)
+NUMBER_PATTERN = re.compile(r'^[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?$')
+
+SIMPLE_ESCAPES = {
+    'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', '0': '\0',
+    '"': '"', "'": "'", '\\': '\\', '/': '/',
+}
+BARE_WORDS = {
+    'NA': None, 'NULL': None, 'null': None, 'None': None,
+    'TRUE': True, 'True': True, 'true': True,
+    'FALSE': False, 'False': False, 'false': False,
+}
+EMPTY_LITERALS = {'', 'NA', 'c()', 'character(0)', 'NULL', 'None', 'null'}
+
+
+def _replace_escape(match):
+    escape = match.group(1)
+    if escape[0] in 'uUx' and len(escape) > 1:
+        return chr(int(escape[1:], 16))
+    return SIMPLE_ESCAPES.get(escape, '\\' + escape)
+
+
+def _unescape(text):
+    if '\\' not in text:
+        return text
+    text = ESCAPE_PATTERN.sub(_replace_escape, text)
+    # JSON encodes astral characters as surrogate pairs
+    if any('\ud800' <= char <= '\udfff' for char in text):
+        text = text.encode('utf-16', 'surrogatepass').decode('utf-16', 'replace')
+    return text
+
+
+def _bare_value(token):
+    if token in BARE_WORDS:
+        return BARE_WORDS[token]
+    if NUMBER_PATTERN.match(token):
+        return float(token) if any(char in token for char in '.eE') else int(token)
+    return token
+
+
+def parse_literal_list(text):
+    """
+    Parse a list literal into a Python list.
+
+    Raises:
+        LiteralSyntaxError: if ``text`` is not a supported list literal.
+    """
+    text = text.strip()
+    if text in EMPTY_LITERALS:
+        return []
+
+    if text.startswith('c(') and text.endswith(')'):
+        body = text[2:-1].strip()
+    elif text.startswith('[') and text.endswith(']'):
+        body = text[1:-1].strip()
+    elif text.startswith(('[', 'c(')):
+        raise LiteralSyntaxError(f'Unterminated list: {text[:20]!r}')
+    elif text[0] in '"\'':
+        # A lone quoted value such as "a"
+        body = text
+    else:
+        # A single unwrapped value, kept whole: URLs and sentences contain commas
+        return [_bare_value(text)]
+
+    items = []
+    position = 0
+    end = len(body)
+    while position < end:
+        match = ITEM_PATTERN.match(body, position)
+        if match is None or match.end() == position:
+            raise LiteralSyntaxError(f'Unexpected input at offset {position}: {body[position:position + 20]!r}')
+        double_quoted, single_quoted, bare = match.groups()
+        if double_quoted is not None:
+            items.append(_unescape(double_quoted))
+        elif single_quoted is not None:
+            items.append(_unescape(single_quoted))
+        elif bare is not None:
+            items.append(_bare_value(bare))
+        position = match.end()
+    return items
+
+
+def parse_list(value):
+    """
+    Parse a list column cell, returning ``[]`` for missing or malformed cells.
+
+    Lists and tuples (e.g. from Parquet or NDJSON input) are passed through.
+    """
+    if isinstance(value, str):
+        try:
+            return parse_literal_list(value)
+        except LiteralSyntaxError:
+            return []
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return []
@@ -0,0 +1,35 @@
+"""
+Cell-level parsers for the image column of recipe dumps.
+
+These are plain functions without Django or ``stdout`` access so they can run
+inside worker processes. Problems are reported by appending a message to the
+optional ``warnings`` list instead of being printed.
+"""
+from .literals import LiteralSyntaxError, parse_literal_list
+
+
+def parse_images(value, warnings=None):
+    """
+    Parse image URLs from a JSON, R-style or Python list while preserving full URLs
+
+    Args:
+        value (str): String containing a list of URLs
+
+    Returns:
+        list: List of cleaned full URLs, limited to 10 items
+    """
+    if not isinstance(value, str):
+        return []
+
+    try:
+        urls = [url for url in parse_literal_list(value) if isinstance(url, str) and url.startswith('http')]
+    except LiteralSyntaxError as e:
+        if warnings is not None:
+            warnings.append(f'Error parsing image URLs: {str(e)}')
+        return []
+
+    if not urls and warnings is not None:
+        warnings.append(f'No valid URLs found in: {value[:100]}...')
+
+    # Limit to 10 images
+    return urls[:10]
@@ -0,0 +1,191 @@
+"""
+Turn raw dump rows into plain-tuple recipe payloads.
+
+``parse_batch`` is the unit of work of the import parse stage. Scalar columns
+are converted for the whole batch by ``converters``; the list columns are
+parsed per row with the helpers in ``parsing``. Nothing here touches the
+database, so it can run in a worker process and ship its result back to the
+writer with pickle.
+"""
+import hashlib
+import json
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pandas as pd
+
+from .converters import convert_datetimes, convert_decimals, convert_durations, convert_ints
+from .literals import parse_list
+from .parsing import parse_images
+from ..ingredient_parser import parse_ingredient_line
+
+# Recipe model fields carried in ``RecipePayload.fields``, in order
+RECIPE_FIELDS = (
+    'recipe_id', 'name', 'cook_time', 'prep_time', 'total_time', 'date_published',
+    'description', 'recipe_category', 'aggregated_rating', 'review_count',
+    'calories', 'fat_content', 'saturated_fat_content', 'cholesterol_content',
+    'sodium_content', 'carbohydrate_content', 'fiber_content', 'sugar_content',
+    'protein_content', 'serving_size', 'servings',
+)
+
+# Decimal model fields and the dump column they are read from
+DECIMAL_COLUMNS = (
+    ('aggregated_rating', 'AggregatedRating'),
+    ('calories', 'Calories'),
+    ('fat_content', 'FatContent'),
+    ('saturated_fat_content', 'SaturatedFatContent'),
+    ('cholesterol_content', 'CholesterolContent'),
+    ('sodium_content', 'SodiumContent'),
+    ('carbohydrate_content', 'CarbohydrateContent'),
+    ('fiber_content', 'FiberContent'),
+    ('sugar_content', 'SugarContent'),
+    ('protein_content', 'ProteinContent'),
+)
+
+# List model payload parts and the dump column they are read from
+LIST_COLUMNS = (
+    ('steps', 'steps'),
+    ('ingredients', 'ingredients'),
+    ('ingredients_raw_str', 'ingredients_raw_str'),
+    ('tags', 'tags'),
+    ('images', 'Images'),
+)
+
+# Part of every content hash; bump it when parsing changes so the next import
+# rewrites every recipe instead of skipping them as unchanged
+PAYLOAD_VERSION = 2
+
+# One parsed recipe.
+#   fields:       values for RECIPE_FIELDS; date_published is aware
+#   steps:        (description, ...)
+#   ingredients:  ((lower-cased name, raw_string, amount, unit, notes), ...)
+#   tags:         (tag name, ...)
+#   images:       (url, ...)
+#   content_hash: ``payload_hash`` of all of the above
+RecipePayload = namedtuple('RecipePayload', ['fields', 'steps', 'ingredients', 'tags', 'images', 'content_hash'])
+
+
+def _hash_default(value):
+    """JSON encoding of the non-JSON values found in payloads."""
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, datetime):
+        return value.astimezone(timezone.utc).isoformat()
+    raise TypeError(f'Cannot hash {type(value).__name__}')
+
+
+def payload_hash(fields, steps, ingredients, tags, images):
+    """
+    Return the SHA-256 hex digest of a recipe payload.
+
+    The digest is stable across processes and time zones, so it can be
+    stored on ``Recipe.content_hash`` and compared on the next import.
+    """
+    content = json.dumps(
+        [PAYLOAD_VERSION, fields, steps, ingredients, tags, images],
+        default=_hash_default,
+        ensure_ascii=False,
+        separators=(',', ':'),
+    )
+    return hashlib.sha256(content.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+def convert_batch(batch_df, tz_name='UTC'):
+    """
+    Convert the scalar columns of a batch into a DataFrame of typed values.
+
+    Columns are named after the ``Recipe`` fields, plus the raw list columns
+    (``steps``, ``ingredients``, ``ingredients_raw_str``, ``tags``, ``images``)
+    that are still parsed cell by cell.
+    """
+    columns = {
+        'recipe_id': convert_ints(batch_df['RecipeId'], None),
+        'name': batch_df['Name'].to_numpy(dtype=object),
+        'cook_time': convert_durations(batch_df['CookTime']),
+        'prep_time': convert_durations(batch_df['PrepTime']),
+        'total_time': convert_durations(batch_df['TotalTime']),
+        'date_published': convert_datetimes(batch_df['DatePublished'], tz_name),
+        'description': batch_df['description'].to_numpy(dtype=object),
+        'recipe_category': batch_df['RecipeCategory'].to_numpy(dtype=object),
+        'review_count': convert_ints(batch_df['ReviewCount'], 0),
+        'serving_size': batch_df['serving_size'].to_numpy(dtype=object),
+        'servings': convert_ints(batch_df['servings'], 1),
+    }
+    for field, column in DECIMAL_COLUMNS:
+        columns[field] = convert_decimals(batch_df[column], Decimal('0.0'))
+
+    typed = pd.DataFrame({field: columns[field] for field in RECIPE_FIELDS}, dtype=object)
+    for field, column in LIST_COLUMNS:
+        typed[field] = batch_df[column].to_numpy(dtype=object)
+    return typed
+
+
+def parse_row(row, warnings):
+    """Build a ``RecipePayload`` from one ``convert_batch`` row."""
+    if row.recipe_id is None:
+        raise ValueError('missing RecipeId')
+    if row.date_published is None:
+        raise ValueError('missing DatePublished')
+
+    # Skip recipes that don't have either prep_time or cook_time
+    if not row.prep_time and not row.cook_time:
+        warnings.append(f'Skipping recipe {row.name} - missing both prep_time and cook_time')
+        return None
+
+    ingredients = []
+    try:
+        for ingredient_name, raw_string in zip(parse_list(row.ingredients), parse_list(row.ingredients_raw_str)):
+            if not isinstance(ingredient_name, str) or not isinstance(raw_string, str):
+                continue
+            parsed = parse_ingredient_line(raw_string)
+            ingredients.append((ingredient_name.lower(), raw_string, parsed.amount, parsed.unit, parsed.name))
+    except Exception as e:
+        warnings.append(f'Error processing ingredients for recipe {row.name}: {str(e)}')
+        ingredients = []
+
+    try:
+        tags = [tag.lower() for tag in parse_list(row.tags) if isinstance(tag, str)]
+    except Exception as e:
+        warnings.append(f'Error processing tags for recipe {row.name}: {str(e)}')
+        tags = []
+
+    fields = tuple(row[:len(RECIPE_FIELDS)])
+    steps = tuple(step for step in parse_list(row.steps) if isinstance(step, str))
+    ingredients = tuple(ingredients)
+    tags = tuple(tags)
+    images = tuple(parse_images(row.images, warnings))
+    return RecipePayload(
+        fields=fields,
+        steps=steps,
+        ingredients=ingredients,
+        tags=tags,
+        images=images,
+        content_hash=payload_hash(fields, steps, ingredients, tags, images),
+    )
+
+
+def parse_batch(batch_df, tz_name='UTC'):
+    """
+    Parse a batch DataFrame.
+
+    Returns:
+        tuple: (list of ``RecipePayload``, list of warning messages,
+            recipe_ids of the rows that were skipped)
+    """
+    payloads = []
+    warnings = []
+    skipped_ids = []
+    for row in convert_batch(batch_df, tz_name).itertuples(index=False, name='Row'):
+        try:
+            payload = parse_row(row, warnings)
+        except Exception as e:
+            warnings.append(f'Skipping recipe {row.name} - error: {str(e)}')
+            payload = None
+        if payload is not None:
+            payloads.append(payload)
+        elif row.recipe_id is not None:
+            skipped_ids.append(row.recipe_id)
+    return payloads, warnings, skipped_ids
@@ -0,0 +1,93 @@
+"""
+Streaming row readers for recipe dumps.
+
+Every reader walks its input exactly once and yields ``pandas.DataFrame``
+batches of at most ``batch_size`` rows, so memory stays bounded by the batch
+and not by the file. The reader is picked from the file extension.
+"""
+import os
+
+import pandas as pd
+
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm')
+CSV_EXTENSIONS = ('.csv',)
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+NDJSON_EXTENSIONS = ('.ndjson', '.jsonl')
+
+
+def iter_excel_batches(file_path, batch_size, sheet_name=None):
+    """Yield batches from an Excel workbook using openpyxl read-only mode."""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+        rows = sheet.iter_rows(values_only=True)
+
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(name).strip() if name is not None else '' for name in header]
+
+        batch = []
+        for row in rows:
+            # Read-only sheets often report trailing blank rows
+            if all(value is None for value in row):
+                continue
+            batch.append(row[:len(columns)])
+            if len(batch) >= batch_size:
+                yield pd.DataFrame(batch, columns=columns)
+                batch = []
+
+        if batch:
+            yield pd.DataFrame(batch, columns=columns)
+    finally:
+        workbook.close()
+
+
+def iter_csv_batches(file_path, batch_size):
+    """Yield batches from a CSV file."""
+    with pd.read_csv(file_path, chunksize=batch_size) as reader:
+        for chunk in reader:
+            yield chunk.reset_index(drop=True)
+
+
+def iter_parquet_batches(file_path, batch_size):
+    """Yield batches from a Parquet file, one record batch at a time."""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError('Reading Parquet files requires the pyarrow package')
+
+    parquet_file = pq.ParquetFile(file_path)
+    for record_batch in parquet_file.iter_batches(batch_size=batch_size):
+        yield record_batch.to_pandas()
+
+
+def iter_ndjson_batches(file_path, batch_size):
+    """Yield batches from a newline-delimited JSON file."""
+    with pd.read_json(file_path, lines=True, chunksize=batch_size) as reader:
+        for chunk in reader:
+            yield chunk.reset_index(drop=True)
+
+
+def iter_batches(file_path, batch_size, sheet_name=None):
+    """
+    Yield DataFrame batches from ``file_path``, choosing the reader by extension.
+
+    Raises:
+        ValueError: if the extension is not supported.
+    """
+    if batch_size < 1:
+        raise ValueError('batch_size must be at least 1')
+
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in EXCEL_EXTENSIONS:
+        return iter_excel_batches(file_path, batch_size, sheet_name=sheet_name)
+    if extension in CSV_EXTENSIONS:
+        return iter_csv_batches(file_path, batch_size)
+    if extension in PARQUET_EXTENSIONS:
+        return iter_parquet_batches(file_path, batch_size)
+    if extension in NDJSON_EXTENSIONS:
+        return iter_ndjson_batches(file_path, batch_size)
+    raise ValueError(f'Unsupported file type: {extension or file_path}')
@@ -0,0 +1,101 @@
+"""
+Process-wide name -> id dictionaries for ``Ingredient`` and ``Tag``.
+
+The dictionary is warmed once from the database and then grows batch by
+batch: names it has not seen are inserted with a single ``bulk_create`` and
+read back with one re-select, so later batches never hit the database for
+vocabulary they already know.
+"""
+from django.db import IntegrityError, connection, transaction
+
+from ..db import LOOKUP_CHUNK_SIZE
+
+_vocabularies = {}
+
+
+class Vocabulary:
+    """Name -> id dictionary for a model with a unique ``name`` field."""
+
+    def __init__(self, model):
+        self.model = model
+        self.max_length = model._meta.get_field('name').max_length
+        self.ids = None
+
+    def warm(self):
+        """Load every existing name from the database."""
+        self.ids = dict(self.model.objects.values_list('name', 'id'))
+        return self
+
+    def __contains__(self, name):
+        return self.ids is not None and name in self.ids
+
+    def __len__(self):
+        return len(self.ids or ())
+
+    def get(self, name, default=None):
+        if self.ids is None:
+            self.warm()
+        return self.ids.get(name, default)
+
+    def _select(self, names):
+        names = list(names)
+        for start in range(0, len(names), LOOKUP_CHUNK_SIZE):
+            chunk = names[start:start + LOOKUP_CHUNK_SIZE]
+            self.ids.update(self.model.objects.filter(name__in=chunk).values_list('name', 'id'))
+
+    def _get_or_create(self, name):
+        try:
+            with transaction.atomic():
+                self.ids[name] = self.model.objects.get_or_create(name=name)[0].pk
+        except IntegrityError:
+            pass
+
+    def resolve(self, names):
+        """
+        Make sure every name in ``names`` has an id, creating missing rows.
+
+        Returns:
+            set: Names that could not be stored (e.g. longer than the column).
+        """
+        if self.ids is None:
+            self.warm()
+
+        rejected = {name for name in names if not name or len(name) > self.max_length}
+        missing = {name for name in names if name not in self.ids} - rejected
+        if not missing:
+            return rejected
+
+        new_objects = [self.model(name=name) for name in sorted(missing)]
+        if connection.features.supports_ignore_conflicts:
+            self.model.objects.bulk_create(new_objects, ignore_conflicts=True)
+        else:
+            try:
+                with transaction.atomic():
+                    self.model.objects.bulk_create(new_objects)
+            except IntegrityError:
+                # Another process created some of these names; pick those up
+                # and insert the remainder.
+                self._select(missing)
+                remaining = [self.model(name=name) for name in sorted(missing) if name not in self.ids]
+                try:
+                    with transaction.atomic():
+                        self.model.objects.bulk_create(remaining)
+                except IntegrityError:
+                    # Names the collation takes for existing ones ('salt ' and
+                    # 'salt') are not found by name; resolve them one by one
+                    self._select(missing)
+                    for name in sorted(missing):
+                        if name not in self.ids:
+                            self._get_or_create(name)
+
+        # Re-select so the dictionary always holds database ids
+        self._select(missing)
+        return rejected | {name for name in missing if name not in self.ids}
+
+
+def get_vocabulary(model):
+    """Return the shared ``Vocabulary`` for ``model``."""
+    if model not in _vocabularies:
+        _vocabularies[model] = Vocabulary(model)
+    return _vocabularies[model]
+
@@ -0,0 +1,142 @@
+"""
+Ingredient line parser.
+
+Splits lines such as ``"1 1/2 cups all-purpose flour"`` or ``"2-3 Tbsp. olive
+oil"`` into an amount, a canonical unit and the remaining text. Patterns are
+compiled once at import time and the unit lexicon is table-driven, so adding
+an alias is a one-line change.
+"""
+import re
+from collections import namedtuple
+from fractions import Fraction
+from functools import lru_cache
+
+ParsedIngredient = namedtuple('ParsedIngredient', ['amount', 'amount_max', 'unit', 'name'])
+
+# Canonical unit -> aliases
+UNITS = {
+    'tsp': ('teaspoon', 'teaspoons', 'tsp', 'tsps', 'tsp.', 'tea spoon'),
+    'tbsp': ('tablespoon', 'tablespoons', 'tbsp', 'tbsps', 'tbsp.', 'tbs', 'tbs.', 'tbl', 'tbl.', 'tblsp'),
+    'cup': ('cup', 'cups', 'c.'),
+    'fl oz': ('fluid ounce', 'fluid ounces', 'fl oz', 'fl. oz.', 'fl. oz', 'fl.oz.', 'floz'),
+    'pint': ('pint', 'pints', 'pt', 'pt.'),
+    'quart': ('quart', 'quarts', 'qt', 'qt.', 'qts'),
+    'gallon': ('gallon', 'gallons', 'gal', 'gal.'),
+    'ml': ('milliliter', 'milliliters', 'millilitre', 'millilitres', 'ml', 'ml.'),
+    'cl': ('centiliter', 'centiliters', 'cl'),
+    'dl': ('deciliter', 'deciliters', 'dl'),
+    'l': ('liter', 'liters', 'litre', 'litres', 'l'),
+    'mg': ('milligram', 'milligrams', 'mg'),
+    'g': ('gram', 'grams', 'g', 'g.', 'gr', 'grs'),
+    'kg': ('kilogram', 'kilograms', 'kg', 'kgs', 'kilo', 'kilos'),
+    'oz': ('ounce', 'ounces', 'oz', 'oz.'),
+    'lb': ('pound', 'pounds', 'lb', 'lbs', 'lb.', 'lbs.'),
+    'pinch': ('pinch', 'pinches'),
+    'dash': ('dash', 'dashes'),
+    'drop': ('drop', 'drops'),
+    'clove': ('clove', 'cloves'),
+    'slice': ('slice', 'slices'),
+    'piece': ('piece', 'pieces', 'pc', 'pcs'),
+    'stick': ('stick', 'sticks'),
+    'can': ('can', 'cans', 'tin', 'tins'),
+    'jar': ('jar', 'jars'),
+    'bottle': ('bottle', 'bottles'),
+    'package': ('package', 'packages', 'pkg', 'pkg.', 'pkgs', 'packet', 'packets', 'envelope', 'envelopes'),
+    'bag': ('bag', 'bags'),
+    'box': ('box', 'boxes'),
+    'container': ('container', 'containers', 'carton', 'cartons', 'tub', 'tubs'),
+    'bunch': ('bunch', 'bunches'),
+    'head': ('head', 'heads'),
+    'sprig': ('sprig', 'sprigs'),
+    'stalk': ('stalk', 'stalks', 'rib', 'ribs'),
+    'handful': ('handful', 'handfuls'),
+    'sheet': ('sheet', 'sheets'),
+    'loaf': ('loaf', 'loaves'),
+    'fillet': ('fillet', 'fillets', 'filet', 'filets'),
+}
+
+UNIT_ALIASES = {
+    alias: canonical
+    for canonical, aliases in UNITS.items()
+    for alias in aliases
+}
+
+VULGAR_FRACTIONS = {
+    '½': '1/2', '⅓': '1/3', '⅔': '2/3', '¼': '1/4', '¾': '3/4',
+    '⅕': '1/5', '⅖': '2/5', '⅗': '3/5', '⅘': '4/5', '⅙': '1/6', '⅚': '5/6',
+    '⅛': '1/8', '⅜': '3/8', '⅝': '5/8', '⅞': '7/8', '⁄': '/',
+}
+
+_VULGAR_PATTERN = re.compile(r'(\d)?([%s])' % ''.join(VULGAR_FRACTIONS))
+
+# "1", "1.5", "1/2", "1 1/2"
+_NUMBER = r'(?:\d+\s+\d+/\d+|\d+/\d+|\d*\.\d+|\d+)'
+_QUANTITY_PATTERN = re.compile(
+    r'^\s*(?P<low>%s)(?:\s*(?:-|–|to|or)\s*(?P<high>%s))?\s*' % (_NUMBER, _NUMBER),
+    re.IGNORECASE,
+)
+# A size note like "(8 ounce)" between the quantity and the unit
+_SIZE_PATTERN = re.compile(r'^\((?P<size>[^)]*)\)\s*')
+_UNIT_PATTERN = re.compile(
+    r'^(?P<unit>%s)(?=[\s,;)]|$)\s*' % '|'.join(
+        re.escape(alias).replace(r'\ ', r'\s+')
+        for alias in sorted(UNIT_ALIASES, key=len, reverse=True)
+    ),
+    re.IGNORECASE,
+)
+_OF_PATTERN = re.compile(r'^of\s+', re.IGNORECASE)
+
+
+def _to_number(text):
+    """Convert "1 1/2", "3/4" or "0.5" to a float."""
+    whole, _, fraction = text.strip().rpartition(' ')
+    try:
+        value = Fraction(fraction)
+    except (ValueError, ZeroDivisionError):
+        return None
+    if whole:
+        value += int(whole)
+    return float(value)
+
+
+def _replace_vulgar(match):
+    whole, fraction = match.groups()
+    replacement = VULGAR_FRACTIONS[fraction]
+    if fraction == '⁄':
+        return (whole or '') + replacement
+    return f'{whole} {replacement}' if whole else replacement
+
+
+@lru_cache(maxsize=200000)
+def parse_ingredient_line(line):
+    """
+    Parse one ingredient line.
+
+    Returns:
+        ParsedIngredient: ``amount`` and ``amount_max`` are floats or None (they
+        differ only for ranges such as "2-3"), ``unit`` is a canonical unit from
+        ``UNITS`` or None, and ``name`` is the rest of the line.
+    """
+    text = _VULGAR_PATTERN.sub(_replace_vulgar, line.strip())
+
+    amount = amount_max = unit = None
+    match = _QUANTITY_PATTERN.match(text)
+    if match:
+        amount = _to_number(match.group('low'))
+        amount_max = _to_number(match.group('high')) if match.group('high') else amount
+        text = text[match.end():]
+
+    size = _SIZE_PATTERN.match(text)
+    size_note = ''
+    if size:
+        size_note = f"({size.group('size')}) "
+        text = text[size.end():]
+
+    match = _UNIT_PATTERN.match(text)
+    if match:
+        unit = UNIT_ALIASES.get(re.sub(r'\s+', ' ', match.group('unit').lower()))
+        text = _OF_PATTERN.sub('', text[match.end():])
+
+    name = (size_note + text).strip()
+    return ParsedIngredient(amount, amount_max, unit, name or line.strip())
+
@@ -0,0 +1,32 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ...coverage import build_coverage_index
+
+
+class Command(BaseCommand):
+    help = 'Build a new generation of the pantry coverage index from the recipe ingredients'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--index-dir', type=str, default=None, help='Index directory (defaults to RECIPE_COVERAGE_INDEX_DIR)')
+        parser.add_argument('--keep', type=int, default=2, help='Number of index generations to keep on disk')
+
+    def handle(self, *args, **options):
+        index_dir = options['index_dir'] or getattr(settings, 'RECIPE_COVERAGE_INDEX_DIR', None)
+        if not index_dir:
+            raise CommandError('No index directory configured; pass --index-dir')
+        if options['keep'] < 1:
+            raise CommandError('--keep must be at least 1')
+
+        self.stdout.write(f'Building coverage index in {index_dir}...')
+        started = time.monotonic()
+        path, index = build_coverage_index(os.fspath(index_dir), keep=options['keep'])
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Published {os.path.basename(path)} ({len(index)} recipes, {len(index.bit_ingredients)} ingredients, '
+            f'{len(index.tail_bits)} tail bits, {os.path.getsize(path) / 1024 / 1024:.1f} MB, {elapsed:.1f}s)'
+        ))
@@ -0,0 +1,34 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ...search.index import build_memory_index
+from ...search.memory import MemoryIndex
+
+
+class Command(BaseCommand):
+    help = 'Build a new generation of the memory-mapped search index from the search postings tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--index-dir', type=str, default=None, help='Index directory (defaults to RECIPE_SEARCH OPTIONS index_dir)')
+        parser.add_argument('--keep', type=int, default=2, help='Number of index generations to keep on disk')
+
+    def handle(self, *args, **options):
+        index_dir = options['index_dir'] or settings.RECIPE_SEARCH.get('OPTIONS', {}).get('index_dir')
+        if not index_dir:
+            raise CommandError('No index directory configured; pass --index-dir')
+        if options['keep'] < 1:
+            raise CommandError('--keep must be at least 1')
+
+        self.stdout.write(f'Building search index in {index_dir}...')
+        started = time.monotonic()
+        path = build_memory_index(os.fspath(index_dir), keep=options['keep'])
+        elapsed = time.monotonic() - started
+
+        index = MemoryIndex(path)
+        self.stdout.write(self.style.SUCCESS(
+            f'Published generation {index.generation} ({index.doc_count} recipes, {len(index.terms)} terms, '
+            f'{os.path.getsize(path) / 1024 / 1024:.1f} MB, {elapsed:.1f}s)'
+        ))
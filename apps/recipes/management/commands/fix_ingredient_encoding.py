@@ -2,6 +2,7 @@ from django.core.management.base import BaseCommand
 from django.db import transaction
 from urllib.parse import unquote
 from apps.recipes.models import Ingredient, RecipeIngredient
+from apps.recipes.search.index import index_recipes_using
 import logging
 
 logger = logging.getLogger(__name__)
@@ -47,6 +48,7 @@ class Command(BaseCommand):
                             # If it exists, update all RecipeIngredient references to point to the existing ingredient
                             recipe_count = RecipeIngredient.objects.filter(ingredient=ingredient).count()
                             RecipeIngredient.objects.filter(ingredient=ingredient).update(ingredient=existing_ingredient)
+                            index_recipes_using(ingredient_ids=[existing_ingredient.id])
                             # Delete the duplicate ingredient
                             ingredient.delete()
                             self.stdout.write(f'Updated {recipe_count} recipes from: {original_name} -> {decoded_name}')
@@ -1,7 +1,9 @@
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from django.contrib.auth import get_user_model
-from ...models import Recipe, RecipeStep, Ingredient, RecipeIngredient, Tag, RecipeTag, RecipeImage
+from ...models import Recipe, RecipeStep, Ingredient, RecipeIngredient, Tag, RecipeTag, RecipeImage, SearchPosting, SearchDocument, SearchTerm
+from ...coverage import reset_coverage
+from ...search.result_cache import bump_catalog_generation_on_commit
 
 class Command(BaseCommand):
     help = 'Flush all recipe-related data while preserving the superuser'
@@ -33,6 +35,11 @@ class Command(BaseCommand):
                 RecipeTag.objects.all().delete()
                 self.stdout.write('Deleted all recipe tags')
                 
+                SearchPosting.objects.all().delete()
+                SearchDocument.objects.all().delete()
+                SearchTerm.objects.all().delete()
+                self.stdout.write('Deleted the search index')
+                
                 Ingredient.objects.all().delete()
                 self.stdout.write('Deleted all ingredients')
                 
@@ -41,6 +48,8 @@ class Command(BaseCommand):
                 
                 Recipe.objects.all().delete()
                 self.stdout.write('Deleted all recipes')
+                bump_catalog_generation_on_commit()
+                transaction.on_commit(reset_coverage)
                 
                 # Verify superuser still exists
                 if not User.objects.filter(is_superuser=True).exists():
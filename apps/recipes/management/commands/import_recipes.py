@@ -1,347 +1,299 @@
-import json
 import os
-from datetime import timedelta, datetime
-import pandas as pd
-import re
+import time
 import warnings
-from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
-import requests
-from tqdm import tqdm
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
-from django.db import transaction
-from django.db.models import Q
-
-from ...models import Recipe, RecipeStep, Ingredient, RecipeIngredient, Tag, RecipeTag, RecipeImage
+from django.db import connection, transaction
+
+from ...carousel import bump_carousel_version
+from ...models import Recipe, Ingredient, Tag
+from ...importing.children import build_children, sync_children
+from ...importing.journal import ImportJournal, default_journal_path, file_digest
+from ...importing.payloads import RECIPE_FIELDS, parse_batch
+from ...importing.queries import QueryCounter
+from ...importing.readers import iter_batches
+from ...importing.vocabulary import get_vocabulary
+from ...search.index import SearchText, index_documents
+from ...search.suggest import bump_ingredient_version
+
+# Recipe fields written when an imported recipe changed
+UPDATE_FIELDS = RECIPE_FIELDS + ('content_hash', 'updated_at')
 
 # Suppress all naive datetime warnings
 warnings.filterwarnings('ignore', category=RuntimeWarning, message='DateTimeField.*received a naive datetime')
 warnings.filterwarnings('ignore', category=RuntimeWarning, module='django.db.models.fields')
 
 class Command(BaseCommand):
-    help = 'Import recipes from an Excel file'
+    help = 'Import recipes from an Excel, CSV, Parquet or NDJSON file'
 
     def add_arguments(self, parser):
-        parser.add_argument('file_path', type=str, help='Path to the Excel file')
+        parser.add_argument('file_path', type=str, help='Path to the .xlsx, .csv, .parquet or .ndjson file')
         parser.add_argument('--batch-size', type=int, default=1000, help='Number of recipes to process in each batch')
-        parser.add_argument('--chunk-size', type=int, default=10000, help='Number of rows to read from Excel at once')
+        parser.add_argument('--chunk-size', type=int, default=None, help='Ignored; kept so existing scripts still run. Rows are streamed in batches of --batch-size')
+        parser.add_argument('--sheet', type=str, default=None, help='Excel sheet to import (defaults to the first sheet)')
+        parser.add_argument('--diff-children', action='store_true', help='Only rewrite steps, ingredients, tags and images of recipes whose data changed')
+        parser.add_argument('--workers', type=int, default=0, help='Number of worker processes used to parse rows (0 parses in this process)')
+        parser.add_argument('--resume', action='store_true', help='Skip batches the journal records as committed for this file')
+        parser.add_argument('--journal', type=str, default=None, help='Path of the checkpoint journal (defaults to <file_path>.journal.sqlite3)')
+        parser.add_argument('--dry-run', action='store_true', help='Report new, changed, unchanged and deleted recipes without writing anything')
 
-    def parse_duration(self, duration_str):
-        """
-        Parse duration string to timedelta.
-        Handles both PT20M format and 00:30:00 format.
-        """
-        if pd.isna(duration_str):
-            return None
+    def handle(self, *args, **options):
+        file_path = options['file_path']
+        batch_size = options['batch_size']
+        workers = options['workers']
+        dry_run = options['dry_run']
+        self.diff_children = options['diff_children']
 
-        try:
-            # If it's already a datetime, return None
-            if isinstance(duration_str, (pd.Timestamp, datetime)):
-                return None
-
-            # Convert to string if it's not already
-            duration_str = str(duration_str)
-
-            if duration_str.startswith('PT'):
-                # Handle ISO 8601 duration format
-                import re
-                match = re.match(r'PT(\d+)H?(\d+)?M?', duration_str)
-                if match:
-                    hours = int(match.group(1)) if match.group(1) else 0
-                    minutes = int(match.group(2)) if match.group(2) else 0
-                    return timedelta(hours=hours, minutes=minutes)
-            else:
-                # Handle HH:MM:SS format
-                hours, minutes, seconds = map(int, duration_str.split(':'))
-                return timedelta(hours=hours, minutes=minutes, seconds=seconds)
-        except Exception as e:
-            self.stdout.write(self.style.WARNING(f'Could not parse duration {duration_str}: {e}'))
-            return None
+        if workers < 0:
+            raise CommandError('--workers must be 0 or more')
+        if dry_run and options['resume']:
+            raise CommandError('--dry-run cannot be combined with --resume')
 
-    def parse_ingredient(self, raw_str):
-        """
-        Parse ingredient string into amount, unit, and name
-        """
-        import re
-        
-        # Strip any leading/trailing whitespace
-        raw_str = raw_str.strip()
-        
-        # Regex to match amount, optional unit, and ingredient name
-        pattern = r'^(\d*\.?\d*)\s*(-?\d*\.?\d*)?\s*(\w+)?\s*(.+)?$'
-        match = re.match(pattern, raw_str)
-        
-        if match:
-            amount = match.group(1) or match.group(2)
-            unit = match.group(3)
-            name = (match.group(4) or '').strip()
-            
-            # If no name found, use the whole match
-            if not name and match.group(2):
-                name = match.group(2)
-        else:
-            amount = None
-            unit = None
-            name = raw_str
-
-        return {
-            'amount': float(amount) if amount else None,
-            'unit': unit,
-            'name': name
-        }
+        self.stdout.write(f'Importing recipes from {file_path}...')
+        self.stdout.write(f'Using batch size: {batch_size}, workers: {workers or "none"}')
+
+        # Check if file exists
+        if not os.path.exists(file_path):
+            self.stdout.write(self.style.ERROR(f'File not found: {file_path}'))
+            return
+
+        # Open the checkpoint journal for this exact file content
+        journal = None
+        if not dry_run:
+            self.stdout.write('Hashing input file...')
+            journal = ImportJournal(
+                options['journal'] or default_journal_path(file_path),
+                file_digest(file_path),
+                batch_size,
+            )
+        skip_offsets = set()
+        if options['resume']:
+            other_sizes = journal.other_batch_sizes()
+            if other_sizes:
+                journal.close()
+                raise CommandError(
+                    f'The journal has batches for this file with batch size {other_sizes}; '
+                    f'resume with the same --batch-size'
+                )
+            skip_offsets = journal.committed_offsets()
+            self.stdout.write(f'Resuming: {len(skip_offsets)} committed batches will be skipped')
+
+        # Warm the ingredient and tag dictionaries once for the whole run
+        if not dry_run:
+            get_vocabulary(Ingredient).warm()
+            get_vocabulary(Tag).warm()
+            self.stdout.write(f'Loaded {len(get_vocabulary(Ingredient))} ingredients and {len(get_vocabulary(Tag))} tags')
 
-    def check_image_accessibility(self, url):
-        """Check if an image URL is accessible"""
         try:
-            response = requests.head(url, timeout=5)
-            return response.status_code == 200
-        except:
-            return False
+            # Rows are streamed from the file once and handed over batch by batch
+            batches = iter_batches(file_path, batch_size, sheet_name=options['sheet'])
+            rows_read = 0
+            totals = {'rows': 0, 'new': 0, 'changed': 0, 'unchanged': 0, 'failures': 0, 'queries': 0}
+            # recipe_ids of the file found in the database, skipped rows included,
+            # to count the recipes the file no longer has
+            matched_ids = set()
+            complete = not skip_offsets
+            started = time.monotonic()
+
+            for row_offset, row_count, parsed in self._iter_parsed(batches, workers, skip_offsets):
+                rows_read = row_offset + row_count
+                if parsed is None:
+                    continue
+                if isinstance(parsed, Exception):
+                    # A batch that cannot be parsed is skipped, not the rest of the file
+                    self.stdout.write(self.style.ERROR(
+                        f'Error parsing rows {row_offset} to {row_offset + row_count}: {str(parsed)}'
+                    ))
+                    complete = False
+                    continue
 
-    def parse_images(self, value):
-        """
-        Parse image URLs from R-style list format while preserving full URLs
-        
-        Args:
-            value (str): String containing a list of URLs
-        
-        Returns:
-            list: List of cleaned full URLs, limited to 10 items
-        """
-        if pd.isna(value):
-            return []
-        
-        if isinstance(value, str):
-            try:
-                # First try to parse as JSON if it's a JSON string
+                payloads, parse_warnings, skipped_ids = parsed
+                self.stdout.write(f'Processing rows {row_offset} to {row_offset + row_count}...')
+                for message in parse_warnings:
+                    self.stdout.write(self.style.WARNING(message))
+
+                counter = QueryCounter()
+                batch_started = time.monotonic()
                 try:
-                    urls = json.loads(value)
-                    if isinstance(urls, list):
-                        return [url for url in urls if isinstance(url, str) and url.startswith('http')][:10]
-                except json.JSONDecodeError:
-                    pass
-                
-                # Remove the c() wrapper if present
-                value = value.strip()
-                if value.startswith('c(') and value.endswith(')'):
-                    value = value[2:-1]
-                
-                # Use a regex that matches complete URLs, including those with commas
-                url_pattern = r'"([^"]+)"'
-                found_urls = re.findall(url_pattern, value)
-                
-                # Clean and filter URLs
-                urls = [url for url in found_urls if url.startswith('http')]
-                
-                # Limit to 10 images
-                urls = urls[:10]
-                
-                if not urls:
-                    self.stdout.write(self.style.WARNING(f'No valid URLs found in: {value[:100]}...'))
-                elif len(urls) > 10:
-                    self.stdout.write(self.style.WARNING(f'Limited recipe images to 10 (had {len(urls)} images)'))
-                
-                return urls
-            
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'Error parsing image URLs: {str(e)}'))
-                return []
-        
-        return []
+                    with connection.execute_wrapper(counter):
+                        if dry_run:
+                            counts, batch_ids = self._plan_batch(payloads, skipped_ids)
+                            committed = False
+                        else:
+                            counts, batch_ids, committed = self._process_batch(payloads, skipped_ids)
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f'Error processing batch: {str(e)}'))
+                    complete = False
+                    continue
+                seconds = time.monotonic() - batch_started
+
+                matched_ids |= batch_ids
+                recipes = counts['new'] + counts['changed'] + counts['unchanged']
+                failures = row_count - recipes
+                if committed:
+                    journal.record(row_offset, row_count, recipes, failures, counter.count, seconds)
+                elif not dry_run:
+                    self.stdout.write(self.style.WARNING('Batch not recorded in the journal; --resume will retry it'))
+                counts.update(rows=row_count, failures=failures, queries=counter.count)
+                for key, value in counts.items():
+                    totals[key] += value
+                self.stdout.write(
+                    f'Batch done: {counts["new"]} new, {counts["changed"]} changed, {counts["unchanged"]} unchanged, '
+                    f'{failures} failures, {counter.count} queries, {row_count / seconds if seconds else 0:.0f} rows/s'
+                )
 
-    def safe_decimal(self, value, default=Decimal('0.0')):
-        """
-        Safely convert a value to a Decimal.
-        """
-        if pd.isna(value) or value == 'nan':
-            return default
+            if rows_read == 0:
+                self.stdout.write(self.style.ERROR('No data found in the file'))
+                return
 
-        try:
-            # Handle different types of input
-            if isinstance(value, (int, float)):
-                # Convert float to string with fixed precision to avoid scientific notation
-                value = f"{value:.10f}"
-            elif isinstance(value, str):
-                # Clean up the string
-                value = value.strip()
-                # Remove any scientific notation
-                if 'e' in value.lower():
-                    value = f"{float(value):.10f}"
+            elapsed = time.monotonic() - started
+            summary = (
+                f'{rows_read} rows read, {totals["rows"]} processed, {totals["new"]} new, '
+                f'{totals["changed"]} changed, {totals["unchanged"]} unchanged'
+            )
+            # Recipes missing from the file can only be counted when every batch was read
+            if complete:
+                summary += f', {Recipe.objects.count() - len(matched_ids)} deleted'
+            summary += (
+                f', {totals["failures"]} failures, {totals["queries"]} queries, '
+                f'{totals["rows"] / elapsed if elapsed else 0:.0f} rows/s'
+            )
+            if dry_run:
+                self.stdout.write(self.style.SUCCESS(f'Dry run completed, nothing was written ({summary})'))
             else:
-                value = str(value)
-
-            # Try to convert to Decimal
-            try:
-                decimal_value = Decimal(value)
-            except InvalidOperation:
-                # If direct conversion fails, try to clean the string
-                cleaned_value = re.sub(r'[^\d.-]', '', value)
-                if not cleaned_value:
-                    return default
-                decimal_value = Decimal(cleaned_value)
-
-            # Handle infinity and NaN
-            if decimal_value in (Decimal('Infinity'), Decimal('-Infinity'), Decimal('NaN')):
-                return default
-
-            # Ensure the value is within valid range for database
-            if decimal_value > Decimal('999999.9'):
-                return Decimal('999999.9')
-            if decimal_value < Decimal('-999999.9'):
-                return Decimal('-999999.9')
-
-            # Round to 1 decimal place
-            return decimal_value.quantize(Decimal('0.1'), rounding=ROUND_HALF_UP)
+                if totals['new'] or totals['changed']:
+                    # New ingredient names and popularities reach the suggestions
+                    bump_ingredient_version()
+                self.stdout.write(self.style.SUCCESS(f'Recipe import completed ({summary})'))
 
         except Exception as e:
-            self.stdout.write(self.style.WARNING(f'Error converting value to decimal: {value} ({type(value)}): {str(e)}'))
-            return default
+            self.stdout.write(self.style.ERROR(f'Error reading file: {str(e)}'))
+            import traceback
+            self.stdout.write(traceback.format_exc())
+        finally:
+            if journal is not None:
+                journal.close()
 
-    def safe_int(self, value, default=0):
+    def _iter_parsed(self, batches, workers, skip_offsets=()):
         """
-        Safely convert a value to an integer.
+        Yield ``(row_offset, row_count, parse_batch result)`` for every batch, in file order.
+
+        Batches whose offset is in ``skip_offsets`` are not parsed and are
+        yielded with ``None`` instead of a result; a batch that fails to parse
+        (e.g. a missing column) is yielded with the exception. With workers, batches are
+        parsed in a process pool while the caller writes earlier batches. At
+        most two batches per worker are in flight so memory stays bounded.
         """
-        if pd.isna(value) or value == 'nan':
-            return default
-        try:
-            # Convert to float first to handle decimal strings
-            float_val = float(value)
-            # Round to nearest integer
-            return round(float_val)
-        except (ValueError, TypeError):
-            return default
+        parse = partial(parse_batch, tz_name=timezone.get_default_timezone_name())
 
-    def handle(self, *args, **options):
-        file_path = options['file_path']
-        batch_size = options['batch_size']
-        chunk_size = options['chunk_size']
-        
-        self.stdout.write(f'Importing recipes from {file_path}...')
-        self.stdout.write(f'Using batch size: {batch_size}, chunk size: {chunk_size}')
+        def result(parse_call):
+            try:
+                return parse_call()
+            except Exception as e:
+                return e
 
-        # Check if file exists
-        if not os.path.exists(file_path):
-            self.stdout.write(self.style.ERROR(f'File not found: {file_path}'))
-            return
+        def offsets():
+            row_offset = 0
+            for batch_df in batches:
+                yield row_offset, batch_df
+                row_offset += len(batch_df)
 
-        try:
-            # First, try to read the file info
-            self.stdout.write('Reading Excel file information...')
-            xl = pd.ExcelFile(file_path)
-            sheet_names = xl.sheet_names
-            self.stdout.write(f'Using sheet: {sheet_names[0]}')
-
-            # Get total number of rows
-            total_rows = len(pd.read_excel(file_path, sheet_name=sheet_names[0]))
-            self.stdout.write(f'Total rows to process: {total_rows}')
-
-            if total_rows == 0:
-                self.stdout.write(self.style.ERROR('No data found in the Excel file'))
-                return
+        if not workers:
+            for row_offset, batch_df in offsets():
+                if batch_df.empty:
+                    continue
+                skip = row_offset in skip_offsets
+                yield row_offset, len(batch_df), None if skip else result(lambda: parse(batch_df))
+            return
 
-            # Process the Excel file in chunks
-            for chunk_start in range(0, total_rows, chunk_size):
-                chunk_end = min(chunk_start + chunk_size, total_rows)
-                self.stdout.write(f'Processing rows {chunk_start} to {chunk_end}...')
-                
-                df = pd.read_excel(
-                    file_path,
-                    sheet_name=sheet_names[0],
-                    skiprows=chunk_start,
-                    nrows=chunk_size
-                )
-                
-                if df.empty:
-                    self.stdout.write(self.style.WARNING(f'No data found in chunk {chunk_start}-{chunk_end}'))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for row_offset, batch_df in offsets():
+                if batch_df.empty:
                     continue
+                skip = row_offset in skip_offsets
+                pending.append((row_offset, len(batch_df), None if skip else executor.submit(parse, batch_df)))
+                if len(pending) >= workers * 2:
+                    row_offset, row_count, future = pending.popleft()
+                    yield row_offset, row_count, future and result(future.result)
 
-                # Process recipes in batches
-                for i in range(0, len(df), batch_size):
-                    batch_df = df.iloc[i:i + batch_size]
-                    try:
-                        self._process_batch(batch_df)
-                    except Exception as e:
-                        self.stdout.write(self.style.ERROR(f'Error processing batch: {str(e)}'))
-                        continue
+            while pending:
+                row_offset, row_count, future = pending.popleft()
+                yield row_offset, row_count, future and result(future.result)
 
-            self.stdout.write(self.style.SUCCESS('Recipe import completed'))
+    def _classify(self, payloads, skipped_ids=()):
+        """
+        Split deduplicated payloads by comparing their hash with the stored one.
 
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Error reading file: {str(e)}'))
-            import traceback
-            self.stdout.write(traceback.format_exc())
+        ``skipped_ids`` (recipe_ids of rows the parse stage skipped) are looked
+        up in the same query, so stored recipes kept by the file are known.
+
+        Returns:
+            tuple: (recipe_id -> pk of existing recipes, skipped ones included,
+                new payloads, changed payloads, unchanged payloads)
+        """
+        existing = {}
+        stored_hashes = {}
+        for recipe_id, pk, content_hash in Recipe.objects.filter(
+            recipe_id__in=[payload.fields[0] for payload in payloads] + list(skipped_ids)
+        ).values_list('recipe_id', 'id', 'content_hash'):
+            existing[recipe_id] = pk
+            stored_hashes[recipe_id] = content_hash
+
+        new, changed, unchanged = [], [], []
+        for payload in payloads:
+            recipe_id = payload.fields[0]
+            if recipe_id not in existing:
+                new.append(payload)
+            elif stored_hashes[recipe_id] != payload.content_hash:
+                changed.append(payload)
+            else:
+                unchanged.append(payload)
+        return existing, new, changed, unchanged
+
+    def _plan_batch(self, payloads, skipped_ids=()):
+        """Classify a batch without writing; return ``(counts, recipe_ids found in the database)``."""
+        payloads = list({payload.fields[0]: payload for payload in payloads}.values())
+        existing, new, changed, unchanged = self._classify(payloads, skipped_ids)
+        counts = {'new': len(new), 'changed': len(changed), 'unchanged': len(unchanged)}
+        return counts, set(existing)
+
+    def _process_batch(self, payloads, skipped_ids=()):
+        """
+        Write the new and changed payloads of a batch.
+
+        Returns:
+            tuple: (counts of new, changed and unchanged recipes stored,
+                recipe_ids of the batch found in the database afterwards,
+                whether the related data of the batch was committed)
+        """
+        # Get all recipe IDs in this batch (the last row wins for duplicates)
+        payloads = list({payload.fields[0]: payload for payload in payloads}.values())
+        existing, new, changed, unchanged = self._classify(payloads, skipped_ids)
+        counts = {'new': 0, 'changed': 0, 'unchanged': len(unchanged)}
+        # Skipped rows are left as stored, not deleted
+        stored_ids = {payload.fields[0] for payload in unchanged} | (set(skipped_ids) & set(existing))
 
-    def _process_batch(self, batch_df):
-        # Get all recipe IDs in this batch
-        recipe_ids = batch_df['RecipeId'].tolist()
-        
-        # Get existing recipes
-        existing_recipes = {
-            recipe.recipe_id: recipe 
-            for recipe in Recipe.objects.filter(recipe_id__in=recipe_ids)
-        }
-        
         # Prepare bulk create/update data
-        recipes_to_create = []
-        recipes_to_update = []
-        
-        for _, row in batch_df.iterrows():
-            try:
-                # Skip recipes with invalid values
-                for field in ['AggregatedRating', 'Calories', 'FatContent', 'SaturatedFatContent', 
-                            'CholesterolContent', 'SodiumContent', 'CarbohydrateContent', 
-                            'FiberContent', 'SugarContent', 'ProteinContent']:
-                    if pd.notna(row[field]):
-                        try:
-                            decimal_value = self.safe_decimal(row[field])
-                            if decimal_value in (Decimal('Infinity'), Decimal('-Infinity'), Decimal('NaN')):
-                                self.stdout.write(self.style.WARNING(f'Skipping recipe {row.get("Name", "Unknown")} - invalid value for {field}'))
-                                continue
-                        except Exception:
-                            self.stdout.write(self.style.WARNING(f'Skipping recipe {row.get("Name", "Unknown")} - invalid value for {field}'))
-                            continue
-
-                recipe_data = {
-                    'recipe_id': row['RecipeId'],
-                    'name': row['Name'],
-                    'cook_time': self.parse_duration(row['CookTime']),
-                    'prep_time': self.parse_duration(row['PrepTime']),
-                    'total_time': self.parse_duration(row['TotalTime']),
-                    'date_published': timezone.make_aware(pd.to_datetime(row['DatePublished'])),
-                    'description': row['description'],
-                    'recipe_category': row['RecipeCategory'],
-                    'aggregated_rating': self.safe_decimal(row['AggregatedRating'], Decimal('0.0')),
-                    'review_count': self.safe_int(row['ReviewCount'], 0),
-                    'calories': self.safe_decimal(row['Calories'], Decimal('0.0')),
-                    'fat_content': self.safe_decimal(row['FatContent'], Decimal('0.0')),
-                    'saturated_fat_content': self.safe_decimal(row['SaturatedFatContent'], Decimal('0.0')),
-                    'cholesterol_content': self.safe_decimal(row['CholesterolContent'], Decimal('0.0')),
-                    'sodium_content': self.safe_decimal(row['SodiumContent'], Decimal('0.0')),
-                    'carbohydrate_content': self.safe_decimal(row['CarbohydrateContent'], Decimal('0.0')),
-                    'fiber_content': self.safe_decimal(row['FiberContent'], Decimal('0.0')),
-                    'sugar_content': self.safe_decimal(row['SugarContent'], Decimal('0.0')),
-                    'protein_content': self.safe_decimal(row['ProteinContent'], Decimal('0.0')),
-                    'serving_size': row['serving_size'],
-                    'servings': self.safe_int(row['servings'], 1),
-                }
-                
-                # Skip recipes that don't have either prep_time or cook_time
-                if not recipe_data['prep_time'] and not recipe_data['cook_time']:
-                    self.stdout.write(self.style.WARNING(f'Skipping recipe {row.get("Name", "Unknown")} - missing both prep_time and cook_time'))
-                    continue
-                
-                if row['RecipeId'] in existing_recipes:
-                    recipe = existing_recipes[row['RecipeId']]
-                    for key, value in recipe_data.items():
-                        setattr(recipe, key, value)
-                    recipes_to_update.append(recipe)
-                else:
-                    recipes_to_create.append(Recipe(**recipe_data))
-            except Exception as e:
-                self.stdout.write(self.style.WARNING(f'Skipping recipe {row.get("Name", "Unknown")} - error: {str(e)}'))
-                continue
-        
+        recipes_to_create = [
+            Recipe(**dict(zip(RECIPE_FIELDS, payload.fields)), content_hash=payload.content_hash)
+            for payload in new
+        ]
+        updated_at = timezone.now()
+        recipes_to_update = [
+            Recipe(
+                id=existing[payload.fields[0]],
+                **dict(zip(RECIPE_FIELDS, payload.fields)),
+                content_hash=payload.content_hash,
+                updated_at=updated_at,
+            )
+            for payload in changed
+        ]
+
         # Bulk create new recipes
         if recipes_to_create:
             try:
@@ -356,165 +308,86 @@ class Command(BaseCommand):
                             recipe.save()
                     except Exception as e:
                         self.stdout.write(self.style.WARNING(f'Error creating recipe {recipe.name}: {str(e)}'))
-        
-        # Bulk update existing recipes
+
+        # Bulk update changed recipes
         if recipes_to_update:
             try:
                 with transaction.atomic():
-                    Recipe.objects.bulk_update(
-                        recipes_to_update,
-                        [field.name for field in Recipe._meta.fields if field.name != 'id']
-                    )
+                    Recipe.objects.bulk_update(recipes_to_update, UPDATE_FIELDS)
             except Exception as e:
                 self.stdout.write(self.style.ERROR(f'Error during bulk update: {str(e)}'))
                 # Try updating recipes one by one
                 for recipe in recipes_to_update:
                     try:
                         with transaction.atomic():
-                            recipe.save()
+                            recipe.save(update_fields=UPDATE_FIELDS)
                     except Exception as e:
                         self.stdout.write(self.style.WARNING(f'Error updating recipe {recipe.name}: {str(e)}'))
-        
-        # Get all recipes (both new and updated) for this batch
+
+        payloads = new + changed
+        if not payloads:
+            return counts, stored_ids, True
+
+        # Get the ids of the new and changed recipes that made it to the database
         all_recipes = {
-            recipe.recipe_id: recipe 
-            for recipe in Recipe.objects.filter(recipe_id__in=recipe_ids)
+            recipe_id: pk
+            for recipe_id, pk in Recipe.objects.filter(
+                recipe_id__in=[payload.fields[0] for payload in payloads]
+            ).values_list('recipe_id', 'id')
         }
-        
-        # Process steps, ingredients, tags, and images for each recipe
-        for _, row in batch_df.iterrows():
-            try:
-                recipe = all_recipes[row['RecipeId']]
-                
-                # Process steps
-                def parse_list(value):
-                    if isinstance(value, str):
-                        try:
-                            return json.loads(value)
-                        except json.JSONDecodeError:
-                            # If it's not valid JSON, try to evaluate it as a Python literal
-                            try:
-                                return eval(value)
-                            except:
-                                return []
-                    return value
-
-                # Process steps
-                try:
-                    with transaction.atomic():
-                        steps = parse_list(row['steps'])
-                        RecipeStep.objects.filter(recipe=recipe).delete()
-                        steps_to_create = [
-                            RecipeStep(
-                                recipe=recipe,
-                                step_number=i,
-                                description=step,
-                                order=i
-                            )
-                            for i, step in enumerate(steps, 1)
-                        ]
-                        RecipeStep.objects.bulk_create(steps_to_create)
-                except Exception as e:
-                    self.stdout.write(self.style.WARNING(f'Error processing steps for recipe {recipe.name}: {str(e)}'))
-                
-                # Process ingredients
-                try:
-                    with transaction.atomic():
-                        ingredients = parse_list(row['ingredients'])
-                        raw_ingredients = parse_list(row['ingredients_raw_str'])
-                        
-                        # Get or create ingredients in bulk
-                        ingredient_names = [name.lower() for name in ingredients]
-                        existing_ingredients = {
-                            ing.name: ing 
-                            for ing in Ingredient.objects.filter(name__in=ingredient_names)
-                        }
-                        
-                        # Create ingredients one by one to handle duplicates
-                        for name in ingredient_names:
-                            if name not in existing_ingredients:
-                                try:
-                                    ingredient = Ingredient.objects.create(name=name)
-                                    existing_ingredients[name] = ingredient
-                                except Exception as e:
-                                    self.stdout.write(self.style.WARNING(f'Error creating ingredient {name}: {e}'))
-                                    continue
-                        
-                        # Create recipe ingredients
-                        RecipeIngredient.objects.filter(recipe=recipe).delete()
-                        recipe_ingredients_to_create = []
-                        for ingredient_name, raw_string in zip(ingredients, raw_ingredients):
-                            try:
-                                ingredient = existing_ingredients[ingredient_name.lower()]
-                                parsed = self.parse_ingredient(raw_string)
-                                
-                                recipe_ingredients_to_create.append(
-                                    RecipeIngredient(
-                                        recipe=recipe,
-                                        ingredient=ingredient,
-                                        raw_string=raw_string,
-                                        amount=parsed['amount'],
-                                        unit=parsed['unit'],
-                                        notes=parsed['name']
-                                    )
-                                )
-                            except Exception as e:
-                                self.stdout.write(self.style.WARNING(f'Error processing ingredient {ingredient_name}: {e}'))
-                                continue
-                        
-                        RecipeIngredient.objects.bulk_create(recipe_ingredients_to_create)
-                except Exception as e:
-                    self.stdout.write(self.style.WARNING(f'Error processing ingredients for recipe {recipe.name}: {str(e)}'))
-                
-                # Process tags
-                try:
-                    with transaction.atomic():
-                        tags = parse_list(row['tags'])
-                        tag_names = [name.lower() for name in tags]
-                        
-                        # Get or create tags in bulk
-                        existing_tags = {
-                            tag.name: tag 
-                            for tag in Tag.objects.filter(name__in=tag_names)
-                        }
-                        
-                        # Create tags one by one to handle duplicates
-                        for name in tag_names:
-                            if name not in existing_tags:
-                                try:
-                                    tag = Tag.objects.create(name=name)
-                                    existing_tags[name] = tag
-                                except Exception as e:
-                                    self.stdout.write(self.style.WARNING(f'Error creating tag {name}: {e}'))
-                                    continue
-                        
-                        # Create recipe tags
-                        RecipeTag.objects.filter(recipe=recipe).delete()
-                        recipe_tags_to_create = [
-                            RecipeTag(recipe=recipe, tag=existing_tags[name.lower()])
-                            for name in tags
-                        ]
-                        RecipeTag.objects.bulk_create(recipe_tags_to_create)
-                except Exception as e:
-                    self.stdout.write(self.style.WARNING(f'Error processing tags for recipe {recipe.name}: {str(e)}'))
-                
-                # Process images
-                try:
-                    with transaction.atomic():
-                        RecipeImage.objects.filter(recipe=recipe).delete()
-                        image_urls = self.parse_images(row['Images'])
-                        images_to_create = [
-                            RecipeImage(
-                                recipe=recipe,
-                                url=url,
-                                order=i
-                            )
-                            for i, url in enumerate(image_urls)
-                        ]
-                        RecipeImage.objects.bulk_create(images_to_create)
-                except Exception as e:
-                    self.stdout.write(self.style.WARNING(f'Error processing images for recipe {recipe.name}: {str(e)}'))
-
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'Error processing related data for recipe {row.get("Name", "Unknown")}: {str(e)}'))
-                continue
\ No newline at end of file
+        payloads = [payload for payload in payloads if payload.fields[0] in all_recipes]
+
+        # Make sure every ingredient and tag of the batch has an id
+        existing_ingredients = self._resolve_names(
+            Ingredient, {ingredient[0] for payload in payloads for ingredient in payload.ingredients}
+        )
+        existing_tags = self._resolve_names(Tag, {tag for payload in payloads for tag in payload.tags})
+
+        children = {}
+        documents = {}
+        for payload in payloads:
+            recipe_ingredients = []
+            for ingredient_name, raw_string, amount, unit, notes in payload.ingredients:
+                ingredient_id = existing_ingredients.get(ingredient_name)
+                if ingredient_id is None:
+                    self.stdout.write(self.style.WARNING(f'Error processing ingredient {ingredient_name} for recipe {payload.fields[1]}'))
+                    continue
+                recipe_ingredients.append((ingredient_id, raw_string, amount, unit, notes))
+
+            recipe_tags = [existing_tags.get(tag) for tag in payload.tags if tag in existing_tags]
+            children[all_recipes[payload.fields[0]]] = build_children(payload.steps, recipe_ingredients, recipe_tags, payload.images)
+            fields = dict(zip(RECIPE_FIELDS, payload.fields))
+            documents[all_recipes[payload.fields[0]]] = SearchText(
+                fields['name'], fields['description'], fields['recipe_category'],
+                [ingredient[0] for ingredient in payload.ingredients], payload.tags,
+                fields['aggregated_rating'], fields['review_count'],
+            )
+
+        # Replace steps, ingredients, tags and images for the whole batch at once,
+        # together with the search index entries of the batch
+        try:
+            with transaction.atomic():
+                stats = sync_children(children, diff=self.diff_children)
+                index_documents(documents)
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Error processing related data for batch: {str(e)}'))
+            # Forget the hashes so the next import rewrites these recipes
+            Recipe.objects.filter(id__in=list(children)).update(content_hash=None)
+            return counts, stored_ids | set(all_recipes), False
+
+        if stats['carousel_items']:
+            # Featured images of the batch were replaced, with their carousel items
+            bump_carousel_version()
+        if self.diff_children:
+            self.stdout.write(f'Updated related data for {stats["recipes"]} of {len(children)} recipes')
+        for payload in payloads:
+            counts['changed' if payload.fields[0] in existing else 'new'] += 1
+        return counts, stored_ids | set(all_recipes), True
+
+    def _resolve_names(self, model, names):
+        """Return the shared name -> id dictionary for ``model`` after adding ``names``."""
+        vocabulary = get_vocabulary(model)
+        rejected = vocabulary.resolve(names)
+        for name in sorted(rejected):
+            self.stdout.write(self.style.WARNING(f'Error creating {model._meta.verbose_name} {name[:100]}'))
+        return vocabulary
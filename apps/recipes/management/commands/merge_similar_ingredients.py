@@ -4,6 +4,7 @@ from django.db import transaction
 from django.db.models import Count
 from rapidfuzz import process, fuzz
 from ...models import Ingredient, RecipeIngredient
+from ...search.index import index_recipes_using
 from tqdm import tqdm
 
 class Command(BaseCommand):
@@ -141,6 +142,9 @@ class Command(BaseCommand):
                             f"updated {updated} recipes"
                         )
 
+                    # Recipes of the merged ingredients now use the primary one
+                    index_recipes_using(ingredient_ids=[primary.id])
+
             except Exception as e:
                 self.stdout.write(
                     self.style.ERROR(
@@ -0,0 +1,68 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ...models import Recipe, SearchDocument, SearchPosting, SearchTerm
+from ...search.index import index_recipes, iter_recipe_pks, iter_stale_recipe_pks, rebuild_term_frequencies
+from ...search.query import clear_index_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of all recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of recipes indexed per transaction')
+        parser.add_argument('--keep', action='store_true', help='Ignored; recipes are always re-indexed in place unless --clear is given')
+        parser.add_argument('--clear', action='store_true', help='Empty the index first; searches miss recipes until the rebuild finishes')
+        parser.add_argument('--stale', action='store_true', help='Only re-index recipes flagged as stale by ingredient and tag renames')
+        parser.add_argument('--terms', action='store_true', help='Only recount the recipes per term used by typo correction')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        if options['stale']:
+            self._index_stale(batch_size)
+            return
+        if options['terms']:
+            rebuild_term_frequencies()
+            clear_index_stats()
+            self.stdout.write(self.style.SUCCESS(f'Term frequencies recounted ({SearchTerm.objects.count()} terms)'))
+            return
+
+        if options['clear']:
+            self.stdout.write('Clearing the search index...')
+            SearchPosting.objects.all().delete()
+            SearchDocument.objects.all().delete()
+            SearchTerm.objects.all().delete()
+
+        total = Recipe.objects.count()
+        indexed = 0
+        started = time.monotonic()
+        # Each batch replaces its recipes' entries atomically, so searches keep
+        # finding every recipe while the index is rebuilt
+        for recipe_pks in iter_recipe_pks(batch_size):
+            with transaction.atomic():
+                index_recipes(recipe_pks)
+            indexed += len(recipe_pks)
+            self.stdout.write(f'Indexed {indexed} of {total} recipes')
+        # Drop the terms no recipe has any more, e.g. after cascade deletes
+        rebuild_term_frequencies()
+        clear_index_stats()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Search index rebuilt ({indexed} recipes, {SearchPosting.objects.count()} postings, '
+            f'{indexed / elapsed if elapsed else 0:.0f} recipes/s)'
+        ))
+
+    def _index_stale(self, batch_size):
+        indexed = 0
+        for recipe_pks in iter_stale_recipe_pks(batch_size):
+            index_recipes(recipe_pks)
+            indexed += len(recipe_pks)
+            self.stdout.write(f'Indexed {indexed} stale recipes')
+        clear_index_stats()
+        self.stdout.write(self.style.SUCCESS(f'Stale search documents re-indexed ({indexed} recipes)'))
@@ -0,0 +1,115 @@
+import asyncio
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+
+from ...carousel import bump_carousel_version
+from ...image_checks import ImageVerifier
+from ...db import LOOKUP_CHUNK_SIZE
+from ...models import RecipeImage
+
+
+class Command(BaseCommand):
+    help = 'Check recipe image URLs concurrently and store whether they are accessible'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of images loaded and saved at a time')
+        parser.add_argument('--concurrency', type=int, default=32, help='Maximum number of requests in flight')
+        parser.add_argument('--per-host', type=int, default=4, help='Maximum number of requests in flight per host')
+        parser.add_argument('--rate', type=float, default=10, help='Maximum requests per second per host (0 disables the limit)')
+        parser.add_argument('--timeout', type=float, default=10, help='Timeout in seconds for each request')
+        parser.add_argument('--recheck-days', type=float, default=30, help='Recheck images last checked more than this many days ago')
+        parser.add_argument('--limit', type=int, default=None, help='Stop after checking this many images')
+
+    def handle(self, *args, **options):
+        for name in ('batch_size', 'concurrency', 'per_host'):
+            if options[name] < 1:
+                raise CommandError(f'--{name.replace("_", "-")} must be at least 1')
+
+        cutoff = timezone.now() - timedelta(days=options['recheck_days'])
+        self.stdout.write(f'Checking images not checked since {cutoff:%Y-%m-%d %H:%M}...')
+
+        started = time.monotonic()
+        totals = self._run(cutoff, options)
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Image check completed ({totals["checked"]} checked, {totals["accessible"]} accessible, '
+            f'{totals["inaccessible"]} inaccessible, {totals["inconclusive"]} to retry, '
+            f'{totals["checked"] / elapsed if elapsed else 0:.0f} images/s)'
+        ))
+
+    def _run(self, cutoff, options):
+        """
+        Check due images batch by batch.
+
+        Database work stays on this thread; only the HTTP checks run on the
+        event loop, which is kept for the whole run so the session and its
+        open connections are reused from one batch to the next.
+
+        Inconclusive checks (timeouts, rate limiting, server errors) are not
+        saved, so those images stay due and are checked again on the next run.
+        """
+        totals = {'checked': 0, 'accessible': 0, 'inaccessible': 0, 'inconclusive': 0}
+        limit = options['limit']
+        last_id = 0
+
+        verifier = ImageVerifier(
+            concurrency=options['concurrency'],
+            per_host=options['per_host'],
+            rate=options['rate'] or None,
+            timeout=options['timeout'],
+        )
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(verifier.__aenter__())
+            while limit is None or totals['checked'] < limit:
+                batch_size = options['batch_size']
+                if limit is not None:
+                    batch_size = min(batch_size, limit - totals['checked'])
+                images = self._next_batch(cutoff, last_id, batch_size)
+                if not images:
+                    break
+                last_id = images[-1][0]
+
+                results = loop.run_until_complete(verifier.check(url for _, url in images))
+                accessible = [pk for pk, url in images if results[url].ok is True]
+                inaccessible = [pk for pk, url in images if results[url].ok is False]
+                self._save_results(accessible, inaccessible)
+
+                inconclusive = len(images) - len(accessible) - len(inaccessible)
+                totals['checked'] += len(images)
+                totals['accessible'] += len(accessible)
+                totals['inaccessible'] += len(inaccessible)
+                totals['inconclusive'] += inconclusive
+                self.stdout.write(
+                    f'Checked {totals["checked"]} images ({len(accessible)} accessible, '
+                    f'{len(inaccessible)} inaccessible, {inconclusive} to retry in this batch)'
+                )
+        finally:
+            loop.run_until_complete(verifier.__aexit__(None, None, None))
+            loop.close()
+        return totals
+
+    def _next_batch(self, cutoff, last_id, batch_size):
+        """Return ``(id, url)`` of the next images due for a check, in id order."""
+        return list(
+            RecipeImage.objects
+            .filter(Q(last_checked__isnull=True) | Q(last_checked__lt=cutoff), id__gt=last_id)
+            .order_by('id')
+            .values_list('id', 'url')[:batch_size]
+        )
+
+    def _save_results(self, accessible, inaccessible):
+        """Store the results with one UPDATE per status and id chunk."""
+        checked_at = timezone.now()
+        for status, ids in ((RecipeImage.STATUS_ACCESSIBLE, accessible), (RecipeImage.STATUS_INACCESSIBLE, inaccessible)):
+            for start in range(0, len(ids), LOOKUP_CHUNK_SIZE):
+                RecipeImage.objects.filter(id__in=ids[start:start + LOOKUP_CHUNK_SIZE]).update(
+                    status=status, last_checked=checked_at
+                )
+        # The carousel skips inaccessible images
+        bump_carousel_version()
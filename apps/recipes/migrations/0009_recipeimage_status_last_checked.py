@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_userrecipecollection'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipeimage',
+            name='last_checked',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipeimage',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending Verification'), ('accessible', 'Accessible'), ('inaccessible', 'Inaccessible')], default='pending', max_length=20),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-18 10:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipe_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchdocument',
+            name='boost',
+            field=models.FloatField(default=1.0),
+        ),
+        migrations.AddField(
+            model_name='searchposting',
+            name='boost',
+            field=models.FloatField(default=1.0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_search_quality_boost'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchdocument',
+            name='stale',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+    ]
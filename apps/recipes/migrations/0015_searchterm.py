@@ -0,0 +1,34 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:10
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_terms(apps, schema_editor):
+    SearchPosting = apps.get_model('recipes', 'SearchPosting')
+    SearchTerm = apps.get_model('recipes', 'SearchTerm')
+    SearchTerm.objects.bulk_create(
+        (
+            SearchTerm(term=term, df=df)
+            for term, df in SearchPosting.objects.values_list('term').annotate(df=Count('recipe_id')).order_by()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_searchdocument_stale'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('term', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('df', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_terms, migrations.RunPython.noop),
+    ]
@@ -30,9 +30,19 @@ class Recipe(models.Model):
     protein_content = models.DecimalField(max_digits=6, decimal_places=1)
     serving_size = models.CharField(max_length=50)
     servings = models.IntegerField()
+    # Hash of the imported payload, used by import_recipes to skip unchanged recipes
+    content_hash = models.CharField(max_length=64, null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Keyset pagination of the search sorts seeks (key, id)
+        indexes = [
+            models.Index(fields=['total_time', 'id'], name='recipe_total_time_id_idx'),
+            models.Index(fields=['aggregated_rating', 'id'], name='recipe_rating_id_idx'),
+            models.Index(fields=['created_at', 'id'], name='recipe_created_at_id_idx'),
+        ]
+
     def clean(self):
         if not self.prep_time and not self.cook_time:
             raise ValidationError({
@@ -47,10 +57,29 @@ class Recipe(models.Model):
     def __str__(self):
         return self.name
 
+    @property
+    def card_image(self):
+        """First image not known to be broken (uses prefetched images when available)."""
+        for image in self.images.all():
+            if image.status != RecipeImage.STATUS_INACCESSIBLE:
+                return image
+        return None
+
 class RecipeImage(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_ACCESSIBLE = 'accessible'
+    STATUS_INACCESSIBLE = 'inaccessible'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending Verification'),
+        (STATUS_ACCESSIBLE, 'Accessible'),
+        (STATUS_INACCESSIBLE, 'Inaccessible'),
+    ]
+
     recipe = models.ForeignKey(Recipe, related_name='images', on_delete=models.CASCADE)
     url = models.URLField(max_length=500)
     order = models.IntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    last_checked = models.DateTimeField(null=True, blank=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -165,3 +194,47 @@ class UserRecipeCollection(models.Model):
 
     def __str__(self):
         return f"{self.user.username}'s collection - {self.recipe.name}"
+
+class SearchDocument(models.Model):
+    """Per-recipe statistics of the full-text search index."""
+    recipe = models.OneToOneField(Recipe, primary_key=True, on_delete=models.CASCADE, related_name='search_document')
+    length = models.FloatField()  # Weighted number of indexed tokens
+    boost = models.FloatField(default=1.0)  # Quality factor of the text score (rating and reviews)
+    stale = models.BooleanField(default=False, db_index=True)  # Awaiting `rebuild_search_index --stale`
+
+    def __str__(self):
+        return f"{self.recipe_id} - {self.length:g} tokens"
+
+class SearchPosting(models.Model):
+    """One term of the full-text search index and its weighted frequency in a recipe."""
+    term = models.CharField(max_length=64)
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='search_postings')
+    weight = models.FloatField()
+    length = models.FloatField()  # Copy of SearchDocument.length so ranking needs no join
+    boost = models.FloatField(default=1.0)  # Copy of SearchDocument.boost
+
+    class Meta:
+        unique_together = ['term', 'recipe']
+
+    def __str__(self):
+        return f"{self.term} - {self.recipe_id}"
+
+class SearchTerm(models.Model):
+    """A term of the full-text search index and the number of recipes containing it."""
+    term = models.CharField(max_length=64, primary_key=True)
+    df = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.term} - {self.df} recipes"
+
+class CoverageChange(models.Model):
+    """
+    A recipe whose ingredients changed after the pantry coverage index was
+    built; workers patch their copy from these rows. A row without a recipe
+    makes every worker rebuild its index.
+    """
+    recipe_id = models.BigIntegerField(null=True)  # Not a foreign key: deleted recipes are recorded too
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.id} - {self.recipe_id if self.recipe_id is not None else 'rebuild'}"
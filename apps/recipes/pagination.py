@@ -0,0 +1,243 @@
+"""
+Keyset pagination for recipe listings.
+
+Pages are addressed by opaque cursors instead of page numbers. A cursor
+holds the sort key and id of the last (or first) row of a page, and the
+next page is fetched with a ``WHERE (key, id) > (value, pk)`` condition.
+The database can then seek an index instead of scanning past an OFFSET,
+so deep pages cost the same as the first one.
+
+Rows are ordered by one key and then by ascending ``id``. NULL keys sort
+last in both directions.
+"""
+import math
+from collections import namedtuple
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.core import signing
+from django.db.models import F, Q
+
+DEFAULT_PAGE_SIZE = 35
+MAX_PAGE_SIZE = 100
+
+CURSOR_SALT = 'apps.recipes.pagination'
+
+# One page of a listing; cursors are None at either end
+Page = namedtuple('Page', ['items', 'next_cursor', 'previous_cursor'])
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def page_size_from(value, default=DEFAULT_PAGE_SIZE):
+    """Parse a requested page size, clamped to ``1..MAX_PAGE_SIZE``."""
+    try:
+        page_size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+
+def _dump(value):
+    if isinstance(value, timedelta):
+        return ['timedelta', value // timedelta(microseconds=1)]
+    if isinstance(value, Decimal):
+        return ['decimal', str(value)]
+    if isinstance(value, datetime):
+        return ['datetime', value.isoformat()]
+    return value
+
+
+def _load(value):
+    if not isinstance(value, list):
+        return value
+    kind, raw = value
+    if kind == 'timedelta':
+        return timedelta(microseconds=raw)
+    if kind == 'decimal':
+        return Decimal(raw)
+    if kind == 'datetime':
+        return datetime.fromisoformat(raw)
+    raise InvalidCursor(f'Unknown cursor value type {kind}')
+
+
+def encode_cursor(ordering, value, pk, backwards=False):
+    """
+    Build a cursor pointing after (or, ``backwards``, before) a row.
+
+    Args:
+        ordering (str): Name of the listing order the cursor belongs to.
+        value: Sort key of the row.
+        pk (int): Id of the row.
+    """
+    return signing.dumps([ordering, _dump(value), pk, backwards], salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(cursor, ordering):
+    """
+    Read a cursor built by ``encode_cursor`` for ``ordering``.
+
+    Returns:
+        tuple: (value, pk, backwards)
+
+    Raises:
+        InvalidCursor: The cursor is malformed, tampered with or belongs to another order.
+    """
+    try:
+        cursor_ordering, value, pk, backwards = signing.loads(cursor, salt=CURSOR_SALT)
+    except (signing.BadSignature, TypeError, ValueError) as e:
+        raise InvalidCursor(str(e))
+    if cursor_ordering != ordering:
+        raise InvalidCursor(f'Cursor is for ordering {cursor_ordering}, not {ordering}')
+    return _load(value), pk, bool(backwards)
+
+
+def _seek(key, descending, value, pk, backwards):
+    """Condition selecting the rows after (or before) ``(value, pk)``."""
+    if not backwards:
+        if value is None:
+            return Q(**{f'{key}__isnull': True, 'id__gt': pk})
+        beyond = Q(**{f'{key}__{"lt" if descending else "gt"}': value})
+        return beyond | Q(**{key: value, 'id__gt': pk}) | Q(**{f'{key}__isnull': True})
+    if value is None:
+        return Q(**{f'{key}__isnull': False}) | Q(**{f'{key}__isnull': True, 'id__lt': pk})
+    before = Q(**{f'{key}__{"gt" if descending else "lt"}': value})
+    return before | Q(**{key: value, 'id__lt': pk})
+
+
+def _order_by(key, descending, backwards):
+    if key is None:
+        return ['-id' if backwards else 'id']
+    # The backwards order is the exact reverse of the forward one
+    nulls = {'nulls_first': True} if backwards else {'nulls_last': True}
+    expression = F(key).desc(**nulls) if descending != backwards else F(key).asc(**nulls)
+    return [expression, '-id' if backwards else 'id']
+
+
+def _page(items, ordering, key, has_more, cursor, backwards):
+    """Assemble a ``Page`` from up to ``page_size`` rows in forward order."""
+    def cursor_at(item, backwards):
+        value = getattr(item, key) if key else None
+        return encode_cursor(ordering, value, item.pk, backwards)
+
+    if not items:
+        return Page(items, None, None)
+    more_after = has_more if not backwards else cursor is not None
+    more_before = has_more if backwards else cursor is not None
+    return Page(
+        items,
+        cursor_at(items[-1], False) if more_after else None,
+        cursor_at(items[0], True) if more_before else None,
+    )
+
+
+def paginate(queryset, ordering, key=None, descending=False, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Fetch one page of ``queryset`` ordered by ``key`` and ``id`` (one query).
+
+    Args:
+        queryset: Unordered queryset; ``key`` may be an annotation.
+        ordering (str): Name of the order, stored in the cursors so a
+            cursor cannot be replayed against another order.
+        key (str): Sort field, or None to order by id alone.
+        descending (bool): Sort ``key`` in descending order.
+        cursor (str): Cursor of the page to fetch; the first page when None.
+        page_size (int): Number of rows per page.
+
+    Returns:
+        Page
+
+    Raises:
+        InvalidCursor: See ``decode_cursor``.
+    """
+    backwards = False
+    if cursor is not None:
+        value, pk, backwards = decode_cursor(cursor, ordering)
+        if key is None:
+            queryset = queryset.filter(id__lt=pk) if backwards else queryset.filter(id__gt=pk)
+        else:
+            queryset = queryset.filter(_seek(key, descending, value, pk, backwards))
+    rows = list(queryset.order_by(*_order_by(key, descending, backwards))[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+    return _page(rows, ordering, key, has_more, cursor, backwards)
+
+
+def _smallest(keys, ids, count):
+    """Positions of the ``count`` smallest ``(key, id)`` pairs, in order."""
+    if len(keys) > count:
+        # Only rows up to the count-th smallest key can make the page
+        threshold = np.partition(keys, count - 1)[count - 1]
+        candidates = np.flatnonzero(keys <= threshold)
+    else:
+        candidates = np.arange(len(keys))
+    order = np.lexsort((ids[candidates], keys[candidates]))[:count]
+    return candidates[order]
+
+
+def paginate_keys(ids, keys, ordering, descending=False, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Page through rows held in NumPy arrays, in the order of ``paginate``.
+
+    Only the rows of the requested page are sorted, so a page costs a few
+    linear passes over the arrays whatever its depth.
+
+    Args:
+        ids (ndarray): int64 row ids.
+        keys (ndarray): float64 sort keys aligned with ``ids`` (NaN for
+            NULL, sorted last), or None to order by id alone.
+        ordering, descending, cursor, page_size: See ``paginate``.
+
+    Returns:
+        tuple: (positions in ``ids`` of the page rows, next cursor, previous cursor)
+
+    Raises:
+        InvalidCursor: See ``decode_cursor``.
+    """
+    if keys is None:
+        sortable = np.zeros(len(ids))
+    else:
+        sortable = np.where(np.isnan(keys), np.inf, -keys if descending else keys)
+
+    backwards = False
+    rows = np.arange(len(ids))
+    if cursor is not None:
+        value, pk, backwards = decode_cursor(cursor, ordering)
+        if keys is None:
+            position = 0.0
+        elif value is None:
+            position = math.inf
+        else:
+            position = -value if descending else value
+        if backwards:
+            rows = np.flatnonzero((sortable < position) | ((sortable == position) & (ids < pk)))
+        else:
+            rows = np.flatnonzero((sortable > position) | ((sortable == position) & (ids > pk)))
+
+    if backwards:
+        # The last rows before the cursor are the smallest of the reversed order
+        page = rows[_smallest(-sortable[rows], -ids[rows], page_size)][::-1]
+    else:
+        page = rows[_smallest(sortable[rows], ids[rows], page_size)]
+    if not len(page):
+        return page, None, None
+
+    def cursor_at(position, backwards):
+        value = None
+        if keys is not None and not np.isnan(keys[position]):
+            value = float(keys[position])
+        return encode_cursor(ordering, value, int(ids[position]), backwards)
+
+    has_more = len(rows) > page_size
+    more_after = has_more if not backwards else True
+    more_before = has_more if backwards else cursor is not None
+    return (
+        page,
+        cursor_at(page[-1], False) if more_after else None,
+        cursor_at(page[0], True) if more_before else None,
+    )
@@ -0,0 +1 @@
+"""Full-text recipe search: tokenizer, inverted index and BM25 queries."""
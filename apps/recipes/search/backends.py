@@ -0,0 +1,170 @@
+"""
+Search backends.
+
+``search_recipes`` talks to the backend configured by the ``RECIPE_SEARCH``
+setting, in the same shape as ``CACHES``::
+
+    RECIPE_SEARCH = {
+        'BACKEND': 'apps.recipes.search.backends.MemoryBackend',
+        'OPTIONS': {'index_dir': BASE_DIR / 'search_index'},
+    }
+
+``DatabaseBackend`` queries the postings tables. ``MemoryBackend`` answers
+from a memory-mapped index file built by ``build_memory_search_index`` and
+falls back to the database while no index file is available.
+"""
+import logging
+import os
+import time
+from collections import namedtuple
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Case, FloatField, Value, When
+from django.utils.module_loading import import_string
+
+from .memory import MemoryIndex, current_index_path
+from .query import MATCH_ALL, apply_search, parse_query
+from ..models import Recipe
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKEND = 'apps.recipes.search.backends.DatabaseBackend'
+
+# Scored search results, in no particular order (see ``paginate_keys``).
+#   ids:             recipe primary keys (sequence or NumPy array)
+#   scores:          relevance of each id
+#   category_counts: {category: number of matches}, before any category restriction
+SearchHits = namedtuple('SearchHits', ['ids', 'scores', 'category_counts'])
+
+
+class SearchBackend:
+    """Interface of the recipe search backends."""
+
+    # Whether ``search`` is answered without querying the database
+    in_process = False
+    # Changes whenever the backend starts answering from different data
+    version = None
+
+    def __init__(self, **options):
+        self.options = options
+
+    def search(self, text, mode=MATCH_ALL, category=None):
+        """Return the scored ``SearchHits`` for ``text`` or None when it has no searchable terms."""
+        raise NotImplementedError
+
+    def filter(self, queryset, text, mode=MATCH_ALL, with_score=True):
+        """Restrict a ``Recipe`` queryset to the matches of ``text``, optionally annotated with ``search_score``."""
+        raise NotImplementedError
+
+
+class DatabaseBackend(SearchBackend):
+    """Search the ``SearchPosting`` table."""
+
+    def search(self, text, mode=MATCH_ALL, category=None):
+        terms, prefix = parse_query(text)
+        if not terms and not prefix:
+            return None
+        rows = list(
+            apply_search(Recipe.objects.all(), text, mode)
+            .order_by()
+            .values_list('id', 'recipe_category', 'search_score')
+        )
+        category_counts = {}
+        for _, recipe_category, _ in rows:
+            category_counts[recipe_category] = category_counts.get(recipe_category, 0) + 1
+        if category is not None:
+            rows = [row for row in rows if row[1] == category]
+        return SearchHits([row[0] for row in rows], [row[2] for row in rows], category_counts)
+
+    def filter(self, queryset, text, mode=MATCH_ALL, with_score=True):
+        return apply_search(queryset, text, mode, with_score)
+
+
+class MemoryBackend(SearchBackend):
+    """
+    Search a memory-mapped index file.
+
+    The ``CURRENT`` file of ``index_dir`` is checked at most every
+    ``reload_interval`` seconds and a new generation is loaded as soon as it
+    is published.
+    """
+
+    # Result sets up to this size are handed to the database as an id list
+    MAX_FILTER_IDS = 500
+
+    def __init__(self, index_dir=None, reload_interval=5, **options):
+        super().__init__(**options)
+        self.index_dir = os.fspath(index_dir or os.path.join(settings.BASE_DIR, 'search_index'))
+        self.reload_interval = reload_interval
+        self.fallback = DatabaseBackend()
+        self._index = None
+        self._checked_at = None
+
+    @property
+    def index(self):
+        """The loaded ``MemoryIndex``, reloaded when a new generation is published."""
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.reload_interval:
+            self._checked_at = now
+            path = current_index_path(self.index_dir)
+            if path and (self._index is None or self._index.path != path):
+                try:
+                    self._index = MemoryIndex(path)
+                except (OSError, ValueError) as e:
+                    logger.warning(f'Could not load search index {path}: {e}')
+        return self._index
+
+    @property
+    def in_process(self):
+        return self.index is not None
+
+    @property
+    def version(self):
+        index = self.index
+        return index.generation if index is not None else None
+
+    def search(self, text, mode=MATCH_ALL, category=None):
+        index = self.index
+        if index is None:
+            return self.fallback.search(text, mode, category)
+        terms, prefix = parse_query(text)
+        if not terms and not prefix:
+            return None
+        ids, scores, category_counts = index.search(terms, prefix, mode == MATCH_ALL, category)
+        return SearchHits(ids, scores, category_counts)
+
+    def filter(self, queryset, text, mode=MATCH_ALL, with_score=True):
+        hits = self.search(text, mode) if self.index is not None else None
+        if hits is None or len(hits.ids) > self.MAX_FILTER_IDS:
+            # Too many ids to send to the database; let it match by itself
+            return self.fallback.filter(queryset, text, mode, with_score)
+        ids, scores = np.asarray(hits.ids).tolist(), np.asarray(hits.scores).tolist()
+        queryset = queryset.filter(id__in=ids)
+        if with_score and ids:
+            queryset = queryset.annotate(search_score=Case(
+                *(When(id=pk, then=Value(score)) for pk, score in zip(ids, scores)),
+                output_field=FloatField(),
+            ))
+        elif with_score:
+            queryset = queryset.annotate(search_score=Value(0.0))
+        return queryset
+
+
+# Backend instances by configured class path
+_backends = {}
+
+
+def get_backend():
+    """Return the configured search backend (one instance per process)."""
+    config = getattr(settings, 'RECIPE_SEARCH', {})
+    path = config.get('BACKEND', DEFAULT_BACKEND)
+    backend = _backends.get(path)
+    if backend is None:
+        try:
+            backend_class = import_string(path)
+        except ImportError as e:
+            raise ImproperlyConfigured(f'Could not import search backend {path}: {e}')
+        backend = _backends[path] = backend_class(**config.get('OPTIONS', {}))
+    return backend
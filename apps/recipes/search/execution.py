@@ -0,0 +1,246 @@
+"""
+Execution of recipe searches for the search page.
+
+``execute_search`` answers one results page with a fixed number of queries
+whatever the page size:
+
+1. the category facets of every match, from which the total is derived,
+2. the page itself.
+
+What the cards show per visitor (image, heart, missing ingredients) is
+loaded separately for the page, see ``apps.recipes.cards``.
+
+Pages are addressed by keyset cursors (see ``apps.recipes.pagination``).
+Relevance-ordered searches on an in-process backend skip the first query;
+the backend returns the facets along with the scored ids, and only the
+top of the requested page is ordered.
+
+Searches that do not depend on the user's pantry are cached (see
+``result_cache``); a cached page costs the page query only.
+
+The user's expanded pantry comes from the pantry cache (one query when it
+is not cached). Searches filtered on, or sorted by, the number of missing
+ingredients are answered from the in-memory ``CoverageIndex``: every
+candidate's missing count is computed in memory, and only the page is
+fetched.
+"""
+from collections import namedtuple
+
+import numpy as np
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from apps.pantry.contents import pantry_ingredient_ids
+
+from . import result_cache
+from .backends import get_backend
+from .query import MATCH_ALL
+from ..coverage import coverage_index
+from ..db import LOOKUP_CHUNK_SIZE
+from ..models import Recipe, RecipeIngredient
+from ..pagination import DEFAULT_PAGE_SIZE, paginate, paginate_keys
+
+SORT_FIELDS = {
+    'time': 'total_time',
+    'rating': 'aggregated_rating',
+    'date': 'created_at',
+    'missing': 'missing_count',
+}
+
+# One page of search results.
+#   recipes:         ``Recipe`` instances
+#   total:           number of matches in the selected category
+#   category_counts: {category: number of matches}, before the category restriction
+#   next_cursor, previous_cursor: cursors of the adjacent pages or None
+SearchResults = namedtuple(
+    'SearchResults', ['recipes', 'total', 'category_counts', 'next_cursor', 'previous_cursor']
+)
+
+
+def missing_count(user, pantry_ids):
+    """
+    Expression counting the distinct ingredients of a recipe that are not
+    in ``user``'s pantry, directly or as a related ingredient.
+
+    Args:
+        pantry_ids: ``user``'s expanded pantry, see ``pantry_ingredient_ids``.
+    """
+    lines = RecipeIngredient.objects.filter(recipe=OuterRef('pk'))
+    if len(pantry_ids) <= LOOKUP_CHUNK_SIZE:
+        lines = lines.exclude(ingredient_id__in=pantry_ids)
+    else:
+        # Too many parameters for one statement; the database expands the pantry
+        lines = lines.exclude(ingredient__userpantry__user=user).exclude(ingredient__related_to__user=user)
+    missing = (
+        lines
+        .order_by()
+        .values('recipe')
+        .annotate(count=Count('ingredient', distinct=True))
+        .values('count')
+    )
+    return Coalesce(Subquery(missing, output_field=IntegerField()), 0)
+
+
+def execute_search(query='', category='', sort='', direction='desc', match=MATCH_ALL, user=None,
+                   max_missing=None, cursor=None, page_size=DEFAULT_PAGE_SIZE, backend=None):
+    """
+    Run a search and fetch one page of results.
+
+    Args:
+        query (str): Search text; every recipe matches an empty query.
+        category (str): Only return recipes of this category.
+        sort (str): One of ``SORT_FIELDS``; relevance (or the default
+            order without a query) when empty.
+        direction (str): 'asc' or 'desc'.
+        match (str): ``MATCH_ALL`` or ``MATCH_ANY``.
+        user: Authenticated user whose pantry drives ``max_missing`` and
+            the 'missing' sort, or None.
+        max_missing (int): Only return recipes missing at most this many
+            ingredients; no restriction when None.
+        cursor (str): Cursor of the page to fetch; the first page when None.
+        page_size (int): Number of results per page.
+        backend: Search backend; the configured one by default.
+
+    Returns:
+        SearchResults
+
+    Raises:
+        InvalidCursor: ``cursor`` was not issued for this order.
+    """
+    backend = backend or get_backend()
+    if sort not in SORT_FIELDS:
+        sort = ''
+    direction = 'asc' if direction == 'asc' else 'desc'
+    if user is None:
+        max_missing = None
+        if sort == 'missing':
+            sort = ''
+    elif max_missing is not None or sort == 'missing':
+        # Searches depending on the pantry are answered by the coverage
+        # index and never shared
+        return _search_by_coverage(
+            query, category, sort, direction, match, pantry_ingredient_ids(user), max_missing, cursor, page_size,
+            backend,
+        )
+
+    recipes = Recipe.objects.all()
+    key = result_cache.results_key(query, match, category, sort, direction, cursor, page_size, backend.version)
+    cached = result_cache.get_results(key)
+    if cached is not None:
+        page_ids, total, category_counts, next_cursor, previous_cursor = cached
+        page = _fetch_page(recipes, page_ids)
+        return SearchResults(page, total, category_counts, next_cursor, previous_cursor)
+
+    results = _search(recipes, query, category, sort, direction, match, cursor, page_size, backend)
+    result_cache.set_results(
+        key, [recipe.pk for recipe in results.recipes], results.total, results.category_counts,
+        results.next_cursor, results.previous_cursor,
+    )
+    return results
+
+
+def _fetch_page(recipes, page_ids):
+    """Fetch the recipes of ``page_ids`` in that order."""
+    recipes_by_id = recipes.in_bulk(page_ids)
+    return [recipes_by_id[pk] for pk in page_ids if pk in recipes_by_id]
+
+
+def _search(recipes, query, category, sort, direction, match, cursor, page_size, backend):
+    # Relevance-ordered searches are answered by an in-process backend
+    # alone; only the page is fetched from the database
+    if query and not sort and backend.in_process:
+        hits = backend.search(query, match, category=category or None)
+        if hits is not None:
+            ids = np.asarray(hits.ids, dtype=np.int64)
+            page, next_cursor, previous_cursor = paginate_keys(
+                ids, np.asarray(hits.scores, dtype=np.float64), 'relevance', True, cursor, page_size
+            )
+            page = _fetch_page(recipes, ids[page].tolist())
+            return SearchResults(page, len(hits.ids), hits.category_counts, next_cursor, previous_cursor)
+
+    # Relevance is only scored when it is used for ordering
+    if query:
+        recipes = backend.filter(recipes, query, match, with_score=not sort)
+
+    category_counts = dict(
+        recipes.order_by().values_list('recipe_category').annotate(count=Count('id'))
+    )
+    if category:
+        recipes = recipes.filter(recipe_category=category)
+        total = category_counts.get(category, 0)
+    else:
+        total = sum(category_counts.values())
+
+    if sort:
+        ordering, key, descending = f'{sort}:{direction}', SORT_FIELDS[sort], direction == 'desc'
+    elif query:
+        # Best matches first
+        ordering, key, descending = 'relevance', 'search_score', True
+    else:
+        ordering, key, descending = 'default', None, False
+
+    if not total:
+        return SearchResults([], 0, category_counts, None, None)
+    page = paginate(recipes, ordering, key, descending, cursor, page_size)
+    return SearchResults(page.items, total, category_counts, page.next_cursor, page.previous_cursor)
+
+
+def _search_by_coverage(query, category, sort, direction, match, pantry_ids, max_missing, cursor, page_size,
+                        backend):
+    """Answer a search depending on the pantry from the ``CoverageIndex``."""
+    index = coverage_index()
+    missing = index.missing_counts(pantry_ids)
+
+    scores = None
+    if query:
+        hits = backend.search(query, match)
+        if hits is None:
+            return SearchResults([], 0, {}, None, None)
+        positions, kept = index.positions(hits.ids)
+        if not sort:
+            scores = np.asarray(hits.scores, dtype=np.float64)[kept]
+    else:
+        positions = np.arange(len(index), dtype=np.int64)
+
+    if max_missing is not None:
+        within = missing[positions] <= max_missing
+        positions = positions[within]
+        if scores is not None:
+            scores = scores[within]
+
+    codes = index.categories[positions]
+    category_counts = {
+        index.category_names[code]: int(count)
+        for code, count in enumerate(np.bincount(codes, minlength=len(index.category_names)))
+        if count
+    }
+    if category:
+        selected = codes == (
+            index.category_names.index(category) if category in category_counts else -1
+        )
+        positions = positions[selected]
+        if scores is not None:
+            scores = scores[selected]
+    if not len(positions):
+        return SearchResults([], 0, category_counts, None, None)
+
+    # Orderings are named apart from the database ones: the cursors hold
+    # float keys
+    if sort:
+        columns = {
+            'time': index.total_time,
+            'rating': index.rating,
+            'date': index.created_at,
+            'missing': missing.astype(np.float64),
+        }
+        ordering, keys, descending = f'covered:{sort}:{direction}', columns[sort][positions], direction == 'desc'
+    elif query:
+        ordering, keys, descending = 'covered:relevance', scores, True
+    else:
+        ordering, keys, descending = 'covered:default', None, False
+
+    page, next_cursor, previous_cursor = paginate_keys(
+        index.pks[positions], keys, ordering, descending, cursor, page_size
+    )
+    recipes = _fetch_page(Recipe.objects.all(), index.pks[positions[page]].tolist())
+    return SearchResults(recipes, len(positions), category_counts, next_cursor, previous_cursor)
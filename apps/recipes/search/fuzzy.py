@@ -0,0 +1,104 @@
+"""
+Typo-tolerant matching of query terms against the index vocabulary.
+
+A query term with no postings ("chiken") is replaced by the closest index
+terms ("chicken"). Comparing it with every term would cost a scan of the
+vocabulary per request, so candidates are blocked first:
+
+* only terms whose length is within ``MAX_LENGTH_DIFFERENCE``,
+* sharing enough padded bigrams with the term (each edit destroys at most
+  two bigrams),
+* at most ``MAX_CANDIDATES`` of them, most shared bigrams first,
+
+and only those are scored with ``rapidfuzz.process.extract``.
+"""
+import numpy as np
+from rapidfuzz import fuzz, process
+
+from .ngrams import ngram_postings, text_codes
+
+# Shorter terms have too many near neighbours to be corrected
+MIN_FUZZY_LENGTH = 4
+MAX_LENGTH_DIFFERENCE = 2
+# Edits tolerated by the bigram blocking
+MAX_EDITS = 2
+MAX_CANDIDATES = 2000
+FUZZY_SCORE_CUTOFF = 80
+MAX_CORRECTIONS = 3
+# Most query terms corrected per search
+MAX_CORRECTED_TERMS = 3
+# Corrected terms score lower than exact ones
+FUZZY_WEIGHT = 0.7
+
+# Padding so the first and last letters form bigrams of their own
+START, END = '\x01', '\x02'
+
+
+class FuzzyVocabulary:
+    """
+    Blocking structure over a list of index terms.
+
+    Args:
+        terms: Distinct terms.
+        dfs: Number of recipes of each term; ties between equally close
+            corrections go to the more frequent term.
+    """
+
+    def __init__(self, terms, dfs):
+        self.terms = list(terms)
+        self.dfs = np.asarray(dfs, dtype=np.int64)
+        self.lengths = np.array([len(term) for term in self.terms], dtype=np.int64)
+        self.grams = ngram_postings([f'{START}{term}{END}' for term in self.terms], (2,))
+
+    def __len__(self):
+        return len(self.terms)
+
+    def candidates(self, term):
+        """Return the positions of the terms that may be close to ``term``."""
+        codes = text_codes(f'{START}{term}{END}', 2)
+        postings = [self.grams[code] for code in codes if code in self.grams]
+        if not postings:
+            return np.empty(0, dtype=np.int64)
+        shared = np.bincount(np.concatenate(postings), minlength=len(self.terms))
+        required = max(1, len(codes) - 2 * MAX_EDITS)
+        eligible = (shared >= required) & (np.abs(self.lengths - len(term)) <= MAX_LENGTH_DIFFERENCE)
+        positions = np.flatnonzero(eligible)
+        if len(positions) > MAX_CANDIDATES:
+            best = np.argpartition(-shared[positions], MAX_CANDIDATES)[:MAX_CANDIDATES]
+            positions = positions[best]
+        return positions
+
+    def correct(self, term, limit=MAX_CORRECTIONS):
+        """
+        Return up to ``limit`` index terms close to ``term``, closest first.
+        The term itself is never returned.
+        """
+        if len(term) < MIN_FUZZY_LENGTH or term.isdigit():
+            return []
+        positions = self.candidates(term).tolist()
+        choices = [self.terms[position] for position in positions]
+        matches = process.extract(
+            term,
+            choices,
+            scorer=fuzz.ratio,
+            score_cutoff=FUZZY_SCORE_CUTOFF,
+            limit=None,
+        )
+        ranked = sorted(
+            (-score, -int(self.dfs[positions[index]]), choice)
+            for choice, score, index in matches
+            if choice != term
+        )
+        return [choice for _, _, choice in ranked[:limit]]
+
+    def correct_all(self, terms):
+        """
+        Return ``{term: corrections}`` for the first ``MAX_CORRECTED_TERMS``
+        of ``terms``, leaving out terms without any.
+        """
+        corrections = {}
+        for term in terms[:MAX_CORRECTED_TERMS]:
+            found = self.correct(term)
+            if found:
+                corrections[term] = found
+        return corrections
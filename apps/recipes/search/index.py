@@ -0,0 +1,361 @@
+"""
+Maintenance of the inverted search index.
+
+Every recipe is indexed as one ``SearchDocument`` row holding its weighted
+length and quality boost, and one ``SearchPosting`` row per distinct term
+holding the term's weighted frequency and copies of the length and boost,
+so ranking reads postings only. Terms weigh more in the name than in the
+tags, more in the tags than in the ingredients, and least in the
+description, so a match in the name ranks higher.
+
+The boost multiplies a recipe's text score by up to ``1 + QUALITY_WEIGHT``
+according to its rating, shrunk towards ``PRIOR_RATING`` for recipes with
+few reviews (a Bayesian average), so a well reviewed recipe wins among
+equally relevant ones without outranking a better text match.
+
+``SearchTerm`` holds the number of recipes per term, the vocabulary of typo
+correction. ``index_documents`` keeps it up to date by adding the terms of
+the new postings and subtracting those of the postings it replaces, so no
+request ever aggregates the postings table. Recipes deleted without going
+through the index (cascades) leave their terms counted until
+``rebuild_search_index --terms`` recounts them.
+
+Renaming an ingredient or tag changes the text of every recipe using it.
+``reindex_recipes_using`` re-indexes a few recipes right away; when a rename
+reaches more than ``INLINE_REINDEX_LIMIT`` recipes (say "salt"), their
+documents are only flagged as stale and ``rebuild_search_index --stale``
+re-indexes them outside the request.
+"""
+import os
+import re
+from collections import Counter, defaultdict, namedtuple
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, F
+
+from .memory import current_index_path, publish_index, write_index
+from .result_cache import bump_catalog_generation, bump_catalog_generation_on_commit
+from .text import tokenize
+from ..coverage import record_recipe_changes_on_commit
+from ..db import LOOKUP_CHUNK_SIZE
+from ..models import Recipe, RecipeIngredient, RecipeTag, SearchDocument, SearchPosting, SearchTerm
+
+# Weight of one occurrence of a term in each indexed field
+FIELD_WEIGHTS = {
+    'name': 3.0,
+    'tags': 2.5,
+    'ingredients': 2.0,
+    'recipe_category': 1.5,
+    'description': 1.0,
+}
+
+# Quality boost: the rating counts as PRIOR_REVIEWS extra reviews of PRIOR_RATING
+QUALITY_WEIGHT = 0.2
+PRIOR_RATING = 3.5
+PRIOR_REVIEWS = 10
+MAX_RATING = 5
+
+# Recipes a rename re-indexes right away; more are left to rebuild_search_index --stale
+INLINE_REINDEX_LIMIT = 500
+
+GENERATION_RE = re.compile(r'recipes-(\d+)\.idx')
+
+# Searchable text of one recipe; ingredients and tags are sequences of names.
+# The rating and review count drive the quality boost.
+SearchText = namedtuple(
+    'SearchText',
+    ['name', 'description', 'recipe_category', 'ingredients', 'tags', 'aggregated_rating', 'review_count'],
+)
+
+
+def quality_boost(rating, review_count):
+    """Return the factor applied to the text score of a recipe."""
+    reviews = max(review_count or 0, 0)
+    rating = float(rating) if rating is not None and reviews else PRIOR_RATING
+    average = (rating * reviews + PRIOR_RATING * PRIOR_REVIEWS) / (reviews + PRIOR_REVIEWS)
+    return 1.0 + QUALITY_WEIGHT * average / MAX_RATING
+
+
+def document_terms(text):
+    """
+    Weigh the terms of a ``SearchText``.
+
+    Returns:
+        tuple: ({term: weighted frequency}, weighted document length)
+    """
+    weights = Counter()
+    length = 0.0
+    for field, weight in FIELD_WEIGHTS.items():
+        value = getattr(text, field)
+        if field in ('ingredients', 'tags'):
+            tokens = [token for name in value for token in tokenize(name)]
+        else:
+            tokens = tokenize(value)
+        for token in tokens:
+            weights[token] += weight
+        length += weight * len(tokens)
+    return weights, length
+
+
+def term_counts(recipe_pks):
+    """Return a ``Counter`` of the number of ``recipe_pks`` indexed under each term."""
+    counts = Counter()
+    for start in range(0, len(recipe_pks), LOOKUP_CHUNK_SIZE):
+        counts.update(dict(
+            SearchPosting.objects.filter(recipe_id__in=recipe_pks[start:start + LOOKUP_CHUNK_SIZE])
+            .values_list('term')
+            .annotate(df=Count('recipe_id'))
+            .order_by()
+        ))
+    return counts
+
+
+def update_term_frequencies(changes):
+    """
+    Add ``changes`` ({term: change in the number of recipes}) to
+    ``SearchTerm``; terms no recipe contains any more are removed.
+    """
+    terms = sorted(term for term, change in changes.items() if change)
+    existing = set()
+    for start in range(0, len(terms), LOOKUP_CHUNK_SIZE):
+        existing.update(
+            SearchTerm.objects.filter(term__in=terms[start:start + LOOKUP_CHUNK_SIZE]).values_list('term', flat=True)
+        )
+    SearchTerm.objects.bulk_create(
+        [SearchTerm(term=term, df=changes[term]) for term in terms if term not in existing and changes[term] > 0],
+        batch_size=LOOKUP_CHUNK_SIZE // 2,
+    )
+    # Increments rather than values, so concurrent writers add up; three
+    # parameters per term
+    SearchTerm.objects.bulk_update(
+        [SearchTerm(term=term, df=F('df') + changes[term]) for term in terms if term in existing],
+        ['df'],
+        batch_size=LOOKUP_CHUNK_SIZE // 3,
+    )
+    removed = [term for term in terms if term in existing and changes[term] < 0]
+    for start in range(0, len(removed), LOOKUP_CHUNK_SIZE):
+        SearchTerm.objects.filter(term__in=removed[start:start + LOOKUP_CHUNK_SIZE], df__lte=0).delete()
+
+
+def rebuild_term_frequencies():
+    """Recount ``SearchTerm`` from the postings table (one aggregate over the whole index)."""
+    with transaction.atomic():
+        SearchTerm.objects.all().delete()
+        SearchTerm.objects.bulk_create(
+            (
+                SearchTerm(term=term, df=df)
+                for term, df in SearchPosting.objects.values_list('term').annotate(df=Count('recipe_id')).order_by()
+            ),
+            batch_size=LOOKUP_CHUNK_SIZE // 2,
+        )
+
+
+def index_documents(documents):
+    """
+    Replace the index entries of the given recipes.
+
+    Args:
+        documents (dict): Recipe primary key -> ``SearchText``.
+
+    Callers are expected to wrap this in a transaction. Cached search
+    results are invalidated, and the recipes are recorded as changed for
+    the coverage index, once it commits.
+    """
+    recipe_pks = list(documents)
+    postings = []
+    search_documents = []
+    changes = Counter()
+    for recipe_pk, text in documents.items():
+        weights, length = document_terms(text)
+        boost = quality_boost(text.aggregated_rating, text.review_count)
+        search_documents.append(SearchDocument(recipe_id=recipe_pk, length=length, boost=boost))
+        postings.extend(
+            SearchPosting(term=term, recipe_id=recipe_pk, weight=weight, length=length, boost=boost)
+            for term, weight in weights.items()
+        )
+        changes.update(weights.keys())
+
+    # Terms of the postings being replaced
+    changes.subtract(term_counts(recipe_pks))
+    for start in range(0, len(recipe_pks), LOOKUP_CHUNK_SIZE):
+        chunk = recipe_pks[start:start + LOOKUP_CHUNK_SIZE]
+        SearchPosting.objects.filter(recipe_id__in=chunk).delete()
+        SearchDocument.objects.filter(recipe_id__in=chunk).delete()
+
+    SearchDocument.objects.bulk_create(search_documents)
+    SearchPosting.objects.bulk_create(postings)
+    update_term_frequencies(changes)
+    bump_catalog_generation_on_commit()
+    record_recipe_changes_on_commit(recipe_pks)
+
+
+def load_documents(recipe_pks):
+    """Read the ``SearchText`` of ``recipe_pks`` from the database (three queries)."""
+    ingredients = defaultdict(list)
+    for recipe_pk, name in (
+        RecipeIngredient.objects.filter(recipe_id__in=recipe_pks).values_list('recipe_id', 'ingredient__name')
+    ):
+        ingredients[recipe_pk].append(name)
+
+    tags = defaultdict(list)
+    for recipe_pk, name in RecipeTag.objects.filter(recipe_id__in=recipe_pks).values_list('recipe_id', 'tag__name'):
+        tags[recipe_pk].append(name)
+
+    return {
+        recipe_pk: SearchText(
+            name, description, recipe_category, ingredients[recipe_pk], tags[recipe_pk], rating, review_count
+        )
+        for recipe_pk, name, description, recipe_category, rating, review_count in (
+            Recipe.objects.filter(id__in=recipe_pks).values_list(
+                'id', 'name', 'description', 'recipe_category', 'aggregated_rating', 'review_count'
+            )
+        )
+    }
+
+
+def index_recipes(recipe_pks):
+    """
+    Re-index ``recipe_pks`` from the database; recipes that no longer exist
+    are dropped. Each chunk is indexed in its own transaction, so a recipe
+    never loses its postings half way even when called outside one.
+    """
+    recipe_pks = list(recipe_pks)
+    for start in range(0, len(recipe_pks), LOOKUP_CHUNK_SIZE):
+        chunk = recipe_pks[start:start + LOOKUP_CHUNK_SIZE]
+        with transaction.atomic():
+            documents = load_documents(chunk)
+            index_documents(documents)
+            missing = [pk for pk in chunk if pk not in documents]
+            if missing:
+                update_term_frequencies({term: -count for term, count in term_counts(missing).items()})
+                SearchPosting.objects.filter(recipe_id__in=missing).delete()
+                SearchDocument.objects.filter(recipe_id__in=missing).delete()
+                record_recipe_changes_on_commit(missing)
+
+
+def iter_recipe_pks(batch_size):
+    """Yield lists of recipe primary keys in id order."""
+    last_pk = 0
+    while True:
+        pks = list(Recipe.objects.filter(id__gt=last_pk).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not pks:
+            return
+        yield pks
+        last_pk = pks[-1]
+
+
+def iter_stale_recipe_pks(batch_size):
+    """Yield lists of the primary keys of stale documents until none is left."""
+    while True:
+        pks = list(
+            SearchDocument.objects.filter(stale=True).order_by('recipe_id').values_list('recipe_id', flat=True)[:batch_size]
+        )
+        if not pks:
+            return
+        yield pks
+
+
+def _recipes_using(ingredient_ids, tag_ids):
+    """Return querysets of the ``recipe_id`` of recipes using the ingredients or tags."""
+    querysets = []
+    if ingredient_ids:
+        querysets.append(RecipeIngredient.objects.filter(ingredient_id__in=list(ingredient_ids)).values('recipe_id'))
+    if tag_ids:
+        querysets.append(RecipeTag.objects.filter(tag_id__in=list(tag_ids)).values('recipe_id'))
+    return querysets
+
+
+def index_recipes_using(ingredient_ids=(), tag_ids=()):
+    """Re-index the recipes that use any of the given ingredients or tags."""
+    recipe_pks = set()
+    for recipes in _recipes_using(ingredient_ids, tag_ids):
+        recipe_pks.update(recipes.values_list('recipe_id', flat=True))
+    index_recipes(sorted(recipe_pks))
+
+
+def reindex_recipes_using(ingredient_ids=(), tag_ids=()):
+    """
+    Re-index the recipes that use any of the given ingredients or tags when
+    there are at most ``INLINE_REINDEX_LIMIT`` of them; flag their documents
+    as stale otherwise (one UPDATE per kind), for ``rebuild_search_index --stale``.
+
+    Returns:
+        bool: True if the recipes were re-indexed, False if they were flagged.
+    """
+    recipe_pks = set()
+    for recipes in _recipes_using(ingredient_ids, tag_ids):
+        recipe_pks.update(recipes.values_list('recipe_id', flat=True).distinct()[:INLINE_REINDEX_LIMIT + 1])
+    if len(recipe_pks) <= INLINE_REINDEX_LIMIT:
+        index_recipes(sorted(recipe_pks))
+        return True
+    for recipes in _recipes_using(ingredient_ids, tag_ids):
+        SearchDocument.objects.filter(recipe_id__in=recipes).update(stale=True)
+    return False
+
+
+def build_memory_index(directory, keep=2):
+    """
+    Write a new generation of the in-memory index from the postings tables
+    and publish it.
+
+    Args:
+        directory: Index directory; created if needed.
+        keep (int): Number of generations to keep, including the new one.
+
+    Returns:
+        str: Path of the new index file.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    documents = list(
+        SearchDocument.objects.order_by('recipe_id')
+        .values_list('recipe_id', 'length', 'recipe__recipe_category', 'boost')
+    )
+    pks = np.array([row[0] for row in documents], dtype=np.int64)
+    lengths = np.array([row[1] for row in documents], dtype=np.float32)
+    boosts = np.array([row[3] for row in documents], dtype=np.float32)
+    category_names = sorted({row[2] for row in documents})
+    category_codes = {name: code for code, name in enumerate(category_names)}
+    codes = np.array([category_codes[row[2]] for row in documents], dtype=np.uint32)
+
+    def postings():
+        term, recipe_pks, weights = None, [], []
+        rows = (
+            SearchPosting.objects.order_by('term', 'recipe_id')
+            .values_list('term', 'recipe_id', 'weight')
+            .iterator(chunk_size=10000)
+        )
+        for row_term, recipe_pk, weight in rows:
+            if row_term != term:
+                if recipe_pks:
+                    yield _doc_numbers(term, pks, recipe_pks, weights)
+                term, recipe_pks, weights = row_term, [], []
+            recipe_pks.append(recipe_pk)
+            weights.append(weight)
+        if recipe_pks:
+            yield _doc_numbers(term, pks, recipe_pks, weights)
+
+    previous = current_index_path(directory)
+    generation = 1
+    if previous:
+        match = GENERATION_RE.search(os.path.basename(previous))
+        generation = int(match.group(1)) + 1 if match else 1
+    file_name = f'recipes-{generation:06d}.idx'
+    path = os.path.join(directory, file_name)
+    write_index(path, generation, pks, lengths, boosts, codes, category_names, postings())
+    publish_index(directory, file_name)
+    bump_catalog_generation()
+
+    generations = sorted(name for name in os.listdir(directory) if GENERATION_RE.fullmatch(name))
+    for name in generations[:-keep]:
+        os.remove(os.path.join(directory, name))
+    return path
+
+
+def _doc_numbers(term, pks, recipe_pks, weights):
+    """Map recipe pks to positions in ``pks``, dropping recipes without a document."""
+    recipe_pks = np.array(recipe_pks, dtype=np.int64)
+    docs = np.searchsorted(pks, recipe_pks)
+    found = (docs < len(pks)) & (pks[np.minimum(docs, len(pks) - 1)] == recipe_pks)
+    return term, docs[found], np.array(weights, dtype=np.float32)[found]
@@ -0,0 +1,325 @@
+"""
+Compressed in-memory search index.
+
+The index is a single file that is memory-mapped by every process serving
+searches, so all workers share one copy through the page cache. Layout::
+
+    MAGIC | u64 directory length | JSON directory | sections...
+
+The directory lists the terms in sorted order, the category names and the
+offset of every section. Sections are 8-byte aligned numpy arrays:
+
+    pks            int64[docs]    recipe primary keys, ascending
+    lengths        float32[docs]  weighted document lengths
+    boosts         float32[docs]  quality factors of the scores
+    categories     uint32[docs]   index into the category names
+    dfs            uint32[terms]  number of recipes per term
+    doc_offsets    uint64[terms + 1]
+    doc_stream     uint8[]        per term: delta-encoded doc numbers as varints
+    weight_offsets uint64[terms + 1]
+    weight_stream  uint8[]        per term: weights * WEIGHT_SCALE as varints
+
+Doc numbers are positions in ``pks``. Files are written as
+``recipes-<generation>.idx`` next to a ``CURRENT`` file naming the live one,
+so readers can pick up a new generation without restarting.
+"""
+import bisect
+import json
+import math
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from .fuzzy import FUZZY_WEIGHT, FuzzyVocabulary
+from .query import B, K1, MAX_PREFIX_TERMS
+
+MAGIC = b'SVRIDX01'
+FORMAT_VERSION = 2
+CURRENT_FILE = 'CURRENT'
+WEIGHT_SCALE = 4
+ALIGNMENT = 8
+
+SECTION_DTYPES = {
+    'pks': np.int64,
+    'lengths': np.float32,
+    'boosts': np.float32,
+    'categories': np.uint32,
+    'dfs': np.uint32,
+    'doc_offsets': np.uint64,
+    'doc_stream': np.uint8,
+    'weight_offsets': np.uint64,
+    'weight_stream': np.uint8,
+}
+
+
+def encode_varints(values):
+    """Encode non-negative integers as LEB128 varints (vectorized)."""
+    values = np.asarray(values, dtype=np.uint64)
+    if not len(values):
+        return np.empty(0, dtype=np.uint8)
+    sizes = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        sizes += rest > 0
+        rest >>= np.uint64(7)
+
+    starts = np.cumsum(sizes) - sizes
+    position = np.arange(sizes.sum()) - np.repeat(starts, sizes)
+    shifted = np.repeat(values, sizes) >> (position * 7).astype(np.uint64)
+    encoded = (shifted & np.uint64(0x7F)).astype(np.uint8)
+    encoded[position < np.repeat(sizes, sizes) - 1] |= 0x80
+    return encoded
+
+
+def decode_varints(data):
+    """Decode a uint8 array of LEB128 varints (vectorized)."""
+    data = np.asarray(data, dtype=np.uint8)
+    if not len(data):
+        return np.empty(0, dtype=np.uint64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    position = np.arange(len(data)) - np.repeat(starts, ends - starts + 1)
+    values = (data & 0x7F).astype(np.uint64) << (position * 7).astype(np.uint64)
+    return np.add.reduceat(values, starts)
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_index(path, generation, pks, lengths, boosts, category_codes, category_names, postings):
+    """
+    Write an index file atomically.
+
+    Args:
+        path: Destination file.
+        generation (int): Generation number stored in the directory.
+        pks, lengths, boosts, category_codes: Per-document arrays, ordered by pk.
+        category_names (list): Names indexed by ``category_codes``.
+        postings: Iterable of ``(term, doc numbers, weights)`` with distinct
+            terms in any order; doc numbers ascending.
+    """
+    encoded = {}
+    for term, docs, weights in postings:
+        docs = np.asarray(docs, dtype=np.uint64)
+        encoded[term] = (
+            len(docs),
+            encode_varints(np.diff(docs, prepend=np.uint64(0))),
+            encode_varints(np.rint(np.asarray(weights) * WEIGHT_SCALE)),
+        )
+
+    # Terms are sorted here, in Python order, so readers can bisect them
+    terms = sorted(encoded)
+    dfs = [encoded[term][0] for term in terms]
+    doc_chunks = [encoded[term][1] for term in terms]
+    weight_chunks = [encoded[term][2] for term in terms]
+    doc_offsets = np.zeros(len(terms) + 1, dtype=np.uint64)
+    doc_offsets[1:] = np.cumsum([len(chunk) for chunk in doc_chunks])
+    weight_offsets = np.zeros(len(terms) + 1, dtype=np.uint64)
+    weight_offsets[1:] = np.cumsum([len(chunk) for chunk in weight_chunks])
+
+    lengths = np.asarray(lengths, dtype=np.float32)
+    sections = {
+        'pks': np.asarray(pks, dtype=np.int64),
+        'lengths': lengths,
+        'boosts': np.asarray(boosts, dtype=np.float32),
+        'categories': np.asarray(category_codes, dtype=np.uint32),
+        'dfs': np.asarray(dfs, dtype=np.uint32),
+        'doc_offsets': doc_offsets,
+        'doc_stream': np.concatenate(doc_chunks) if doc_chunks else np.empty(0, dtype=np.uint8),
+        'weight_offsets': weight_offsets,
+        'weight_stream': np.concatenate(weight_chunks) if weight_chunks else np.empty(0, dtype=np.uint8),
+    }
+
+    # Offsets are relative to the end of the directory so they do not depend on its size
+    layout = {}
+    offset = 0
+    for name, array in sections.items():
+        layout[name] = [offset, len(array)]
+        offset = _aligned(offset + array.nbytes)
+    directory = json.dumps({
+        'version': FORMAT_VERSION,
+        'generation': generation,
+        'doc_count': len(lengths),
+        'avg_length': float(lengths.mean()) if len(lengths) else 0.0,
+        'weight_scale': WEIGHT_SCALE,
+        'terms': terms,
+        'category_names': list(category_names),
+        'sections': layout,
+    }).encode('utf-8')
+
+    temporary_path = f'{path}.tmp'
+    with open(temporary_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(directory)))
+        f.write(directory)
+        base = _aligned(f.tell())
+        for name, array in sections.items():
+            f.seek(base + layout[name][0])
+            f.write(array.tobytes())
+    os.replace(temporary_path, path)
+
+
+class MemoryIndex:
+    """A memory-mapped index file."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} is not a search index file')
+        (directory_length,) = struct.unpack_from('<Q', self._mmap, len(MAGIC))
+        start = len(MAGIC) + 8
+        directory = json.loads(self._mmap[start:start + directory_length])
+        if directory['version'] != FORMAT_VERSION:
+            raise ValueError(f'{path} has unsupported format version {directory["version"]}')
+
+        self.generation = directory['generation']
+        self.doc_count = directory['doc_count']
+        self.avg_length = directory['avg_length']
+        self.weight_scale = directory['weight_scale']
+        self.terms = directory['terms']
+        self.category_names = directory['category_names']
+
+        base = _aligned(start + directory_length)
+        for name, (offset, count) in directory['sections'].items():
+            array = np.frombuffer(self._mmap, dtype=SECTION_DTYPES[name], count=count, offset=base + offset)
+            setattr(self, name, array)
+        self._vocabulary = None
+
+    @property
+    def vocabulary(self):
+        """``FuzzyVocabulary`` of the index terms, built on first use."""
+        if self._vocabulary is None:
+            self._vocabulary = FuzzyVocabulary(self.terms, self.dfs)
+        return self._vocabulary
+
+    def lookup(self, term):
+        """Return the position of ``term`` in the term list or None."""
+        position = bisect.bisect_left(self.terms, term)
+        if position < len(self.terms) and self.terms[position] == term:
+            return position
+        return None
+
+    def prefixed(self, prefix):
+        """Return the positions of the terms starting with ``prefix``."""
+        start = bisect.bisect_left(self.terms, prefix)
+        end = bisect.bisect_left(self.terms, prefix + '\uffff')
+        return range(start, end)
+
+    def postings(self, position):
+        """Return ``(doc numbers, weights)`` of the term at ``position``."""
+        doc_start, doc_end = self.doc_offsets[position:position + 2]
+        weight_start, weight_end = self.weight_offsets[position:position + 2]
+        docs = np.cumsum(decode_varints(self.doc_stream[doc_start:doc_end])).astype(np.int64)
+        weights = decode_varints(self.weight_stream[weight_start:weight_end]).astype(np.float32) / self.weight_scale
+        return docs, weights
+
+    def idf(self, position):
+        df = int(self.dfs[position])
+        return math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+
+    def search(self, terms, prefix=None, match_all=True, category=None):
+        """
+        Rank the recipes matching a parsed query with BM25.
+
+        Args:
+            terms: Whole terms, each of which is a slot.
+            prefix: Optional prefix; its most frequent expansions form one slot.
+            match_all (bool): Require every slot instead of any.
+            category: Only return recipes of this category.
+
+        Matches are not sorted: callers page through them with
+        ``paginate_keys``, which only orders the requested page.
+
+        Returns:
+            tuple: (recipe pks in ascending order, scores,
+                {category: number of matches} before the category restriction)
+        """
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32), {})
+        slots = []
+        unknown = []
+        for term in terms:
+            position = self.lookup(term)
+            if position is not None:
+                slots.append([position])
+            else:
+                unknown.append(term)
+        if prefix:
+            exact = set(terms)
+            positions = [position for position in self.prefixed(prefix) if self.terms[position] not in exact]
+            positions.sort(key=lambda position: -int(self.dfs[position]))
+            if positions:
+                slots.append(positions[:MAX_PREFIX_TERMS])
+            else:
+                unknown.append(prefix)
+
+        # Replace unknown terms by their closest index terms; those that
+        # also match exactly keep their full weight
+        exact_positions = {position for slot in slots for position in slot}
+        fuzzy_positions = set()
+        corrections = self.vocabulary.correct_all(unknown) if unknown else {}
+        for term in unknown:
+            if term in corrections:
+                slot = [self.lookup(correction) for correction in corrections[term]]
+                slots.append(slot)
+                fuzzy_positions.update(position for position in slot if position not in exact_positions)
+            elif match_all:
+                return empty
+        if not slots or not self.doc_count:
+            return empty
+
+        scores = np.zeros(self.doc_count, dtype=np.float32)
+        matched_slots = np.zeros(self.doc_count, dtype=np.uint8)
+        norm_base = K1 * (1 - B)
+        norm_length = K1 * B / self.avg_length if self.avg_length else 0.0
+        for slot in slots:
+            in_slot = np.zeros(self.doc_count, dtype=bool)
+            for position in slot:
+                docs, weights = self.postings(position)
+                norm = norm_base + norm_length * self.lengths[docs]
+                idf = self.idf(position) * (FUZZY_WEIGHT if position in fuzzy_positions else 1.0)
+                scores[docs] += idf * weights * (K1 + 1) / (weights + norm)
+                in_slot[docs] = True
+            matched_slots += in_slot
+
+        if match_all:
+            matched = np.flatnonzero(matched_slots == len(slots))
+        else:
+            matched = np.flatnonzero(matched_slots)
+
+        codes = self.categories[matched]
+        counts = np.bincount(codes, minlength=len(self.category_names))
+        category_counts = {
+            self.category_names[code]: int(count) for code, count in enumerate(counts) if count
+        }
+        if category is not None:
+            try:
+                code = self.category_names.index(category)
+            except ValueError:
+                return empty[0], empty[1], category_counts
+            matched = matched[codes == code]
+        return self.pks[matched], scores[matched] * self.boosts[matched], category_counts
+
+
+def current_index_path(directory):
+    """Return the path of the live generation in ``directory`` or None."""
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            name = f.read().strip()
+    except OSError:
+        return None
+    return os.path.join(directory, name) if name else None
+
+
+def publish_index(directory, file_name):
+    """Point ``CURRENT`` at ``file_name`` atomically."""
+    temporary_path = os.path.join(directory, f'{CURRENT_FILE}.tmp')
+    with open(temporary_path, 'w') as f:
+        f.write(file_name)
+    os.replace(temporary_path, os.path.join(directory, CURRENT_FILE))
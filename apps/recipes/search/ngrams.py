@@ -0,0 +1,57 @@
+"""
+Byte n-gram postings shared by ingredient suggestions and fuzzy matching.
+
+Texts are UTF-8 encoded and every window of ``n`` bytes is coded as its
+big-endian integer. Texts never contain NUL bytes, so the codes of
+different window sizes (bigrams < 2**16 <= trigrams) never collide.
+"""
+import numpy as np
+
+
+def gram_codes(data, n):
+    """Return the codes of the ``n``-byte windows of an int64 array of bytes."""
+    count = len(data) - n + 1
+    if count <= 0:
+        return np.empty(0, dtype=np.int64)
+    codes = np.zeros(count, dtype=np.int64)
+    for offset in range(n):
+        codes = (codes << 8) | data[offset:offset + count]
+    return codes
+
+
+def text_codes(text, n):
+    """Return the distinct ``n``-gram codes of ``text``."""
+    data = np.frombuffer(text.encode('utf-8'), dtype=np.uint8).astype(np.int64)
+    return set(gram_codes(data, n).tolist())
+
+
+def ngram_postings(texts, sizes):
+    """
+    Index the n-grams of ``texts`` (vectorized).
+
+    Args:
+        texts: Sequence of strings without NUL characters.
+        sizes: Window sizes to index, e.g. ``(2, 3)``.
+
+    Returns:
+        dict: {gram code: ascending int32 array of positions in ``texts``}
+    """
+    if not texts:
+        return {}
+    # All texts in one NUL separated buffer, with the position owning each byte
+    encoded = [text.encode('utf-8') for text in texts]
+    data = np.frombuffer(b'\0'.join(encoded) + b'\0', dtype=np.uint8).astype(np.int64)
+    owners = np.repeat(np.arange(len(encoded), dtype=np.int64), [len(text) + 1 for text in encoded])
+    keys = []
+    for n in sizes:
+        codes = gram_codes(data, n)
+        # Drop windows spanning a separator
+        spans_texts = np.zeros(len(codes), dtype=bool)
+        for offset in range(n):
+            spans_texts |= data[offset:offset + len(codes)] == 0
+        keys.append((codes[~spans_texts] << 32) | owners[:len(codes)][~spans_texts])
+    keys = np.unique(np.concatenate(keys))
+    codes, positions = keys >> 32, (keys & 0xFFFFFFFF).astype(np.int32)
+    starts = np.flatnonzero(np.diff(codes, prepend=-1))
+    ends = np.append(starts[1:], len(keys))
+    return {int(codes[start]): positions[start:end] for start, end in zip(starts, ends)}
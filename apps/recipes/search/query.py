@@ -0,0 +1,214 @@
+"""
+BM25 queries against the inverted search index.
+
+A query is tokenized like indexed text. Every term is a "slot"; the last
+term is also matched as a prefix while the user is still typing it, so
+"chick" finds "chicken". With ``MATCH_ALL`` a recipe must match every slot,
+with ``MATCH_ANY`` at least one. Scores are computed in the database from
+the postings with the usual BM25 formula::
+
+    boost(d) * idf(t) * w(t, d) * (k1 + 1) / (w(t, d) + k1 * (1 - b + b * len(d) / avglen))
+
+where ``w`` is the weighted term frequency stored in ``SearchPosting`` and
+``boost`` the recipe's quality factor (see ``index``).
+
+Terms without postings, and a prefix no term starts with, are replaced by
+their closest index terms (see ``fuzzy``), whose scores are weighted down.
+"""
+import math
+import time
+
+from django.core.cache import cache
+from django.db.models import Avg, Case, Count, F, FloatField, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+
+from .fuzzy import FUZZY_WEIGHT, FuzzyVocabulary
+from .text import tokenize
+from ..models import SearchDocument, SearchPosting, SearchTerm
+
+MATCH_ALL = 'all'
+MATCH_ANY = 'any'
+
+K1 = 1.2
+B = 0.75
+
+# Prefixes shorter than this are matched as whole terms only
+MIN_PREFIX_LENGTH = 3
+# Most frequent index terms a prefix expands to
+MAX_PREFIX_TERMS = 50
+
+STATS_CACHE_KEY = 'recipes:search:stats'
+STATS_CACHE_TIMEOUT = 300
+
+# Seconds a process keeps the fuzzy vocabulary
+FUZZY_VOCABULARY_TTL = 600
+
+# (loaded at, FuzzyVocabulary) of this process
+_fuzzy_vocabulary = None
+
+
+def parse_query(text):
+    """
+    Split a query into whole terms and an optional trailing prefix.
+
+    Returns:
+        tuple: (list of distinct terms, prefix or None)
+    """
+    terms = list(dict.fromkeys(tokenize(text)))
+    prefix = None
+    # A query that does not end with a space is still being typed
+    if terms and text[-1:].isalnum() and len(terms[-1]) >= MIN_PREFIX_LENGTH:
+        prefix = terms.pop()
+        if any(term.startswith(prefix) for term in terms):
+            # Another term already satisfies the prefix
+            terms.append(prefix)
+            prefix = None
+    return terms, prefix
+
+
+def index_stats():
+    """Return ``(number of indexed recipes, average weighted length)``, cached briefly."""
+    stats = cache.get(STATS_CACHE_KEY)
+    if stats is None:
+        aggregate = SearchDocument.objects.aggregate(count=Count('recipe_id'), avg_length=Avg('length'))
+        stats = (aggregate['count'], aggregate['avg_length'] or 0.0)
+        cache.set(STATS_CACHE_KEY, stats, STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def clear_index_stats():
+    global _fuzzy_vocabulary
+    cache.delete(STATS_CACHE_KEY)
+    _fuzzy_vocabulary = None
+
+
+def fuzzy_vocabulary():
+    """
+    Return the ``FuzzyVocabulary`` of the index terms, read from the
+    ``SearchTerm`` table maintained by ``index_documents`` and reloaded
+    every ``FUZZY_VOCABULARY_TTL`` seconds.
+    """
+    global _fuzzy_vocabulary
+    now = time.monotonic()
+    if _fuzzy_vocabulary is None or now - _fuzzy_vocabulary[0] >= FUZZY_VOCABULARY_TTL:
+        rows = list(SearchTerm.objects.values_list('term', 'df'))
+        _fuzzy_vocabulary = (now, FuzzyVocabulary([row[0] for row in rows], [row[1] for row in rows]))
+    return _fuzzy_vocabulary[1]
+
+
+def document_frequencies(terms, prefix=None):
+    """
+    Return ``{term: number of recipes}`` for ``terms`` and the index terms
+    starting with ``prefix`` (one query). Prefix matches are limited to the
+    ``MAX_PREFIX_TERMS`` most frequent ones.
+    """
+    condition = Q(term__in=terms)
+    if prefix:
+        condition |= Q(term__startswith=prefix)
+    frequencies = {}
+    prefix_terms = 0
+    for term, df in (
+        SearchPosting.objects.filter(condition)
+        .values_list('term')
+        .annotate(df=Count('recipe_id'))
+        .order_by('-df', 'term')
+    ):
+        if term not in terms:
+            if prefix_terms >= MAX_PREFIX_TERMS:
+                continue
+            prefix_terms += 1
+        frequencies[term] = df
+    return frequencies
+
+
+def rank(text, mode=MATCH_ALL):
+    """
+    Build the ranking for a query.
+
+    Returns:
+        QuerySet | None: ``SearchPosting`` values queryset with one row per
+        matching recipe (``recipe_id``, ``search_score``), or None when
+        ``text`` has no searchable terms.
+    """
+    terms, prefix = parse_query(text)
+    if not terms and not prefix:
+        return None
+
+    frequencies = document_frequencies(terms, prefix)
+    known = set(frequencies)
+    expansions = []
+    if prefix:
+        expansions = [term for term in frequencies if term.startswith(prefix) and term not in terms]
+
+    unknown = [term for term in terms if term not in known]
+    if prefix and not expansions:
+        unknown.append(prefix)
+    corrections = {}
+    if unknown:
+        corrections = fuzzy_vocabulary().correct_all(unknown)
+        corrected = [term for found in corrections.values() for term in found if term not in frequencies]
+        if corrected:
+            frequencies.update(document_frequencies(corrected))
+
+    slots = []
+    for term in terms:
+        if term in known:
+            slots.append([term])
+        elif term in corrections:
+            slots.append(corrections[term])
+    if expansions:
+        slots.append(expansions)
+    elif prefix in corrections:
+        slots.append(corrections[prefix])
+    missing_slot = len(slots) < len(terms) + (1 if prefix else 0)
+    fuzzy_terms = {term for found in corrections.values() for term in found if term not in known}
+
+    count, avg_length = index_stats()
+    if not slots or not count or (mode == MATCH_ALL and missing_slot):
+        return SearchPosting.objects.none().values('recipe_id').annotate(search_score=Value(0.0))
+
+    matched_terms = list(dict.fromkeys(term for slot in slots for term in slot if term in frequencies))
+    idf = Case(
+        *(
+            When(term=term, then=Value(
+                math.log(1 + (count - frequencies[term] + 0.5) / (frequencies[term] + 0.5))
+                * (FUZZY_WEIGHT if term in fuzzy_terms else 1.0)
+            ))
+            for term in matched_terms
+        ),
+        output_field=FloatField(),
+    )
+    norm = Value(K1 * (1 - B)) + Value(K1 * B / avg_length) * F('length')
+    score = F('boost') * idf * F('weight') * Value(K1 + 1) / (F('weight') + norm)
+
+    ranked = (
+        SearchPosting.objects.filter(term__in=matched_terms)
+        .values('recipe_id')
+        .annotate(search_score=Sum(score, output_field=FloatField()))
+    )
+    if mode == MATCH_ALL and len(slots) > 1:
+        slot = Case(
+            *(When(term__in=slot_terms, then=Value(i)) for i, slot_terms in enumerate(slots)),
+            output_field=IntegerField(),
+        )
+        ranked = ranked.annotate(matched_slots=Count(slot, distinct=True)).filter(matched_slots=len(slots))
+    return ranked
+
+
+def apply_search(queryset, text, mode=MATCH_ALL, with_score=True):
+    """
+    Restrict a ``Recipe`` queryset to the recipes matching ``text``.
+
+    With ``with_score`` the recipes are annotated with ``search_score`` so
+    callers can order by relevance.
+    """
+    ranked = rank(text, mode)
+    if ranked is None:
+        queryset = queryset.none()
+        return queryset.annotate(search_score=Value(0.0)) if with_score else queryset
+    queryset = queryset.filter(id__in=ranked.values('recipe_id'))
+    if with_score:
+        queryset = queryset.annotate(search_score=Subquery(
+            ranked.filter(recipe_id=OuterRef('pk')).values('search_score')[:1],
+            output_field=FloatField(),
+        ))
+    return queryset
@@ -0,0 +1,81 @@
+"""
+Shared cache of search result pages.
+
+A page is cached as its recipe ids, the total and the category facets,
+keyed by the normalized search: parsed query terms, match mode, category,
+sort, direction, cursor and page size. Nothing user specific is stored, so
+one entry serves every visitor; the pantry overlay (``missing_count``) is
+computed when the page is fetched.
+
+Entries are never deleted. Every key embeds the catalog generation, a
+counter bumped whenever indexed recipe data changes, so a bump makes all
+older entries unreachable and they expire on their own. This only needs
+``get``/``set``/``incr`` and works with any Django cache backend shared by
+the worker processes (see ``CACHES`` in the settings): with a per-process
+cache a bump would only reach the process that made it.
+"""
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .query import parse_query
+
+GENERATION_KEY = 'recipes:search:generation'
+RESULTS_KEY_PREFIX = 'recipes:search:results'
+RESULTS_CACHE_TIMEOUT = 600
+
+
+def _seed_generation():
+    # A counter lost to eviction restarts from the clock rather than from a small
+    # number that older cached keys are likely to embed
+    cache.add(GENERATION_KEY, int(time.time()), timeout=None)
+
+
+def catalog_generation():
+    """Return the current catalog generation."""
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        _seed_generation()
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_catalog_generation():
+    """Invalidate every cached search result page."""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        _seed_generation()
+
+
+def bump_catalog_generation_on_commit():
+    """Bump the generation once the current transaction commits (immediately outside one)."""
+    transaction.on_commit(bump_catalog_generation)
+
+
+def results_key(query, match, category, sort, direction, cursor, page_size, backend_version=None):
+    """
+    Return the cache key of a normalized search page.
+
+    ``backend_version`` separates the entries of backends serving different
+    data, e.g. processes that have not loaded a new memory index yet.
+    """
+    terms, prefix = parse_query(query)
+    normalized = json.dumps(
+        [terms, prefix, match, category, sort, direction if sort else '', cursor, page_size, backend_version],
+        separators=(',', ':'),
+    )
+    digest = hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+    return f'{RESULTS_KEY_PREFIX}:{catalog_generation()}:{digest}'
+
+
+def get_results(key):
+    """Return the cached ``(ids, total, category_counts, next_cursor, previous_cursor)`` or None."""
+    return cache.get(key)
+
+
+def set_results(key, ids, total, category_counts, next_cursor, previous_cursor):
+    cache.set(key, (ids, total, category_counts, next_cursor, previous_cursor), RESULTS_CACHE_TIMEOUT)
@@ -0,0 +1,183 @@
+"""
+Ingredient autocomplete.
+
+Ingredient names are held in memory by every worker with an n-gram index:
+for each bigram and trigram of the UTF-8 encoded, folded names, the sorted
+positions of the names containing it. A query's trigrams are intersected
+(rarest first) and the survivors are checked for the actual substring, so
+the result is the same as ``name__icontains`` without scanning every name.
+
+Names are stored by descending recipe popularity (number of
+``RecipeIngredient`` rows), so candidates come out in popularity order;
+matches at the start of the name, then at the start of a word, are ranked
+first.
+
+The index follows an ingredient version stamp kept in the shared cache and
+bumped when ingredients are created, renamed or deleted, and once at the end
+of every import (popularity changes). Recipe edits do not touch it. When the
+stamp moves, the process-wide suggester rebuilds its index on a background
+thread and keeps answering from the previous one until the new one is ready.
+"""
+import threading
+import time
+from collections import namedtuple
+from functools import reduce
+
+import numpy as np
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count
+
+from .ngrams import ngram_postings, text_codes
+from .text import fold
+from ..models import Ingredient
+
+MIN_QUERY_LENGTH = 2
+DEFAULT_LIMIT = 10
+
+INGREDIENT_VERSION_KEY = 'recipes:ingredients:version'
+
+# Loaded ingredient names, by descending popularity.
+#   ids:    ingredient ids
+#   names:  display names
+#   folded: folded names, as matched
+#   grams:  {gram code: int32 array of positions}
+SuggestIndex = namedtuple('SuggestIndex', ['ids', 'names', 'folded', 'grams'])
+
+
+def ingredient_version():
+    """Return the version stamp of the ingredient names."""
+    version = cache.get(INGREDIENT_VERSION_KEY)
+    if version is None:
+        # Restart from the clock so an evicted stamp never comes back to an
+        # older version
+        cache.add(INGREDIENT_VERSION_KEY, int(time.time()), timeout=None)
+        version = cache.get(INGREDIENT_VERSION_KEY)
+    return version
+
+
+def bump_ingredient_version():
+    """Make every process rebuild its suggestion index."""
+    try:
+        cache.incr(INGREDIENT_VERSION_KEY)
+    except ValueError:
+        cache.add(INGREDIENT_VERSION_KEY, int(time.time()), timeout=None)
+
+
+def bump_ingredient_version_on_commit():
+    """Bump the version once the current transaction commits (immediately outside one)."""
+    transaction.on_commit(bump_ingredient_version)
+
+
+def build_suggest_index():
+    """Load every ingredient with its popularity into a ``SuggestIndex`` (one query)."""
+    rows = list(
+        Ingredient.objects.annotate(uses=Count('recipeingredient'))
+        .order_by('-uses', 'name')
+        .values_list('id', 'name')
+    )
+    folded = [fold(name) for _, name in rows]
+    return SuggestIndex([row[0] for row in rows], [row[1] for row in rows], folded, ngram_postings(folded, (2, 3)))
+
+
+class IngredientSuggester:
+    """
+    Suggest ingredients for a partial name.
+
+    The ingredient version is checked at most every ``refresh_interval``
+    seconds. Only the first index is built on the calling thread; with
+    ``background`` later rebuilds run on a separate thread while the
+    previous index keeps serving, otherwise they run on the calling thread.
+    """
+
+    def __init__(self, refresh_interval=60, background=False):
+        self.refresh_interval = refresh_interval
+        self.background = background
+        self._index = None
+        self._version = None
+        self._checked_at = None
+        self._building = False
+        self._lock = threading.Lock()
+
+    @property
+    def index(self):
+        now = time.monotonic()
+        if self._index is None or now - self._checked_at >= self.refresh_interval:
+            rebuild_version = None
+            with self._lock:
+                if self._index is None:
+                    self._version = ingredient_version()
+                    self._index = build_suggest_index()
+                    self._checked_at = now
+                elif now - self._checked_at >= self.refresh_interval:
+                    self._checked_at = now
+                    version = ingredient_version()
+                    if version != self._version and not self._building:
+                        self._building = True
+                        rebuild_version = version
+            if rebuild_version is not None:
+                if self.background:
+                    threading.Thread(target=self._rebuild, args=(rebuild_version,), daemon=True).start()
+                else:
+                    self._rebuild(rebuild_version)
+        return self._index
+
+    def _rebuild(self, version):
+        try:
+            index = build_suggest_index()
+            with self._lock:
+                self._index, self._version = index, version
+        finally:
+            self._building = False
+            if self.background:
+                # The thread's own connection would otherwise stay open
+                connection.close()
+
+    def suggest(self, query, limit=DEFAULT_LIMIT, exclude_ids=()):
+        """
+        Return up to ``limit`` ``(id, name)`` pairs of ingredients whose name
+        contains ``query``, best first.
+        """
+        query = fold(query).strip()
+        if len(query) < MIN_QUERY_LENGTH:
+            return []
+        index = self.index
+
+        if len(query.encode('utf-8')) == 2:
+            candidates = index.grams.get(text_codes(query, 2).pop())
+        else:
+            postings = [index.grams.get(code) for code in text_codes(query, 3)]
+            if any(positions is None for positions in postings):
+                return []
+            postings.sort(key=len)
+            candidates = reduce(lambda a, b: np.intersect1d(a, b, assume_unique=True), postings)
+        if candidates is None:
+            return []
+
+        # Containing every trigram does not imply containing the query, so
+        # each candidate is checked
+        exclude_ids = set(exclude_ids)
+        ranked = ([], [], [])
+        for position in candidates.tolist():
+            text = index.folded[position]
+            start = text.find(query)
+            if start < 0 or index.ids[position] in exclude_ids:
+                continue
+            if start == 0:
+                ranked[0].append(position)
+                if len(ranked[0]) >= limit:
+                    break
+            elif not text[start - 1].isalnum():
+                ranked[1].append(position)
+            else:
+                ranked[2].append(position)
+        positions = (ranked[0] + ranked[1] + ranked[2])[:limit]
+        return [(index.ids[position], index.names[position]) for position in positions]
+
+
+_suggester = IngredientSuggester(background=True)
+
+
+def suggest_ingredients(query, limit=DEFAULT_LIMIT, exclude_ids=()):
+    """Suggest ingredients with the process-wide ``IngredientSuggester``."""
+    return _suggester.suggest(query, limit, exclude_ids)
@@ -0,0 +1,61 @@
+"""
+Tokenization shared by the search index and search queries.
+
+Text is folded to lower-case ASCII, split on anything that is not a letter
+or digit, stripped of stopwords and reduced with a small suffix stemmer so
+"tomatoes", "berries" and "cookies" match "tomato", "berry" and "cookie".
+"""
+import re
+import unicodedata
+
+# Longest term stored in ``SearchPosting.term``
+MAX_TERM_LENGTH = 64
+
+STOPWORDS = frozenset(
+    'a an and are as at be by for from in into is it of on or the to with'.split()
+)
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def fold(text):
+    """Lower-case ``text`` and strip accents."""
+    text = unicodedata.normalize('NFKD', str(text))
+    return ''.join(char for char in text if not unicodedata.combining(char)).lower()
+
+
+def stem(token):
+    """Reduce plural and -y/-ie endings to a common stem."""
+    if token.isdigit():
+        return token
+    # Each step is only kept when it leaves at least three letters, so short
+    # words keep their meaning: "pies" -> "pie", "gas" stays "gas"
+    if token.endswith('ies'):
+        stemmed = token[:-1]
+    elif token.endswith(('oes', 'ches', 'shes', 'xes', 'sses')):
+        stemmed = token[:-2]
+    elif token.endswith('s') and not token.endswith(('ss', 'us', 'is')):
+        stemmed = token[:-1]
+    else:
+        stemmed = token
+    if len(stemmed) >= 3:
+        token = stemmed
+
+    if token.endswith('ie'):
+        stemmed = token[:-1]
+    elif token.endswith('y'):
+        stemmed = token[:-1] + 'i'
+    else:
+        stemmed = token
+    return stemmed if len(stemmed) >= 3 else token
+
+
+def tokenize(text):
+    """Return the list of search terms of ``text``, in order."""
+    if not text or not isinstance(text, str):
+        return []
+    return [
+        stem(token)[:MAX_TERM_LENGTH]
+        for token in TOKEN_RE.findall(fold(text))
+        if token not in STOPWORDS and len(token) > 1
+    ]
@@ -0,0 +1,29 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Ingredient, Tag
+from .search.index import reindex_recipes_using
+from .search.suggest import bump_ingredient_version_on_commit
+
+
+@receiver(post_save, sender=Ingredient)
+def reindex_ingredient_recipes(sender, instance, created, **kwargs):
+    """Renaming an ingredient changes the indexed text of every recipe using it (see ``reindex_recipes_using``)."""
+    if not created:
+        transaction.on_commit(lambda: reindex_recipes_using(ingredient_ids=[instance.pk]))
+    # New and renamed names must show up in ingredient suggestions
+    bump_ingredient_version_on_commit()
+
+
+@receiver(post_delete, sender=Ingredient)
+def forget_ingredient(sender, instance, **kwargs):
+    bump_ingredient_version_on_commit()
+
+
+@receiver(post_save, sender=Tag)
+def reindex_tag_recipes(sender, instance, created, **kwargs):
+    """Renaming a tag changes the indexed text of every recipe using it (see ``reindex_recipes_using``)."""
+    if not created:
+        transaction.on_commit(lambda: reindex_recipes_using(tag_ids=[instance.pk]))
+
@@ -1,3 +1,1234 @@
-from django.test import TestCase
+import asyncio
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from apps.pantry.contents import bump_pantry_version
+from apps.pantry.models import UserPantry
+
+from . import coverage
+from .cards import card_decorations
+from .carousel import bump_carousel_version_on_commit, carousel_cards
+from .coverage import CoverageEngine, CoverageIndex, reset_coverage
+from .image_checks import check_image_urls
+from .ingredient_parser import parse_ingredient_line
+from .importing.converters import convert_datetimes, convert_decimals, convert_durations, convert_ints
+from .importing.children import build_children, load_children, sync_children
+from .importing.literals import LiteralSyntaxError, parse_list, parse_literal_list
+from .importing.parsing import parse_images
+from .importing.payloads import parse_batch
+from .importing.readers import iter_batches
+from .importing.vocabulary import Vocabulary
+from .models import (
+    CarouselItem, CoverageChange, Ingredient, Recipe, RecipeImage, RecipeIngredient, RecipeStep, RecipeTag,
+    SearchDocument, SearchTerm, Tag, UserRecipeCollection,
+)
+from .pagination import MAX_PAGE_SIZE, InvalidCursor
+from .search.backends import DatabaseBackend, MemoryBackend
+from .search.execution import execute_search
+from .search.index import build_memory_index, index_recipes
+from .search.memory import MemoryIndex, decode_varints, encode_varints, write_index
+from .search.query import clear_index_stats, fuzzy_vocabulary, parse_query
+from .views import recipe_detail
+from .search import suggest
+from .search.result_cache import bump_catalog_generation
+from .search.suggest import IngredientSuggester, bump_ingredient_version
+from .search.text import stem, tokenize
+
+
+def best(hits):
+    """Return the id of the best scored hit (ties go to the lowest id)."""
+    return int(max(zip(hits.scores, hits.ids), key=lambda hit: (hit[0], -hit[1]))[1])
+
+
+# Query budgets count database queries only, so they run on an in-process
+# cache whatever backend the settings configure
+LOCAL_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def make_recipe(recipe_id, **fields):
+    values = {
+        'recipe_id': recipe_id,
+        'name': f'Recipe {recipe_id}',
+        'cook_time': timedelta(minutes=30),
+        'date_published': timezone.now(),
+        'description': '',
+        'recipe_category': 'Dinner',
+        'aggregated_rating': Decimal('4.0'),
+        'review_count': 0,
+        'calories': Decimal('0'),
+        'fat_content': Decimal('0'),
+        'saturated_fat_content': Decimal('0'),
+        'cholesterol_content': Decimal('0'),
+        'sodium_content': Decimal('0'),
+        'carbohydrate_content': Decimal('0'),
+        'fiber_content': Decimal('0'),
+        'sugar_content': Decimal('0'),
+        'protein_content': Decimal('0'),
+        'serving_size': '',
+        'servings': 1,
+    }
+    values.update(fields)
+    return Recipe.objects.create(**values)
+
+
+class StubImageHandler(BaseHTTPRequestHandler):
+    """Serve 200 for /ok, 405 on HEAD for /no-head, 429 for /busy, 503 for /down and 404 otherwise."""
+
+    def do_HEAD(self):
+        if self.path == '/no-head':
+            self._reply(405)
+        elif self.path in ('/busy', '/down'):
+            self._reply(429 if self.path == '/busy' else 503)
+        else:
+            self._reply(200 if self.path == '/ok' else 404)
+
+    def do_GET(self):
+        self._reply(206 if self.path in ('/ok', '/no-head') else 404)
+
+    def _reply(self, status):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServerMixin:
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubImageHandler)
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_port}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+
+class ImageCheckTests(StubServerMixin, SimpleTestCase):
+    def test_check_image_urls(self):
+        urls = [
+            f'{self.base_url}/ok', f'{self.base_url}/no-head', f'{self.base_url}/gone', 'not a url',
+            f'{self.base_url}/busy', f'{self.base_url}/down', 'http://127.0.0.1:1/refused',
+        ]
+        results = asyncio.run(check_image_urls(urls, concurrency=2, per_host=1, rate=100))
+
+        self.assertEqual(
+            {url: result.ok for url, result in results.items()},
+            dict(zip(urls, [True, True, False, False, None, None, None])),
+        )
+        self.assertEqual(results[f'{self.base_url}/no-head'].status, 206)
+        self.assertEqual(results[f'{self.base_url}/gone'].status, 404)
+
+
+class VerifyRecipeImagesTests(StubServerMixin, TestCase):
+    def test_command_stores_results_and_respects_recheck_interval(self):
+        recipe = make_recipe(1)
+        ok = RecipeImage.objects.create(recipe=recipe, url=f'{self.base_url}/ok', order=0)
+        gone = RecipeImage.objects.create(recipe=recipe, url=f'{self.base_url}/gone', order=1)
+        recent = RecipeImage.objects.create(
+            recipe=recipe, url=f'{self.base_url}/gone', order=2,
+            status=RecipeImage.STATUS_ACCESSIBLE, last_checked=timezone.now(),
+        )
+        busy = RecipeImage.objects.create(recipe=recipe, url=f'{self.base_url}/busy', order=3)
+
+        call_command('verify_recipe_images', '--batch-size', '1', stdout=StringIO())
+
+        for image in (ok, gone, recent, busy):
+            image.refresh_from_db()
+        self.assertEqual(ok.status, RecipeImage.STATUS_ACCESSIBLE)
+        self.assertEqual(gone.status, RecipeImage.STATUS_INACCESSIBLE)
+        self.assertIsNotNone(gone.last_checked)
+        self.assertEqual(recent.status, RecipeImage.STATUS_ACCESSIBLE)
+        # Rate limited: left unchecked so the next run retries it
+        self.assertEqual(busy.status, RecipeImage.STATUS_PENDING)
+        self.assertIsNone(busy.last_checked)
+        self.assertEqual(recipe.card_image, ok)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class SearchQueryBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('cook', 'cook@example.com', 'secret')
+        flour, egg, milk = (Ingredient.objects.create(name=name) for name in ('flour', 'egg', 'milk'))
+        UserPantry.objects.create(user=cls.user, ingredient=flour)
+        UserPantry.objects.create(user=cls.user, ingredient=egg)
+        for i in range(1, 13):
+            recipe = make_recipe(i, name=f'Pancake {i}', recipe_category='Dessert' if i % 3 == 2 else 'Breakfast')
+            RecipeImage.objects.create(recipe=recipe, url=f'https://example.com/{i}.jpg', order=0)
+            for ingredient in (flour, egg, milk)[:i % 3 + 1]:
+                RecipeIngredient.objects.create(recipe=recipe, ingredient=ingredient, raw_string=ingredient.name)
+        index_recipes(Recipe.objects.values_list('id', flat=True))
+
+    def setUp(self):
+        # Search statistics and result pages
+        cache.clear()
+        engine = mock.patch.object(coverage, '_engine', CoverageEngine())
+        engine.start()
+        self.addCleanup(engine.stop)
+
+    def missing_counts(self, results, user=None):
+        decorations = card_decorations([recipe.pk for recipe in results.recipes], user or self.user)
+        return [decorations[recipe.pk].missing_count for recipe in results.recipes]
+
+    def test_page_facets_and_missing_counts(self):
+        # Loads the coverage index and caches the pantry
+        execute_search(sort='missing', user=self.user)
+        with self.assertNumQueries(1):
+            results = execute_search(sort='missing', direction='asc', user=self.user, page_size=5)
+        # Images, hearts and missing counts of the page
+        with self.assertNumQueries(1):
+            decorations = card_decorations([recipe.pk for recipe in results.recipes], self.user)
+
+        self.assertEqual(results.total, 12)
+        self.assertEqual(results.category_counts, {'Breakfast': 8, 'Dessert': 4})
+        self.assertEqual(
+            [decorations[recipe.pk] for recipe in results.recipes],
+            [(f'https://example.com/{recipe.recipe_id}.jpg', False, 0) for recipe in results.recipes],
+        )
+
+        results = execute_search(category='Dessert', user=self.user, max_missing=0)
+        self.assertEqual(results.total, 0)
+        self.assertEqual(results.category_counts, {'Breakfast': 8})
+        results = execute_search(category='Breakfast', sort='missing', user=self.user, max_missing=0)
+        self.assertEqual(results.total, 8)
+        self.assertEqual({recipe.recipe_category for recipe in results.recipes}, {'Breakfast'})
+        results = execute_search('pancake', user=self.user, max_missing=1, backend=DatabaseBackend())
+        self.assertEqual(results.total, 12)
+
+    def test_missing_counts_include_related_ingredients(self):
+        milk = Ingredient.objects.get(name='milk')
+        pantry_item = UserPantry.objects.get(user=self.user, ingredient__name='flour')
+        # A duplicate ingredient line is missing once
+        RecipeIngredient.objects.create(recipe=Recipe.objects.get(recipe_id=2), ingredient=milk, raw_string='milk')
+        results = execute_search(sort='missing', direction='desc', user=self.user, page_size=1)
+        self.assertEqual([recipe.recipe_id for recipe in results.recipes], [2])
+        self.assertEqual(self.missing_counts(results), [1])
+
+        pantry_item.related_ingredients.add(milk)
+        bump_pantry_version(self.user.pk)
+        self.assertEqual(execute_search(user=self.user, max_missing=0).total, 12)
+        # The card decorations agree with the coverage index
+        results = execute_search(user=self.user, page_size=12)
+        self.assertEqual(self.missing_counts(results), [0] * 12)
+
+    def test_text_search_budget(self):
+        # Term statistics (read once per query text), then the facets and the page
+        with self.assertNumQueries(4):
+            results = execute_search('pancake', category='Dessert', user=self.user, backend=DatabaseBackend())
+        self.assertEqual(results.total, 4)
+        self.assertEqual(results.category_counts, {'Breakfast': 8, 'Dessert': 4})
+        self.assertEqual(self.missing_counts(results), [1, 1, 1, 1])
+
+    def test_results_are_cached_until_the_catalog_changes(self):
+        execute_search('pancake', user=self.user, backend=DatabaseBackend())
+        # Same normalized query: only the page is fetched
+        with self.assertNumQueries(1):
+            results = execute_search('PANCAKE', user=self.user, backend=DatabaseBackend())
+        self.assertEqual(results.total, 12)
+
+        # The page is shared, the pantry overlay is not
+        other = get_user_model().objects.create_user('guest', 'guest@example.com', 'secret')
+        with self.assertNumQueries(1):
+            results = execute_search('pancake', user=other, backend=DatabaseBackend())
+        self.assertEqual(
+            self.missing_counts(results, other),
+            [recipe.recipe_ingredients.count() for recipe in results.recipes],
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            index_recipes([make_recipe(13, name='Pancake 13').pk])
+        results = execute_search('pancake', user=self.user, backend=DatabaseBackend())
+        self.assertEqual(results.total, 13)
+
+    def test_view_queries_do_not_grow_with_page_size(self):
+        self.client.force_login(self.user)
+        # Caches the pantry
+        self.client.get('/recipes/search/')
+        UserRecipeCollection.objects.create(user=self.user, recipe=Recipe.objects.get(recipe_id=1))
+        # Session, user, facets, page and card decorations
+        with self.assertNumQueries(5) as small:
+            self.client.get('/recipes/search/', {'page_size': 2})
+        with self.assertNumQueries(len(small.captured_queries)):
+            response = self.client.get('/recipes/search/', {'page_size': 12})
+        self.assertEqual(len(response.context['recipes']), 12)
+        self.assertContains(response, 'heart-link filled', count=1)
+        self.assertContains(response, 'https://example.com/12.jpg')
+        self.assertEqual(response.context['page_size'], 12)
+
+        response = self.client.get('/recipes/search/', {'page_size': 10 ** 6, 'cursor': 'garbage'})
+        self.assertEqual(response.context['page_size'], MAX_PAGE_SIZE)
+        self.assertEqual(len(response.context['recipes']), 12)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class RecipeDetailQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('cook', 'cook@example.com', 'secret')
+        cls.recipe = make_recipe(1, name='Shakshuka')
+
+    def setUp(self):
+        cache.clear()
+
+    def grow(self, size):
+        """Add ``size`` ingredient lines, steps, tags, images, pantry items and saved recipes."""
+        start = self.recipe.recipe_ingredients.count()
+        for i in range(start, start + size):
+            ingredient = Ingredient.objects.create(name=f'ingredient {i}')
+            RecipeIngredient.objects.create(recipe=self.recipe, ingredient=ingredient, raw_string=ingredient.name)
+            RecipeStep.objects.create(recipe=self.recipe, step_number=i, order=i, description=f'Step {i}')
+            RecipeTag.objects.create(recipe=self.recipe, tag=Tag.objects.create(name=f'tag {i}'))
+            RecipeImage.objects.create(recipe=self.recipe, url=f'https://example.com/{i}.jpg', order=i)
+            # Every other ingredient is in the pantry, half of them as related ingredients
+            if i % 2 == 0:
+                item = UserPantry.objects.create(user=self.user, ingredient=Ingredient.objects.create(name=f'staple {i}'))
+                if i % 4 == 0:
+                    item.related_ingredients.add(ingredient)
+                else:
+                    UserPantry.objects.create(user=self.user, ingredient=ingredient)
+            UserRecipeCollection.objects.create(user=self.user, recipe=make_recipe(100 + i))
+        bump_pantry_version(self.user.pk)
+
+    def render(self, user):
+        request = RequestFactory().get(f'/recipes/recipe/{self.recipe.recipe_id}/')
+        request.user = user
+        return recipe_detail(request, self.recipe.recipe_id).content.decode()
+
+    def test_query_count_does_not_grow(self):
+        for size in (2, 20):
+            with self.subTest(size=size):
+                self.grow(size)
+                # Recipe with collection flag, ingredients, steps, tags, images and the pantry
+                with self.assertNumQueries(6):
+                    content = self.render(self.user)
+                lines = self.recipe.recipe_ingredients.count()
+                # The pantry is cached until it changes
+                with self.assertNumQueries(5):
+                    self.assertEqual(self.render(self.user).count('is in your pantry'), lines // 2)
+                self.assertEqual(content.count('is in your pantry'), lines // 2)
+                self.assertEqual(content.count('is not in your pantry'), lines - lines // 2)
+                self.assertIn('Add to Collection', content)
+                with self.assertNumQueries(5):
+                    self.render(AnonymousUser())
+
+        UserRecipeCollection.objects.create(user=self.user, recipe=self.recipe)
+        self.assertIn('Remove from Collection', self.render(self.user))
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class PersonalRecipesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('cook', 'cook@example.com', 'secret')
+        cls.flour, cls.egg, cls.milk = (Ingredient.objects.create(name=name) for name in ('flour', 'egg', 'milk'))
+        UserPantry.objects.create(user=cls.user, ingredient=cls.flour)
+        for i in range(1, 10):
+            recipe = make_recipe(
+                i, cook_time=timedelta(minutes=10 * i), total_time=timedelta(minutes=10 * i),
+                aggregated_rating=Decimal(i % 5),
+            )
+            RecipeImage.objects.create(recipe=recipe, url=f'https://example.com/{i}.jpg', order=0)
+            for ingredient in (cls.flour, cls.egg, cls.milk)[:i % 3 + 1]:
+                RecipeIngredient.objects.create(recipe=recipe, ingredient=ingredient, raw_string=ingredient.name)
+            saved = UserRecipeCollection.objects.create(user=cls.user, recipe=recipe, category='Brunch' if i % 2 else None)
+            UserRecipeCollection.objects.filter(pk=saved.pk).update(added_at=saved.added_at + timedelta(minutes=i))
+        # Not in the collection
+        make_recipe(10)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def pages(self, **params):
+        """Follow the next cursors from the first page and return every item."""
+        items, params = [], {**params, 'page_size': 4}
+        while True:
+            response = self.client.get('/recipes/my-recipes/', params)
+            items += response.context['recipes']
+            params['cursor'] = response.context['next_cursor']
+            if params['cursor'] is None:
+                return items
+
+    def test_sorts_filters_and_pages_in_the_database(self):
+        items = self.pages()
+        self.assertEqual([item['recipe'].recipe_id for item in items], list(range(9, 0, -1)))
+        self.assertEqual({item['category'] for item in items}, {'Brunch', 'Uncategorized'})
+        for item in items:
+            self.assertEqual(item['missing_ingredients_count'], item['recipe'].recipe_id % 3)
+
+        items = self.pages(sort='missing', direction='desc')
+        self.assertEqual(
+            [(item['missing_ingredients_count'], item['recipe'].recipe_id) for item in items],
+            sorted(((i % 3, i) for i in range(1, 10)), key=lambda pair: (-pair[0], pair[1])),
+        )
+        items = self.pages(sort='time', direction='desc')
+        self.assertEqual([item['recipe'].recipe_id for item in items], list(range(9, 0, -1)))
+        items = self.pages(filter='available', sort='rating')
+        self.assertEqual([item['recipe'].recipe_id for item in items], [6, 3, 9])
+
+    def test_filters_categories_across_pages(self):
+        items = self.pages(category='Brunch')
+        self.assertEqual([item['recipe'].recipe_id for item in items], [9, 7, 5, 3, 1])
+        items = self.pages(category='Uncategorized', sort='time')
+        self.assertEqual([item['recipe'].recipe_id for item in items], [2, 4, 6, 8])
+        items = self.pages(category=['Brunch', 'Uncategorized'])
+        self.assertEqual(len(items), 9)
+        response = self.client.get('/recipes/my-recipes/', {'category': 'Brunch', 'page_size': 4})
+        self.assertEqual(response.context['current_categories'], ['Brunch'])
+        # The other categories stay selectable
+        self.assertEqual(response.context['categories'], ['Brunch', 'Uncategorized'])
+        self.assertContains(response, '&category=Brunch&page_size=4"')
+
+    def test_query_count_does_not_grow_with_the_collection(self):
+        # Caches the pantry
+        self.client.get('/recipes/my-recipes/')
+        # Session, user, the page with its images and the categories
+        with self.assertNumQueries(5):
+            response = self.client.get('/recipes/my-recipes/', {'sort': 'missing'})
+        self.assertEqual(response.context['categories'], ['Brunch', 'Uncategorized'])
+        for i in range(11, 60):
+            recipe = make_recipe(i, total_time=timedelta(minutes=30))
+            RecipeIngredient.objects.create(recipe=recipe, ingredient=self.milk, raw_string='milk')
+            UserRecipeCollection.objects.create(user=self.user, recipe=recipe)
+        with self.assertNumQueries(5):
+            response = self.client.get('/recipes/my-recipes/', {'sort': 'missing'})
+        self.assertEqual(len(response.context['recipes']), 35)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class HomeCarouselTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('cook', 'cook@example.com', 'secret')
+        for i in range(1, 5):
+            recipe = make_recipe(i, name=f'Featured {i}', total_time=timedelta(minutes=45))
+            image = RecipeImage.objects.create(recipe=recipe, url=f'https://example.com/{i}.jpg', order=0)
+            CarouselItem.objects.create(recipe=recipe, image=image, order=-i, active=i != 4)
+        UserRecipeCollection.objects.create(user=cls.user, recipe=Recipe.objects.get(recipe_id=2))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_visitors_are_served_from_the_cache(self):
+        self.client.get('/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/')
+        self.assertEqual([card.recipe_id for card in response.context['carousel_items']], [3, 2, 1])
+        self.assertContains(response, 'https://example.com/3.jpg')
+        self.assertNotContains(response, 'heart-link filled')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeImage.objects.filter(url='https://example.com/3.jpg').update(status=RecipeImage.STATUS_INACCESSIBLE)
+            CarouselItem.objects.filter(recipe__recipe_id=4).update(active=True)
+            # Bulk updates leave the cached cards alone until the version is bumped
+            bump_carousel_version_on_commit()
+        response = self.client.get('/')
+        self.assertEqual([card.recipe_id for card in response.context['carousel_items']], [4, 2, 1])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.filter(recipe_id=2).update(name='Renamed')
+            index_recipes([Recipe.objects.get(recipe_id=2).pk])
+        self.assertContains(self.client.get('/'), 'Renamed')
+
+    def test_admin_changes_rebuild_the_carousel(self):
+        self.client.get('/')
+        admin_user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(admin_user)
+        item = CarouselItem.objects.get(recipe__recipe_id=3)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/admin/recipes/carouselitem/{item.pk}/delete/', {'post': 'yes'})
+        self.client.logout()
+        response = self.client.get('/')
+        self.assertEqual([card.recipe_id for card in response.context['carousel_items']], [2, 1])
+
+    def test_heart_state_is_one_query(self):
+        self.client.force_login(self.user)
+        self.client.get('/')
+        # Session, user and the saved featured recipes
+        with self.assertNumQueries(3):
+            response = self.client.get('/')
+        self.assertEqual(response.context['collected_ids'], {Recipe.objects.get(recipe_id=2).pk})
+        self.assertContains(response, 'heart-link filled', count=1)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class CoverageIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ingredients = [Ingredient.objects.create(name=f'ingredient {i}') for i in range(100)]
+        for i in range(1, 31):
+            recipe = make_recipe(i, recipe_category='Dessert' if i % 2 else 'Dinner')
+            # Uneven popularity: multiples of i, plus one in seven ingredients
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient, raw_string=ingredient.name)
+                for j, ingredient in enumerate(cls.ingredients)
+                if j % i == 0 or (i + j) % 7 == 0
+            )
+        cls.pantry = frozenset(ingredient.id for ingredient in cls.ingredients[::3])
+
+    def setUp(self):
+        cache.clear()
+
+    def expected_missing(self, index):
+        ingredients = {pk: set() for pk in index.pks.tolist()}
+        for recipe_pk, ingredient_pk in RecipeIngredient.objects.values_list('recipe_id', 'ingredient_id'):
+            ingredients[recipe_pk].add(ingredient_pk)
+        return [len(ingredients[pk] - self.pantry) for pk in index.pks.tolist()]
+
+    def test_missing_counts_match_the_ingredient_sets(self):
+        # One head word leaves the rarer ingredients to the tail
+        for head_words in (1, 4):
+            with self.subTest(head_words=head_words):
+                index = CoverageIndex.build(head_words=head_words)
+                self.assertEqual(index.missing_counts(self.pantry).tolist(), self.expected_missing(index))
+                self.assertEqual(index.missing_counts(frozenset()).tolist(), index.sizes.tolist())
+        self.assertTrue(len(CoverageIndex.build(head_words=1).tail_bits))
+
+    def test_published_index_is_patched_with_recorded_changes(self):
+        with tempfile.TemporaryDirectory() as index_dir:
+            call_command('build_coverage_index', '--index-dir', index_dir, stdout=StringIO())
+            engine = CoverageEngine(index_dir, refresh_interval=0)
+            # The change log only
+            with self.assertNumQueries(1):
+                self.assertEqual(len(engine.index), 30)
+
+            added = Ingredient.objects.create(name='saffron')
+            with self.captureOnCommitCallbacks(execute=True):
+                first, second = Recipe.objects.filter(recipe_id__in=[1, 2]).order_by('recipe_id')
+                RecipeIngredient.objects.create(recipe=first, ingredient=added, raw_string='')
+                recipe = make_recipe(31, recipe_category='Brunch')
+                RecipeIngredient.objects.create(recipe=recipe, ingredient=self.ingredients[3], raw_string='')
+                changed = [first.pk, second.pk, recipe.pk]
+                second.delete()
+                # As the admin and the import do once the rows are written
+                index_recipes(changed)
+            # The log, then only the changed recipes
+            with self.assertNumQueries(3):
+                index = engine.index
+            self.assertEqual(len(index), 30)
+            self.assertEqual(index.missing_counts(self.pantry).tolist(), self.expected_missing(index))
+            self.assertEqual(index.category_names[index.categories[-1]], 'Brunch')
+
+            # Changes are kept while the published file predates them
+            call_command('build_coverage_index', '--index-dir', index_dir, stdout=StringIO())
+            self.assertTrue(CoverageChange.objects.exists())
+            call_command('build_coverage_index', '--index-dir', index_dir, stdout=StringIO())
+            self.assertFalse(CoverageChange.objects.exists())
+
+    def test_changes_recorded_by_another_process_are_patched(self):
+        engine = CoverageEngine(refresh_interval=0)
+        self.assertEqual(len(engine.index), 30)
+        # A process with a cache of its own records the change
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'other-process',
+        }}):
+            with self.captureOnCommitCallbacks(execute=True):
+                RecipeIngredient.objects.filter(recipe__recipe_id=1).delete()
+                index_recipes([Recipe.objects.get(recipe_id=1).pk])
+        index = engine.index
+        self.assertEqual(index.sizes[index.positions([Recipe.objects.get(recipe_id=1).pk])[0]].tolist(), [0])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            transaction.on_commit(reset_coverage)
+        with mock.patch.object(CoverageIndex, 'build', wraps=CoverageIndex.build) as build:
+            engine.index
+        build.assert_called_once()
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(1, 11):
+            make_recipe(
+                i, name=f'Stew {i}',
+                # Repeated and missing keys exercise the id tie-breaker and NULL handling
+                total_time=timedelta(minutes=10 * (i % 3)) if i % 4 else None,
+                aggregated_rating=Decimal(i % 5),
+            )
+        index_recipes(Recipe.objects.values_list('id', flat=True))
+
+    def setUp(self):
+        # Search statistics and result pages
+        cache.clear()
+        engine = mock.patch.object(coverage, '_engine', CoverageEngine())
+        engine.start()
+        self.addCleanup(engine.stop)
+
+    def walk(self, **search):
+        """Return the recipe ids of every page, following next then previous cursors."""
+        pages = []
+        results = execute_search(page_size=3, backend=DatabaseBackend(), **search)
+        pages.append([recipe.id for recipe in results.recipes])
+        while results.next_cursor:
+            results = execute_search(cursor=results.next_cursor, page_size=3, backend=DatabaseBackend(), **search)
+            pages.append([recipe.id for recipe in results.recipes])
+        backwards = [pages[-1]]
+        while results.previous_cursor:
+            results = execute_search(cursor=results.previous_cursor, page_size=3, backend=DatabaseBackend(), **search)
+            backwards.insert(0, [recipe.id for recipe in results.recipes])
+        self.assertEqual(backwards, pages)
+        return [pk for page in pages for pk in page]
+
+    def test_pages_cover_every_order_exactly_once(self):
+        user = get_user_model().objects.create_user('cook', 'cook@example.com', 'secret')
+        for sort, key in (('time', 'total_time'), ('rating', 'aggregated_rating'), ('date', 'created_at')):
+            for direction in ('asc', 'desc'):
+                with self.subTest(sort=sort, direction=direction):
+                    recipes = Recipe.objects.order_by('id')
+                    # Ties keep ascending ids (the sort is stable) and missing keys come last
+                    present = [r for r in recipes if getattr(r, key) is not None]
+                    present.sort(key=lambda r: getattr(r, key), reverse=direction == 'desc')
+                    expected = [r.id for r in present] + [r.id for r in recipes if getattr(r, key) is None]
+                    self.assertEqual(self.walk(sort=sort, direction=direction), expected)
+                    # Same order from the coverage index
+                    self.assertEqual(self.walk(sort=sort, direction=direction, user=user, max_missing=0), expected)
+
+        self.assertEqual(self.walk(), sorted(Recipe.objects.values_list('id', flat=True)))
+        self.assertEqual(self.walk(sort='missing', user=user), sorted(Recipe.objects.values_list('id', flat=True)))
+        self.assertEqual(len(self.walk(query='stew')), 10)
+        self.assertEqual(self.walk(query='stew', user=user, max_missing=0), self.walk(query='stew'))
+
+    def test_cursor_is_bound_to_its_order(self):
+        results = execute_search(sort='time', page_size=3)
+        with self.assertRaises(InvalidCursor):
+            execute_search(sort='rating', cursor=results.next_cursor, page_size=3)
+        with self.assertRaises(InvalidCursor):
+            execute_search(sort='time', cursor=results.next_cursor[:-2], page_size=3)
+
+    def test_page_links_keep_the_page_size(self):
+        response = self.client.get('/recipes/search/', {'page_size': 3})
+        self.assertContains(response, '&page_size=3"')
+        response = self.client.get('/recipes/search/', {'cursor': response.context['next_cursor'], 'page_size': 3})
+        self.assertEqual(len(response.context['recipes']), 3)
+
+
+class IngredientSuggestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('cook', 'cook@example.com', 'secret')
+        names = ['brown sugar', 'sugar', 'powdered sugar', 'sugar snap peas', 'Crème fraîche', 'fresh basil']
+        cls.ingredients = {name: Ingredient.objects.create(name=name) for name in names}
+        # Popularity: sugar > brown sugar > the rest
+        for i in range(1, 4):
+            recipe = make_recipe(i)
+            for name in ['sugar', 'brown sugar', 'sugar'][:i]:
+                RecipeIngredient.objects.get_or_create(
+                    recipe=recipe, ingredient=cls.ingredients[name], defaults={'raw_string': name}
+                )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_suggestions(self):
+        suggester = IngredientSuggester(refresh_interval=0)
+        names = lambda query, **kwargs: [name for _, name in suggester.suggest(query, **kwargs)]
+
+        # Name prefix, then word prefix, then anywhere; by popularity within each
+        self.assertEqual(names('sug'), ['sugar', 'sugar snap peas', 'brown sugar', 'powdered sugar'])
+        self.assertEqual(names('gar', limit=2), ['sugar', 'brown sugar'])
+        self.assertEqual(names('FRA'), ['Crème fraîche'])
+        self.assertEqual(names('creme'), ['Crème fraîche'])
+        self.assertEqual(names('sugar peas'), [])
+        self.assertEqual(names('s'), [])
+        self.assertEqual(
+            names('su', exclude_ids=[self.ingredients['sugar'].id]),
+            ['sugar snap peas', 'brown sugar', 'powdered sugar'],
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='sugarcane')
+        self.assertIn('sugarcane', names('sugarc'))
+
+    def test_only_ingredient_changes_rebuild_the_index(self):
+        suggester = IngredientSuggester(refresh_interval=0)
+        suggester.suggest('sug')
+        with mock.patch.object(suggest, 'build_suggest_index', wraps=suggest.build_suggest_index) as build:
+            bump_catalog_generation()
+            suggester.suggest('sug')
+            build.assert_not_called()
+            with self.captureOnCommitCallbacks(execute=True):
+                Ingredient.objects.create(name='sugarcane')
+            suggester.suggest('sug')
+            build.assert_called_once()
+
+    def test_background_rebuild_keeps_serving_the_previous_index(self):
+        suggester = IngredientSuggester(refresh_interval=0, background=True)
+        self.assertEqual(suggester.suggest('basil'), [(self.ingredients['fresh basil'].id, 'fresh basil')])
+
+        release = threading.Event()
+        def slow_build():
+            release.wait(5)
+            return suggest.SuggestIndex([1], ['basil oil'], ['basil oil'], suggest.ngram_postings(['basil oil'], (2, 3)))
+        bump_ingredient_version()
+        with mock.patch.object(suggest, 'build_suggest_index', slow_build), mock.patch.object(suggest, 'connection'):
+            self.assertEqual(suggester.suggest('basil'), [(self.ingredients['fresh basil'].id, 'fresh basil')])
+            release.set()
+            for _ in range(100):
+                if not suggester._building:
+                    break
+                time.sleep(0.05)
+        self.assertEqual(suggester.suggest('basil'), [(1, 'basil oil')])
+
+    @mock.patch.object(suggest, '_suggester', IngredientSuggester(refresh_interval=0))
+    def test_views_use_suggestions(self):
+        self.client.force_login(self.user)
+        excluded = self.ingredients['sugar'].id
+        response = self.client.get('/pantry/search-ingredients/', {'q': 'sugar', 'exclude_id': excluded})
+        self.assertNotIn(excluded, [item['id'] for item in response.json()['ingredients']])
+        response = self.client.get('/shopping/search-ingredients/', {'q': 'basil'})
+        self.assertEqual(response.json(), {'ingredients': [{'id': self.ingredients['fresh basil'].id, 'name': 'fresh basil'}]})
+        response = self.client.get('/recipes/search/', {'q': 'sugar'})
+        self.assertEqual(
+            [name for _, name in response.context['matching_ingredients']],
+            ['sugar', 'sugar snap peas', 'brown sugar', 'powdered sugar'],
+        )
+        self.assertContains(response, 'href="?q=sugar%20snap%20peas"')
+
+
+class RelevanceRankingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        tomato = Ingredient.objects.create(name='tomato')
+        make_recipe(1, name='Tomato Soup')
+        RecipeTag.objects.create(recipe=make_recipe(2, name='Garden Stew'), tag=Tag.objects.create(name='tomato'))
+        RecipeIngredient.objects.create(recipe=make_recipe(3, name='Veggie Bake'), ingredient=tomato, raw_string='tomato')
+        make_recipe(4, name='Green Salad', description='No tomato here')
+        # Same text, different reviews
+        for recipe_id, rating, reviews in ((5, '2.0', 200), (6, '5.0', 1), (7, '5.0', 200)):
+            make_recipe(recipe_id, name='Lentil Curry', aggregated_rating=Decimal(rating), review_count=reviews)
+        index_recipes(Recipe.objects.values_list('id', flat=True))
+
+    def setUp(self):
+        cache.clear()
+        clear_index_stats()
+
+    def test_fields_then_quality_order_the_results(self):
+        with tempfile.TemporaryDirectory() as index_dir:
+            build_memory_index(index_dir)
+            for backend in (DatabaseBackend(), MemoryBackend(index_dir)):
+                with self.subTest(backend=type(backend).__name__):
+                    recipe_ids = lambda query: [
+                        recipe.recipe_id for recipe in execute_search(query, backend=backend).recipes
+                    ]
+                    # Name, then tags, then ingredients, then description
+                    self.assertEqual(recipe_ids('tomato'), [1, 2, 3, 4])
+                    # Well rated by many, then well rated by few, then poorly rated
+                    self.assertEqual(recipe_ids('lentil curry'), [7, 6, 5])
+                    results = execute_search('lentil', backend=backend, page_size=2)
+                    self.assertEqual([recipe.recipe_id for recipe in results.recipes], [7, 6])
+                    results = execute_search('lentil', backend=backend, page_size=2, cursor=results.next_cursor)
+                    self.assertEqual([recipe.recipe_id for recipe in results.recipes], [5])
+
+    def test_renames_reindex_small_sets_and_flag_large_ones(self):
+        recipe_ids = lambda query: [recipe.recipe_id for recipe in execute_search(query).recipes]
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.filter(name='tomato').update(name='heirloom')
+            Tag.objects.get(name='heirloom').save()
+        self.assertEqual(recipe_ids('heirloom'), [2])
+
+        ingredient = Ingredient.objects.get(name='tomato')
+        ingredient.name = 'roma'
+        with mock.patch('apps.recipes.search.index.INLINE_REINDEX_LIMIT', 0):
+            with self.captureOnCommitCallbacks(execute=True):
+                ingredient.save()
+        self.assertEqual(recipe_ids('roma'), [])
+        self.assertEqual(list(SearchDocument.objects.filter(stale=True).values_list('recipe__recipe_id', flat=True)), [3])
+
+        call_command('rebuild_search_index', '--stale', stdout=StringIO())
+        cache.clear()
+        clear_index_stats()
+        self.assertEqual(recipe_ids('roma'), [3])
+        self.assertFalse(SearchDocument.objects.filter(stale=True).exists())
+
+    def test_rebuild_replaces_entries_in_place(self):
+        SearchTerm.objects.create(term='ghost', df=3)
+        documents = SearchDocument.objects.count()
+        found = []
+
+        def index(recipe_pks):
+            # Every recipe stays searchable between batches
+            found.append(SearchDocument.objects.count())
+            index_recipes(recipe_pks)
+
+        with mock.patch('apps.recipes.management.commands.rebuild_search_index.index_recipes', index):
+            call_command('rebuild_search_index', '--batch-size', '2', stdout=StringIO())
+        self.assertEqual(found, [documents] * 4)
+        self.assertEqual(SearchDocument.objects.count(), documents)
+        self.assertFalse(SearchTerm.objects.filter(term='ghost').exists())
+        self.assertEqual([recipe.recipe_id for recipe in execute_search('tomato').recipes], [1, 2, 3, 4])
+
+
+class FuzzySearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i, name in enumerate(['Chicken Parmesan', 'Chicken Soup', 'Eggplant Parmesan', 'Beef Stew'], start=1):
+            make_recipe(i, name=name)
+        index_recipes(Recipe.objects.values_list('id', flat=True))
+
+    def setUp(self):
+        cache.clear()
+        clear_index_stats()
+
+    def test_typos_are_corrected_by_both_backends(self):
+        with tempfile.TemporaryDirectory() as index_dir:
+            build_memory_index(index_dir)
+            for backend in (DatabaseBackend(), MemoryBackend(index_dir)):
+                with self.subTest(backend=type(backend).__name__):
+                    names = lambda text: sorted(
+                        Recipe.objects.filter(id__in=backend.search(text).ids).values_list('name', flat=True)
+                    )
+                    self.assertEqual(names('chiken parmesan'), ['Chicken Parmesan'])
+                    # The last term is still being typed
+                    self.assertEqual(names('parmesna'), ['Chicken Parmesan', 'Eggplant Parmesan'])
+                    self.assertEqual(names('chicken parmesan xqzv'), [])
+
+                    # Exact matches outrank corrections
+                    hits = backend.search('soup chiken', mode='any')
+                    self.assertEqual(best(hits), Recipe.objects.get(name='Chicken Soup').id)
+                    self.assertLess(max(backend.search('chiken').scores), max(backend.search('chicken').scores))
+
+    def test_term_frequencies_follow_the_index(self):
+        dfs = lambda: dict(SearchTerm.objects.values_list('term', 'df'))
+        self.assertEqual(
+            dfs(), {'chicken': 2, 'parmesan': 2, 'soup': 1, 'eggplant': 1, 'beef': 1, 'stew': 1, 'dinner': 4}
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.filter(name='Beef Stew').update(name='Chicken Stew')
+            Recipe.objects.filter(name='Chicken Soup').update(name='Soup')
+            index_recipes(Recipe.objects.values_list('id', flat=True))
+        expected = {'chicken': 2, 'parmesan': 2, 'soup': 1, 'eggplant': 1, 'stew': 1, 'dinner': 4}
+        self.assertEqual(dfs(), expected)
+
+        Recipe.objects.filter(name='Soup').delete()
+        # The cascade leaves the term counted until the next recount
+        self.assertEqual(dfs(), expected)
+        call_command('rebuild_search_index', '--terms', stdout=StringIO())
+        del expected['soup']
+        expected['dinner'] = 3
+        self.assertEqual(dfs(), expected)
+
+        with self.assertNumQueries(1) as queries:
+            self.assertEqual(fuzzy_vocabulary().correct_all(['chiken']), {'chiken': ['chicken']})
+        self.assertNotIn('GROUP BY', queries.captured_queries[0]['sql'])
+
+
+class ReaderTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.frame = pd.DataFrame({'RecipeId': range(1, 6), 'Name': [f'Recipe {i}' for i in range(1, 6)]})
+
+    def batches(self, file_name, write):
+        path = os.path.join(self.directory, file_name)
+        write(path)
+        return list(iter_batches(path, 2))
+
+    def test_every_format_is_streamed_in_batches(self):
+        writers = {
+            'recipes.csv': lambda path: self.frame.to_csv(path, index=False),
+            'recipes.ndjson': lambda path: self.frame.to_json(path, orient='records', lines=True),
+            'recipes.parquet': lambda path: self.frame.to_parquet(path, index=False),
+            'recipes.xlsx': lambda path: self.frame.to_excel(path, index=False),
+        }
+        for file_name, write in writers.items():
+            with self.subTest(file_name=file_name):
+                batches = self.batches(file_name, write)
+                self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+                rows = pd.concat(batches, ignore_index=True)
+                self.assertEqual(rows['RecipeId'].tolist(), [1, 2, 3, 4, 5])
+                self.assertEqual(rows['Name'].tolist(), self.frame['Name'].tolist())
+
+    def test_unsupported_files_are_rejected(self):
+        with self.assertRaises(ValueError):
+            iter_batches(os.path.join(self.directory, 'recipes.txt'), 2)
+        with self.assertRaises(ValueError):
+            iter_batches(os.path.join(self.directory, 'recipes.csv'), 0)
+
+
+class SyncChildrenTests(TestCase):
+    def setUp(self):
+        self.salt, self.pepper = (Ingredient.objects.create(name=name) for name in ('salt', 'pepper'))
+        self.tag = Tag.objects.create(name='quick')
+        self.recipes = [make_recipe(i) for i in range(1, 4)]
+
+    def payload(self, recipe, step='Stir'):
+        return build_children(
+            [f'{step} {recipe.recipe_id}', 'Serve'],
+            [(self.salt.pk, '1 tsp salt', 1, 'tsp', ''), (self.pepper.pk, 'pepper', None, '', 'to taste')],
+            [self.tag.pk, self.tag.pk],
+            [f'https://example.com/{recipe.recipe_id}.jpg'],
+        )
+
+    def test_whole_batch_is_replaced_at_once(self):
+        payloads = {recipe.pk: self.payload(recipe) for recipe in self.recipes}
+        # Five deletes (carousel items included) and four inserts whatever the batch size
+        with self.assertNumQueries(9):
+            stats = sync_children(payloads)
+        self.assertEqual(stats, {'recipes': 3, 'steps': 6, 'ingredients': 6, 'tags': 3, 'images': 3, 'carousel_items': 0})
+        self.assertEqual(load_children([recipe.pk for recipe in self.recipes]), payloads)
+
+        # Replacing stored rows costs the same, rows are never loaded one by one
+        recipe = self.recipes[1]
+        CarouselItem.objects.create(recipe=recipe, image=recipe.images.get(), order=1)
+        with self.assertNumQueries(9):
+            stats = sync_children(payloads)
+        self.assertEqual(stats['carousel_items'], 1)
+        self.assertFalse(CarouselItem.objects.exists())
+        self.assertEqual(load_children([recipe.pk for recipe in self.recipes]), payloads)
+
+        payloads[self.recipes[0].pk] = self.payload(self.recipes[0], step='Whisk')
+        stats = sync_children(payloads, diff=True)
+        self.assertEqual(stats['recipes'], 1)
+        self.assertEqual(
+            list(self.recipes[0].steps.order_by('order').values_list('description', flat=True)), ['Whisk 1', 'Serve']
+        )
+        self.assertEqual(RecipeStep.objects.count(), 6)
+
+
+class VocabularyTests(TestCase):
+    def test_names_are_created_once_and_conflicts_are_tolerated(self):
+        vocabulary = Vocabulary(Ingredient).warm()
+        self.assertEqual(vocabulary.resolve({'salt', 'pepper', '', 'x' * 500}), {'', 'x' * 500})
+        self.assertEqual(vocabulary.get('salt'), Ingredient.objects.get(name='salt').pk)
+        with self.assertNumQueries(0):
+            vocabulary.resolve({'salt', 'pepper'})
+
+        # Without ignore_conflicts, rows another process created meanwhile are picked up
+        Ingredient.objects.create(name='thyme')
+        with mock.patch.object(connection.features, 'supports_ignore_conflicts', False):
+            self.assertEqual(vocabulary.resolve({'thyme', 'sage'}), set())
+            # Inserts the collation rejects are resolved one by one
+            with mock.patch.object(type(Ingredient.objects), 'bulk_create', side_effect=IntegrityError):
+                self.assertEqual(vocabulary.resolve({'basil', 'sage'}), set())
+        self.assertEqual(
+            {name: vocabulary.get(name) for name in ('thyme', 'sage', 'basil')},
+            dict(Ingredient.objects.filter(name__in=['thyme', 'sage', 'basil']).values_list('name', 'id')),
+        )
+
+
+def dump_row(recipe_id, **columns):
+    """One row of a recipe dump, as the import reads it."""
+    row = {
+        'RecipeId': recipe_id, 'Name': f'Soup {recipe_id}', 'CookTime': 'PT30M', 'PrepTime': 'PT10M',
+        'TotalTime': 'PT40M', 'DatePublished': '2005-09-16 21:19:00', 'description': 'Warming',
+        'RecipeCategory': 'Dinner', 'AggregatedRating': 4.5, 'ReviewCount': 3, 'Calories': 170.9,
+        'FatContent': 2.5, 'SaturatedFatContent': 1.3, 'CholesterolContent': 8, 'SodiumContent': 29.8,
+        'CarbohydrateContent': 37.1, 'FiberContent': 3.6, 'SugarContent': 30.2, 'ProteinContent': 3.2,
+        'serving_size': '1 (230 g)', 'servings': 4,
+        'steps': 'c("Chop the onions.", "Simmer, then serve.")',
+        'ingredients': 'c("onion", "salt")',
+        'ingredients_raw_str': 'c("2 large onions", "1 tsp salt")',
+        'tags': 'c("Easy", "Soup")',
+        'Images': f'c("https://img.example.com/w_555,h_416/{recipe_id}.jpg")',
+    }
+    row.update(columns)
+    return row
+
+
+class ImportRecipesTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'recipes.csv')
+        # The shared vocabularies outlive the test transaction
+        vocabularies = mock.patch.dict('apps.recipes.importing.vocabulary._vocabularies', clear=True)
+        vocabularies.start()
+        self.addCleanup(vocabularies.stop)
+
+    def write(self, rows):
+        pd.DataFrame(rows).to_csv(self.path, index=False)
+
+    def run_import(self, *args):
+        output = StringIO()
+        call_command('import_recipes', self.path, '--batch-size', '2', *args, stdout=output)
+        return output.getvalue()
+
+    def stored(self):
+        return {
+            recipe.recipe_id: (
+                recipe.name,
+                tuple(recipe.steps.order_by('order').values_list('description', flat=True)),
+                tuple(recipe.recipe_ingredients.order_by('id').values_list('ingredient__name', 'unit')),
+                tuple(recipe.recipe_tags.order_by('id').values_list('tag__name', flat=True)),
+                tuple(recipe.images.order_by('order').values_list('url', flat=True)),
+            )
+            for recipe in Recipe.objects.all()
+        }
+
+    def test_worker_processes_store_the_same_recipes(self):
+        self.write([dump_row(i) for i in range(1, 6)])
+        self.run_import()
+        expected = self.stored()
+        self.assertEqual(len(expected), 5)
+        self.assertEqual(
+            expected[1],
+            (
+                'Soup 1', ('Chop the onions.', 'Simmer, then serve.'), (('onion', None), ('salt', 'tsp')),
+                ('easy', 'soup'), ('https://img.example.com/w_555,h_416/1.jpg',),
+            ),
+        )
+
+        Recipe.objects.all().delete()
+        self.run_import('--workers', '2')
+        self.assertEqual(self.stored(), expected)
+
+    def test_resume_skips_only_committed_batches(self):
+        self.write([dump_row(i) for i in range(1, 6)])
+        with mock.patch(
+            'apps.recipes.management.commands.import_recipes.index_documents', side_effect=[None, ValueError, None],
+        ):
+            output = self.run_import()
+        self.assertIn('--resume will retry it', output)
+        # The failed batch kept its recipes, but not their children
+        self.assertEqual(Recipe.objects.count(), 5)
+        self.assertFalse(Recipe.objects.get(recipe_id=3).steps.exists())
+
+        Recipe.objects.filter(recipe_id=1).delete()
+        output = self.run_import('--resume')
+        self.assertIn('2 committed batches will be skipped', output)
+        self.assertFalse(Recipe.objects.filter(recipe_id=1).exists())
+        self.assertEqual(Recipe.objects.get(recipe_id=3).steps.count(), 2)
+
+        with self.assertRaisesMessage(CommandError, 'resume with the same --batch-size'):
+            call_command('import_recipes', self.path, '--batch-size', '3', '--resume', stdout=StringIO())
+
+    def test_a_batch_that_fails_to_parse_is_skipped(self):
+        self.write([dump_row(i) for i in range(1, 6)])
+        calls = []
+
+        def parse(batch_df, **kwargs):
+            calls.append(batch_df)
+            if len(calls) == 2:
+                raise KeyError('Name')
+            return parse_batch(batch_df, **kwargs)
+
+        with mock.patch('apps.recipes.management.commands.import_recipes.parse_batch', parse):
+            output = self.run_import()
+        self.assertIn("Error parsing rows 2 to 4: 'Name'", output)
+        self.assertIn('Recipe import completed', output)
+        self.assertEqual(set(Recipe.objects.values_list('recipe_id', flat=True)), {1, 2, 5})
+
+        # The skipped batch was not journaled, so --resume parses it again
+        output = self.run_import('--resume')
+        self.assertIn('2 committed batches will be skipped', output)
+        self.assertEqual(Recipe.objects.count(), 5)
+
+    def test_reimport_cost_does_not_grow_with_the_stored_rows(self):
+        many = {
+            'ingredients': 'c("onion", "salt", "leek", "thyme")',
+            'ingredients_raw_str': 'c("2 onions", "1 tsp salt", "1 leek", "2 sprigs thyme")',
+            'Images': 'c("https://img.example.com/a.jpg", "https://img.example.com/b.jpg")',
+        }
+        queries = lambda output: [int(count) for count in re.findall(r'(\d+) queries,', output)]
+        self.write([dump_row(i, **many) for i in range(1, 5)])
+        first = queries(self.run_import())
+
+        # Every recipe changed: the stored children are replaced with one
+        # statement per table, so a re-import costs no more than the first one
+        changes = CoverageChange.objects.count()
+        for rows in ([dump_row(i, Name=f'Stew {i}') for i in range(1, 5)],
+                     [dump_row(i, Name=f'Leek stew {i}', **many) for i in range(1, 5)]):
+            self.write(rows)
+            with self.captureOnCommitCallbacks(execute=True):
+                output = self.run_import()
+            self.assertLessEqual(queries(output)[-1], first[-1])
+        # One coverage change per recipe and import
+        self.assertEqual(CoverageChange.objects.count(), changes + 2 * 4)
+
+    @override_settings(CACHES=LOCAL_CACHES)
+    def test_replacing_a_featured_image_rebuilds_the_carousel(self):
+        self.write([dump_row(1), dump_row(2)])
+        self.run_import()
+        recipe = Recipe.objects.get(recipe_id=1)
+        CarouselItem.objects.create(recipe=recipe, image=recipe.images.get(), order=0)
+        cache.clear()
+        self.assertEqual([card.recipe_id for card in carousel_cards()], [1])
+
+        # Only the version stamp says the carousel changed: the catalog did not
+        with mock.patch('apps.recipes.search.index.bump_catalog_generation_on_commit'):
+            self.write([dump_row(1, Images='c("https://img.example.com/new.jpg")'), dump_row(2)])
+            self.run_import()
+        self.assertEqual(carousel_cards(), [])
+
+    def test_unchanged_recipes_are_skipped_by_content_hash(self):
+        self.write([dump_row(i) for i in range(1, 4)])
+        self.assertIn('3 new, 0 changed, 0 unchanged', self.run_import())
+        self.assertIn('0 new, 0 changed, 3 unchanged', self.run_import())
+
+        self.write([dump_row(1), dump_row(2, Name='Onion soup'), dump_row(3), dump_row(4)])
+        self.assertIn('1 new, 1 changed, 2 unchanged', self.run_import())
+        self.assertEqual(Recipe.objects.get(recipe_id=2).name, 'Onion soup')
+
+    def test_dry_run_reports_without_writing(self):
+        self.write([dump_row(1), dump_row(2)])
+        self.run_import()
+        snapshot = self.stored()
+        os.remove(self.path + '.journal.sqlite3')
+
+        self.write([dump_row(1, Name='Onion soup'), dump_row(3)])
+        output = self.run_import('--dry-run')
+        self.assertIn('Dry run completed, nothing was written', output)
+        self.assertIn('1 new, 1 changed, 0 unchanged, 1 deleted', output)
+        self.assertEqual(self.stored(), snapshot)
+        self.assertFalse(os.path.exists(self.path + '.journal.sqlite3'))
+
+        # A skipped row keeps its stored recipe, it is not counted as deleted
+        self.write([dump_row(1), dump_row(2, CookTime=None, PrepTime=None)])
+        self.assertIn('0 new, 0 changed, 1 unchanged, 0 deleted, 1 failures', self.run_import('--dry-run'))
+        self.assertIn('0 new, 0 changed, 1 unchanged, 0 deleted, 1 failures', self.run_import())
+
+
+class ConverterTests(SimpleTestCase):
+    def test_durations_decimals_and_ints(self):
+        durations = convert_durations(pd.Series(['PT1H30M', 'PT45S', '00:20:00', 'soon', None], dtype=object))
+        self.assertEqual(
+            list(durations), [timedelta(minutes=90), timedelta(seconds=45), timedelta(minutes=20), None, None]
+        )
+        decimals = convert_decimals(pd.Series(['1.45', '12 kcal', 'n/a', 10 ** 9, float('inf')], dtype=object))
+        self.assertEqual(list(decimals), [Decimal('1.5'), Decimal('12.0'), Decimal('0.0'), Decimal('999999.9'), Decimal('0.0')])
+        self.assertEqual(list(convert_ints(pd.Series(['4', 2.6, None, 'many'], dtype=object), 1)), [4, 3, 1, 1])
+
+    def test_datetimes_in_mixed_formats_are_all_parsed(self):
+        values = pd.Series(['2020-01-02', '2020-01-01 10:00:00', '02/03/2020', 'never', None], dtype=object)
+        self.assertEqual(
+            list(convert_datetimes(values)),
+            [
+                datetime(2020, 1, 2, tzinfo=dt_timezone.utc), datetime(2020, 1, 1, 10, tzinfo=dt_timezone.utc),
+                datetime(2020, 2, 3, tzinfo=dt_timezone.utc), None, None,
+            ],
+        )
+        # Naive values are local to the import time zone; offsets are honoured
+        values = pd.Series(['2020-01-01 10:00:00', '2020-01-01T10:00:00+02:00'], dtype=object)
+        self.assertEqual(
+            list(convert_datetimes(values, 'Europe/Paris')),
+            [datetime(2020, 1, 1, 9, tzinfo=dt_timezone.utc), datetime(2020, 1, 1, 8, tzinfo=dt_timezone.utc)],
+        )
+
+
+class LiteralParserTests(SimpleTestCase):
+    def test_list_literals(self):
+        cases = {
+            '["a", "b, c", 1, 2.5, null, true]': ['a', 'b, c', 1, 2.5, None, True],
+            'c("Mix \\"well\\", then bake.", NA)': ['Mix "well", then bake.', None],
+            "['it\\'s', 'caf\\u00e9']": ["it's", 'café'],
+            '"lone"': ['lone'],
+        }
+        for text, expected in cases.items():
+            with self.subTest(text=text):
+                self.assertEqual(parse_literal_list(text), expected)
+
+    def test_empty_and_unwrapped_values(self):
+        for text in ('', 'NA', 'character(0)', 'c()', 'c( )', '[]', '[ ]', ' None '):
+            with self.subTest(text=text):
+                self.assertEqual(parse_literal_list(text), [])
+        # A single unwrapped value is kept whole
+        url = 'https://img.sndimg.com/food/image/upload/w_555,h_416,c_fit/x.jpg'
+        self.assertEqual(parse_literal_list(url), [url])
+        self.assertEqual(parse_literal_list('Mix well, then bake.'), ['Mix well, then bake.'])
+        self.assertEqual(parse_images(url), [url])
+
+    def test_malformed_cells(self):
+        for text in ('["a"', 'c("a" "b")', '["a", "b]'):
+            with self.subTest(text=text):
+                with self.assertRaises(LiteralSyntaxError):
+                    parse_literal_list(text)
+                self.assertEqual(parse_list(text), [])
+        self.assertEqual(parse_list(('a', 'b')), ['a', 'b'])
+        self.assertEqual(parse_list(float('nan')), [])
+
+
+class IngredientParserTests(SimpleTestCase):
+    def test_amounts_and_units(self):
+        cases = {
+            '1 1/2 cups all-purpose flour': (1.5, 1.5, 'cup', 'all-purpose flour'),
+            '2-3 Tbsp. olive oil': (2.0, 3.0, 'tbsp', 'olive oil'),
+            '2 to 3 fl. oz. cream': (2.0, 3.0, 'fl oz', 'cream'),
+            '½ tsp salt': (0.5, 0.5, 'tsp', 'salt'),
+            '1½ cups milk': (1.5, 1.5, 'cup', 'milk'),
+            '1 1⁄2 cups water': (1.5, 1.5, 'cup', 'water'),
+            '1 c. of sugar': (1.0, 1.0, 'cup', 'sugar'),
+            '2 (8 ounce) packages cream cheese': (2.0, 2.0, 'package', '(8 ounce) cream cheese'),
+            '3 eggs': (3.0, 3.0, None, 'eggs'),
+            'salt to taste': (None, None, None, 'salt to taste'),
+        }
+        for line, expected in cases.items():
+            with self.subTest(line=line):
+                self.assertEqual(tuple(parse_ingredient_line(line)), expected)
+
+
+class QueryParsingTests(SimpleTestCase):
+    def test_stem_matches_singular_and_plural(self):
+        pairs = [
+            ('pies', 'pie'), ('fries', 'fry'), ('berries', 'berry'), ('cookies', 'cookie'),
+            ('tomatoes', 'tomato'), ('peaches', 'peach'), ('eggs', 'egg'), ('skies', 'sky'),
+        ]
+        for plural, singular in pairs:
+            with self.subTest(plural=plural):
+                self.assertEqual(stem(plural), stem(singular))
+        self.assertEqual(stem('pies'), 'pie')
+        for word in ('gas', 'bus', 'hummus', 'glass', '2000'):
+            with self.subTest(word=word):
+                self.assertEqual(stem(word), word)
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize('Crème Brûlée with BERRIES & 12 Pies'), ['creme', 'brulee', 'berri', '12', 'pie'])
+        self.assertEqual(tokenize(None), [])
+
+    def test_parse_query(self):
+        self.assertEqual(parse_query('apple pies '), (['apple', 'pie'], None))
+        self.assertEqual(parse_query('apple chick'), (['apple'], 'chick'))
+        # Too short to expand, or already covered by another term
+        self.assertEqual(parse_query('apple pi'), (['apple', 'pi'], None))
+        self.assertEqual(parse_query('chicken chick'), (['chicken', 'chick'], None))
+        self.assertEqual(parse_query('the of '), ([], None))
+
+
+class MemoryIndexFormatTests(SimpleTestCase):
+    def test_varint_round_trip(self):
+        values = [0, 1, 127, 128, 300, 16383, 16384, 2 ** 32 - 1, 2 ** 35 + 5, 2 ** 63]
+        encoded = encode_varints(values)
+        self.assertEqual(list(encoded[:4]), [0x00, 0x01, 0x7F, 0x80])
+        self.assertEqual(list(encode_varints([300])), [0xAC, 0x02])
+        self.assertEqual(decode_varints(encoded).tolist(), values)
+        self.assertEqual(len(encode_varints([])), 0)
+        self.assertEqual(len(decode_varints(np.empty(0, dtype=np.uint8))), 0)
+
+    def test_index_file_round_trip(self):
+        postings = [('soup', [0, 2, 300], [3.0, 1.25, 2.5]), ('bean', [1], [0.5]), ('empty', [], [])]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'recipes-7.idx')
+            write_index(path, 7, [10, 20, 30] + list(range(40, 338)), [1.0] * 301, [1.0] * 301, [0] * 301, ['Soup'], postings)
+            index = MemoryIndex(path)
+            self.assertEqual((index.generation, index.doc_count, index.terms), (7, 301, ['bean', 'empty', 'soup']))
+            docs, weights = index.postings(index.lookup('soup'))
+            self.assertEqual(docs.tolist(), [0, 2, 300])
+            self.assertEqual(weights.tolist(), [3.0, 1.25, 2.5])
+            self.assertEqual(index.postings(index.lookup('empty'))[0].tolist(), [])
+            self.assertEqual(index.dfs.tolist(), [1, 0, 3])
+            self.assertIsNone(index.lookup('stew'))
@@ -1,55 +1,82 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.http import JsonResponse
 from django.contrib.admin.views.decorators import staff_member_required
-from .models import Recipe, RecipeImage, CarouselItem, UserRecipeCollection, Tag, Ingredient
+from .models import (
+    Recipe, RecipeImage, UserRecipeCollection, Tag, RecipeIngredient, RecipeTag,
+)
 import logging
 from django.urls import reverse
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.db.utils import IntegrityError
 from django.db import models
-from django.db.models import Q, Count
+from django.db.models import Exists, F, OuterRef, Prefetch, Q, Value
+from apps.pantry.contents import pantry_ingredient_ids
+from .cards import card_decorations
+from .carousel import carousel_cards
+from .pagination import DEFAULT_PAGE_SIZE, InvalidCursor, paginate, page_size_from
+from .search.execution import execute_search, missing_count
+from .search.query import MATCH_ALL, MATCH_ANY
+from .search.suggest import suggest_ingredients
 
 def home(request):
     """Home page view."""
-    carousel_items = CarouselItem.objects.select_related('recipe').all()
-    user_recipe_collection = None
+    # Shared by every visitor and cached until the carousel or its recipes change
+    carousel_items = carousel_cards()
+    collected_ids = set()
     
     if request.user.is_authenticated:
-        user_recipe_collection = Recipe.objects.filter(
-            collected_by__user=request.user
-        )
+        decorations = card_decorations([card.id for card in carousel_items], request.user)
+        collected_ids = {pk for pk, decoration in decorations.items() if decoration.in_collection}
     
     context = {
         'carousel_items': carousel_items,
-        'user_recipe_collection': user_recipe_collection,
+        'collected_ids': collected_ids,
     }
     return render(request, 'recipes/home.html', context)
 
+def load_recipe(recipe_id, user=None):
+    """
+    Fetch a recipe with everything its detail page shows (five queries).
+
+    Ingredient lines come with their ingredient, tags with their tag,
+    ``visible_images`` holds the images not known to be broken and
+    ``in_collection`` tells whether ``user`` saved the recipe.
+
+    Raises:
+        Http404: No recipe has this ``recipe_id``.
+    """
+    if user is not None:
+        in_collection = Exists(UserRecipeCollection.objects.filter(user=user, recipe=OuterRef('pk')))
+    else:
+        in_collection = Value(False)
+    recipes = Recipe.objects.annotate(in_collection=in_collection).prefetch_related(
+        Prefetch(
+            'recipe_ingredients',
+            queryset=RecipeIngredient.objects.select_related('ingredient').order_by('id'),
+        ),
+        'steps',
+        Prefetch('recipe_tags', queryset=RecipeTag.objects.select_related('tag').order_by('id')),
+        Prefetch(
+            'images',
+            queryset=RecipeImage.objects.exclude(status=RecipeImage.STATUS_INACCESSIBLE).order_by('order'),
+            to_attr='visible_images',
+        ),
+    )
+    return get_object_or_404(recipes, recipe_id=recipe_id)
+
 def recipe_detail(request, recipe_id):
     """Recipe detail view."""
-    recipe = get_object_or_404(Recipe, recipe_id=recipe_id)
-    images = recipe.images.all().order_by('order')
+    user = request.user if request.user.is_authenticated else None
+    recipe = load_recipe(recipe_id, user)
     
-    # Get user's pantry items if authenticated
-    user_pantry = []
-    if request.user.is_authenticated:
-        from apps.pantry.models import UserPantry
-        pantry_items = UserPantry.objects.filter(user=request.user).select_related('ingredient')
-        user_pantry = [item.ingredient for item in pantry_items]
-        
-        # Get related ingredients for each pantry item
-        related_ingredients = []
-        for item in pantry_items:
-            related_ingredients.extend(item.related_ingredients.all())
-        
-        # Add related ingredients to user_pantry
-        user_pantry.extend(related_ingredients)
+    # Ingredient ids the user has, related ingredients included
+    pantry_ids = pantry_ingredient_ids(user) if user is not None else frozenset()
     
     return render(request, 'recipes/recipe_detail.html', {
         'recipe': recipe,
-        'images': images,
-        'user_pantry': user_pantry,
+        'images': recipe.visible_images,
+        'pantry_ids': pantry_ids,
     })
 
 @staff_member_required
@@ -81,76 +108,108 @@ def recipe_images(request, recipe_id):
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
+# Sort keys of the collection page
+COLLECTION_SORT_FIELDS = {
+    'time': 'total_time',
+    'rating': 'aggregated_rating',
+    'missing': 'missing_count',
+}
+
 @login_required
 def personal_recipes(request):
     """View for user's personal recipe collection."""
     if not request.user.is_authenticated:
         return redirect('account_login')
     
-    # Get user's pantry items
-    from apps.pantry.models import UserPantry
-    pantry_items = UserPantry.objects.filter(user=request.user).select_related('ingredient')
-    user_pantry = [item.ingredient for item in pantry_items]
-    
-    # Get related ingredients for each pantry item
-    related_ingredients = []
-    for item in pantry_items:
-        related_ingredients.extend(item.related_ingredients.all())
+    sort_by = request.GET.get('sort', '')
+    direction = request.GET.get('direction', 'asc')
+    filter_by = request.GET.get('filter', '')
+    selected_categories = sorted(set(request.GET.getlist('category')))
+    cursor = request.GET.get('cursor') or None
+    page_size = page_size_from(request.GET.get('page_size'))
     
-    # Add related ingredients to user_pantry
-    user_pantry.extend(related_ingredients)
+    # Ingredient ids the user has, related ingredients included
+    pantry_ids = pantry_ingredient_ids(request.user)
     
-    # Get all recipes in user's collection
-    user_recipes = UserRecipeCollection.objects.filter(user=request.user).select_related('recipe')
+    options = {'sort': sort_by, 'direction': direction, 'filter_by': filter_by, 'categories': selected_categories}
+    try:
+        page = collection_page(request.user, pantry_ids, cursor=cursor, page_size=page_size, **options)
+    except InvalidCursor:
+        # Stale cursor, e.g. after the sort changed: start over
+        page = collection_page(request.user, pantry_ids, page_size=page_size, **options)
+    
+    # Categories of the whole collection, not only of this page
+    categories = {
+        category or 'Uncategorized'
+        for category in UserRecipeCollection.objects.filter(user=request.user)
+        .order_by().values_list('category', flat=True).distinct()
+    }
     
-    # Get unique categories
-    categories = set()
     recipes = []
-    
-    for collection in user_recipes:
-        recipe = collection.recipe
-        category = collection.category or 'Uncategorized'
-        categories.add(category)
-        
-        # Calculate missing ingredients
-        missing_ingredients = []
-        for recipe_ingredient in recipe.recipe_ingredients.all():
-            if recipe_ingredient.ingredient and recipe_ingredient.ingredient not in user_pantry:
-                missing_ingredients.append(recipe_ingredient.ingredient)
-        
+    for recipe in page.items:
         recipes.append({
             'recipe': recipe,
-            'category': category,
-            'missing_ingredients': missing_ingredients,
-            'missing_ingredients_count': len(missing_ingredients),
+            'category': recipe.collection_category or 'Uncategorized',
+            'missing_ingredients_count': recipe.missing_count,
             'total_time': recipe.total_time or (recipe.prep_time + recipe.cook_time if recipe.prep_time and recipe.cook_time else None),
             'rating': recipe.aggregated_rating
         })
     
-    # Get sort and direction parameters
-    sort_by = request.GET.get('sort', '')
-    direction = request.GET.get('direction', 'asc')
-    
-    if sort_by == 'time':
-        recipes.sort(key=lambda x: x['total_time'] or float('inf'), reverse=(direction == 'desc'))
-    elif sort_by == 'rating':
-        recipes.sort(key=lambda x: x['rating'] or 0, reverse=(direction == 'desc'))
-    elif sort_by == 'missing':
-        recipes.sort(key=lambda x: x['missing_ingredients_count'], reverse=(direction == 'desc'))
-    
-    # Get filter parameter
-    filter_by = request.GET.get('filter', '')
-    if filter_by == 'available':
-        recipes = [r for r in recipes if r['missing_ingredients_count'] == 0]
-    
     return render(request, 'recipes/personal_recipes.html', {
         'recipes': recipes,
-        'categories': sorted(list(categories)),
+        'categories': sorted(categories),
         'current_sort': sort_by,
         'current_filter': filter_by,
-        'current_direction': direction
+        'current_direction': direction,
+        'current_categories': selected_categories,
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+        'page_size': page_size,
     })
 
+def collection_page(user, pantry_ids, sort='', direction='asc', filter_by='', categories=(), cursor=None,
+                    page_size=DEFAULT_PAGE_SIZE):
+    """
+    Fetch one page of ``user``'s collection (one query).
+
+    Missing ingredients are counted, filtered and sorted on by the database.
+    Recipes come with their images, ``missing_count`` and the
+    ``collection_category`` the user filed them under; the default order is
+    most recently added first.
+
+    Args:
+        pantry_ids: ``user``'s expanded pantry, see ``pantry_ingredient_ids``.
+        sort (str): One of ``COLLECTION_SORT_FIELDS`` or empty.
+        filter_by (str): 'available' to keep the recipes missing nothing.
+        categories: Collection categories to keep, all when empty;
+            'Uncategorized' stands for recipes filed under none.
+
+    Returns:
+        Page
+
+    Raises:
+        InvalidCursor: ``cursor`` was not issued for this order.
+    """
+    collection = Q(collected_by__user=user)
+    if categories:
+        in_categories = Q(collected_by__category__in=[category for category in categories if category != 'Uncategorized'])
+        if 'Uncategorized' in categories:
+            in_categories |= Q(collected_by__category__isnull=True) | Q(collected_by__category='')
+        collection &= in_categories
+    # One filter() call so the conditions and annotations share one join
+    recipes = Recipe.objects.filter(collection).annotate(
+        added_at=F('collected_by__added_at'),
+        collection_category=F('collected_by__category'),
+        missing_count=missing_count(user, pantry_ids),
+    )
+    if filter_by == 'available':
+        recipes = recipes.filter(missing_count=0)
+    if sort in COLLECTION_SORT_FIELDS:
+        ordering, key, descending = f'{sort}:{direction}', COLLECTION_SORT_FIELDS[sort], direction == 'desc'
+    else:
+        ordering, key, descending = 'added', 'added_at', True
+    return paginate(recipes.prefetch_related('images'), f'collection:{ordering}', key, descending, cursor, page_size)
+
 @login_required
 def add_to_collection(request, recipe_id):
     """Add a recipe to user's collection."""
@@ -208,101 +267,59 @@ def toggle_recipe_collection(request, recipe_id):
         'is_in_collection': is_in_collection
     })
 
+# Pantry filters of the search page: most ingredients a recipe may be missing
+PANTRY_FILTERS = {'available': 0, 'missing-1': 1, 'missing-2': 2, 'missing-3': 3}
+
 def search_recipes(request):
     query = request.GET.get('q', '')
     category = request.GET.get('category', '')
-    page = int(request.GET.get('page', 1))
-    page_size = int(request.GET.get('page_size', 35))
+    cursor = request.GET.get('cursor') or None
+    page_size = page_size_from(request.GET.get('page_size'))
     sort = request.GET.get('sort', '')
     direction = request.GET.get('direction', 'desc')
     filter_type = request.GET.get('filter', '')
+    match = MATCH_ANY if request.GET.get('match') == MATCH_ANY else MATCH_ALL
     
-    # Base queryset
-    recipes = Recipe.objects.all()
+    # Matching ingredients for the sidebar, from the in-memory autocomplete index
+    matching_ingredients = suggest_ingredients(query)
     
-    # Get user's recipe collection if authenticated
-    user_recipe_collection = None
-    if request.user.is_authenticated:
-        user_recipe_collection = Recipe.objects.filter(
-            collected_by__user=request.user
-        )
-    
-    # Apply search query
-    if query:
-        # Search in recipe name, description, and category
-        recipes = recipes.filter(
-            Q(name__icontains=query) |
-            Q(description__icontains=query) |
-            Q(recipe_category__icontains=query) |
-            # Search in ingredients
-            Q(recipe_ingredients__ingredient__name__icontains=query) |
-            # Search in tags
-            Q(recipe_tags__tag__name__icontains=query)
-        ).distinct()
+    user = request.user if request.user.is_authenticated else None
+    search = {
+        'query': query, 'category': category, 'sort': sort, 'direction': direction, 'match': match,
+        'user': user, 'max_missing': PANTRY_FILTERS.get(filter_type), 'page_size': page_size,
+    }
+    try:
+        results = execute_search(cursor=cursor, **search)
+    except InvalidCursor:
+        # Stale or foreign cursor, e.g. after the sort changed: start over
+        results = execute_search(**search)
+    total_recipes = results.total
     
-    # Apply category filter
+    # Categories that have matching recipes, sorted alphabetically
     if category:
-        recipes = recipes.filter(recipe_category=category)
-    
-    # Apply additional filters
-    if filter_type == 'available' and request.user.is_authenticated:
-        # Filter recipes where all ingredients are in user's pantry
-        recipes = recipes.filter(
-            ~Q(recipe_ingredients__ingredient__userpantry__user=request.user)
-        ).distinct()
-    
-    # Get matching ingredients for the sidebar
-    matching_ingredients = Ingredient.objects.filter(
-        name__icontains=query
-    ).distinct()[:10]  # Limit to 10 matching ingredients
-    
-    # Get unique categories that have matching recipes and sort them alphabetically
-    categories = Recipe.objects.filter(
-        id__in=recipes.values('id')
-    ).values_list('recipe_category', flat=True).distinct().order_by('recipe_category')
-    
-    # Calculate total recipes and pages
-    total_recipes = recipes.count()
-    total_pages = (total_recipes + page_size - 1) // page_size
-    
-    # Apply sorting
-    if sort == 'time':
-        recipes = recipes.order_by(f"{'-' if direction == 'desc' else ''}total_time")
-    elif sort == 'rating':
-        recipes = recipes.order_by(f"{'-' if direction == 'desc' else ''}aggregated_rating")
-    elif sort == 'date':
-        recipes = recipes.order_by(f"{'-' if direction == 'desc' else ''}created_at")
-    elif sort == 'missing' and request.user.is_authenticated:
-        # Sort by number of missing ingredients
-        recipes = recipes.annotate(
-            missing_count=Count(
-                'recipe_ingredients',
-                filter=~Q(recipe_ingredients__ingredient__userpantry__user=request.user)
-            )
-        ).order_by(f"{'-' if direction == 'desc' else ''}missing_count")
+        categories = [category] if category in results.category_counts else []
+    else:
+        categories = sorted(results.category_counts)
     
-    # Apply pagination
-    start = (page - 1) * page_size
-    end = start + page_size
-    recipes = recipes[start:end]
+    # Image, heart and missing ingredients of every card, loaded at once
+    decorations = card_decorations([recipe.pk for recipe in results.recipes], user)
     
     # Prepare recipe data with additional information
     recipe_data = []
-    for recipe in recipes:
+    for recipe in results.recipes:
+        decoration = decorations[recipe.pk]
         data = {
             'recipe': recipe,
+            'image_url': decoration.image_url,
+            'in_collection': decoration.in_collection,
             'total_time': recipe.total_time,
             'rating': recipe.aggregated_rating,
         }
         
-        if request.user.is_authenticated:
-            # Calculate missing ingredients count
-            missing_count = recipe.recipe_ingredients.filter(
-                ~Q(ingredient__userpantry__user=request.user)
-            ).count()
-            data['missing_count'] = missing_count
+        if user is not None:
+            data['missing_count'] = decoration.missing_count
             # Add availability indicator
-            data['has_all_ingredients'] = missing_count == 0
+            data['has_all_ingredients'] = decoration.missing_count == 0
         
         recipe_data.append(data)
     
@@ -310,16 +327,16 @@ def search_recipes(request):
         'query': query,
         'recipes': recipe_data,
         'total_recipes': total_recipes,
-        'total_pages': total_pages,
-        'page': page,
+        'next_cursor': results.next_cursor,
+        'previous_cursor': results.previous_cursor,
         'page_size': page_size,
         'categories': categories,
         'current_category': category,
         'current_sort': sort,
         'current_direction': direction,
         'current_filter': filter_type,
+        'current_match': match,
         'matching_ingredients': matching_ingredients,
-        'user_recipe_collection': user_recipe_collection,  # Add user's recipe collection to context
     }
     
     return render(request, 'recipes/search_results.html', context)
@@ -6,6 +6,8 @@ from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
 from .models import ShoppingList
 from apps.recipes.models import Ingredient
+from apps.recipes.search.suggest import suggest_ingredients
+from apps.pantry.contents import bump_pantry_version_on_commit
 from apps.pantry.models import UserPantry
 
 @login_required
@@ -44,9 +46,9 @@ def search_ingredients(request):
     if len(query) < 2:
         return JsonResponse({'ingredients': []})
     
-    ingredients = Ingredient.objects.filter(name__icontains=query)[:10]
+    ingredients = suggest_ingredients(query)
     return JsonResponse({
-        'ingredients': [{'id': i.id, 'name': i.name} for i in ingredients]
+        'ingredients': [{'id': ingredient_id, 'name': name} for ingredient_id, name in ingredients]
     })
 
 @login_required
@@ -56,11 +58,15 @@ def complete_shopping_trip(request):
     checked_items = ShoppingList.objects.filter(user=request.user, is_checked=True)
     
     # Add checked items to pantry
+    added = False
     for item in checked_items:
-        UserPantry.objects.get_or_create(
+        _, created = UserPantry.objects.get_or_create(
             user=request.user,
             ingredient=item.ingredient
         )
+        added = added or created
+    if added:
+        bump_pantry_version_on_commit(request.user.pk)
     
     # Remove checked items from shopping list
     checked_items.delete()
@@ -153,6 +153,37 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cache shared by every worker process. Version stamps kept in the cache
+# (catalog generation, pantry and carousel versions) invalidate entries held
+# by all processes, so a per-process backend such as LocMemCache would let
+# workers serve stale data. Set REDIS_URL in production; without it the
+# database cache is used, whose table is created by `manage.py createcachetable`.
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'savory_cache',
+        },
+    }
+
+# Recipe search backend (see apps/recipes/search/backends.py)
+RECIPE_SEARCH = {
+    'BACKEND': os.getenv('RECIPE_SEARCH_BACKEND', 'apps.recipes.search.backends.DatabaseBackend'),
+    'OPTIONS': {
+        'index_dir': os.getenv('RECIPE_SEARCH_INDEX_DIR', BASE_DIR / 'search_index'),
+    },
+}
+
+# Pantry coverage index files, written by build_coverage_index
+RECIPE_COVERAGE_INDEX_DIR = os.getenv('RECIPE_COVERAGE_INDEX_DIR', BASE_DIR / 'coverage_index')
+
 # Crispy forms
 CRISPY_TEMPLATE_PACK = "bootstrap4"
 